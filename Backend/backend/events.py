@@ -0,0 +1,204 @@
+"""
+Server-sent events: an in-process hub that fans events out to the open
+/api/events/ streams, fed through a pluggable backend (EVENT_BACKEND).
+
+publish(channel, payload) hands a JSON-serializable payload to the backend:
+- LocalBackend delivers it straight to this process's hub (one worker),
+- RedisBackend publishes it to Redis; a listener thread in every worker
+  delivers what it receives to that worker's hub, so all workers see all events.
+Another backend only needs publish() and start().
+
+Each open stream is an asyncio.Queue read by an async generator, so an idle
+connection costs a coroutine and a queue rather than a thread (serve with an
+ASGI server, see asgi.py). Events published from sync code (signal handlers,
+the audit writer thread) reach the event loops with call_soon_threadsafe,
+once per loop rather than once per stream.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Queued in place of an event when a stream's queue overflows: the stream ends and the client reconnects
+OVERFLOW = object()
+
+
+class Subscription:
+    """One open stream: the channels it listens to and its bounded queue."""
+
+    def __init__(self, loop, channels, max_queue):
+        self.loop = loop
+        self.channels = frozenset(channels)
+        self.queue = asyncio.Queue(maxsize=max_queue)
+
+    def put(self, event):
+        # Runs on the subscription's event loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+
+class EventHub:
+    """Fans events out to the subscriptions of this process, grouped by event loop."""
+
+    def __init__(self):
+        self._loops = {}  # loop -> set of subscriptions
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels, max_queue=None):
+        """Call from the event loop that will read the subscription's queue."""
+        subscription = Subscription(asyncio.get_running_loop(), channels, max_queue or settings.EVENT_STREAM_QUEUE)
+        with self._lock:
+            self._loops.setdefault(subscription.loop, set()).add(subscription)
+        get_backend().start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._loops.get(subscription.loop)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._loops[subscription.loop]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._loops.values())
+
+    def dispatch(self, channel, payload):
+        """Deliver an event to every subscription of `channel`. Safe to call from any thread."""
+        with self._lock:
+            targets = {
+                loop: [s for s in subscriptions if channel in s.channels]
+                for loop, subscriptions in self._loops.items()
+            }
+        for loop, subscriptions in targets.items():
+            if not subscriptions:
+                continue
+            try:
+                loop.call_soon_threadsafe(_deliver, subscriptions, (channel, payload))
+            except RuntimeError:
+                # The loop has been closed without its streams unsubscribing
+                with self._lock:
+                    self._loops.pop(loop, None)
+
+def _deliver(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.put(event)
+
+
+hub = EventHub()
+
+
+class LocalBackend:
+    """Events only reach the streams of the process that published them."""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, channel, payload):
+        self.hub.dispatch(channel, payload)
+
+    def start(self):
+        pass
+
+
+class RedisBackend:
+    """
+    Shares events between worker processes through Redis pub/sub at
+    EVENT_REDIS_URL. Needs the `redis` package.
+    """
+    prefix = 'events:'
+
+    def __init__(self, hub):
+        import redis
+        self.hub = hub
+        self.client = redis.Redis.from_url(settings.EVENT_REDIS_URL)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def publish(self, channel, payload):
+        self.client.publish(self.prefix + channel, json.dumps(payload, cls=DjangoJSONEncoder))
+
+    def start(self):
+        # One listener thread per process, (re)started lazily like the audit sink's writer
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._listen, name='event-listener', daemon=True)
+            self._thread.start()
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.prefix + '*')
+        for message in pubsub.listen():
+            try:
+                channel = message['channel'].decode()[len(self.prefix):]
+                self.hub.dispatch(channel, json.loads(message['data']))
+            except Exception:
+                logger.exception("Dropped a malformed event from Redis")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.EVENT_BACKEND)(hub)
+    return _backend
+
+def publish(channel, payload):
+    """Publish once the current transaction commits (immediately outside one). Never raises."""
+    def send():
+        try:
+            get_backend().publish(channel, payload)
+        except Exception:
+            logger.exception("Failed to publish %s event", channel)
+    transaction.on_commit(send)
+
+
+def format_event(channel, data):
+    return f'event: {channel}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+async def stream(channels, accept, heartbeat=None, max_queue=None):
+    """
+    SSE body for a subscription to `channels`. accept(channel, payload) returns
+    the data to send to this client, or None to skip the event. Idle streams get
+    a comment every `heartbeat` seconds so proxies keep them open.
+
+    The subscription is made when the body starts, so a response that is never
+    sent (client gone, response discarded) leaves nothing in the hub.
+    """
+    heartbeat = heartbeat or settings.EVENT_STREAM_HEARTBEAT
+    subscription = hub.subscribe(channels, max_queue)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event is OVERFLOW:
+                return
+            channel, payload = event
+            data = accept(channel, payload)
+            if data is not None:
+                yield format_event(channel, data)
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,243 @@
+"""
+Per-request performance instrumentation.
+
+MetricsMiddleware records, per endpoint (URL name, e.g. 'patient-list'):
+wall time, DB query count and time, time spent in patient field crypto,
+time spent writing audit entries and response size. Values go into
+in-process histograms served in Prometheus text format at /api/metrics.
+Code under measurement reports its own time with `with timed('crypto'):`.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from django.conf import settings
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# name -> (help text, buckets); the per-request timers feed the *_duration_seconds histograms
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Wall time of the request', DURATION_BUCKETS),
+    'http_request_db_queries': ('Database queries per request', COUNT_BUCKETS),
+    'http_request_db_duration_seconds': ('Time spent in database queries', DURATION_BUCKETS),
+    'http_request_crypto_duration_seconds': ('Time spent encrypting/decrypting patient fields', DURATION_BUCKETS),
+    'http_request_audit_duration_seconds': ('Time spent writing audit log entries', DURATION_BUCKETS),
+    'http_response_size_bytes': ('Response body size', SIZE_BUCKETS),
+}
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._requests = {}
+
+    def record(self, endpoint, method, status, values):
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for name, value in values.items():
+                histogram = self._histograms.get((name, endpoint, method))
+                if histogram is None:
+                    histogram = self._histograms[(name, endpoint, method)] = Histogram(HISTOGRAMS[name][1])
+                histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            requests = sorted(self._requests.items())
+            histograms = sorted(
+                (key, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()
+            )
+        lines = [
+            '# HELP http_requests_total Requests handled, by endpoint, method and status',
+            '# TYPE http_requests_total counter',
+        ]
+        for (endpoint, method, status), count in requests:
+            lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, endpoint, method), counts, total, count in histograms:
+                if metric != name:
+                    continue
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {total:.6f}')
+                lines.append(f'{name}_count{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's `name` timer (no-op outside a request)."""
+    timers = _current.get()
+    if timers is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timers[name] = timers.get(name, 0.0) + time.perf_counter() - start
+
+
+def _count_query(execute, sql, params, many, context):
+    # Installed on every connection; only counts while a request is being measured.
+    # Works across the threads sync_to_async uses, since the timers live in a contextvar.
+    timers = _current.get()
+    if timers is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timers['db'] += time.perf_counter() - start
+        timers['queries'] += 1
+
+def _install_query_counter(connection, **kwargs):
+    # First in the list, so execute_wrapper() blocks that pop() their own wrapper are unaffected
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+connection_created.connect(_install_query_counter)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported missed connection_created
+        for conn in connections.all(initialized_only=True):
+            _install_query_counter(conn)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timers = {'db': 0.0, 'queries': 0, 'crypto': 0.0, 'audit': 0.0}
+        token = _current.set(timers)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timers, start)
+
+    async def __acall__(self, request):
+        timers = {'db': 0.0, 'queries': 0, 'crypto': 0.0, 'audit': 0.0}
+        token = _current.set(timers)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timers, start)
+
+    def _finish(self, request, response, timers, start):
+        match = getattr(request, 'resolver_match', None)
+        endpoint = (match.url_name or match.view_name) if match else 'unmatched'
+        key = (endpoint, request.method, response.status_code)
+
+        if settings.METRICS_SERVER_TIMING:
+            # Headers go out before a streamed body, so this covers the view only
+            elapsed = time.perf_counter() - start
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={elapsed * 1000:.1f}',
+                f'db;dur={timers["db"] * 1000:.1f};desc="{timers["queries"]} queries"',
+                f'crypto;dur={timers["crypto"] * 1000:.1f}',
+                f'audit;dur={timers["audit"] * 1000:.1f}',
+            ])
+
+        if response.streaming:
+            # A streamed body does its queries and crypto while it is sent: keep measuring until the end
+            measure = self._ameasure_stream if response.is_async else self._measure_stream
+            response.streaming_content = measure(response.streaming_content, key, timers, start)
+        else:
+            self._record(key, timers, start, len(response.content))
+        return response
+
+    def _record(self, key, timers, start, size):
+        registry.record(*key, {
+            'http_request_duration_seconds': time.perf_counter() - start,
+            'http_request_db_queries': timers['queries'],
+            'http_request_db_duration_seconds': timers['db'],
+            'http_request_crypto_duration_seconds': timers['crypto'],
+            'http_request_audit_duration_seconds': timers['audit'],
+            'http_response_size_bytes': size,
+        })
+
+    def _measure_stream(self, chunks, key, timers, start):
+        chunks = iter(chunks)
+        size = 0
+        try:
+            while True:
+                # Set around each step only: the consumer's own code between chunks is not ours
+                token = _current.set(timers)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._record(key, timers, start, size)
+
+    async def _ameasure_stream(self, chunks, key, timers, start):
+        chunks = aiter(chunks)
+        size = 0
+        try:
+            while True:
+                token = _current.set(timers)
+                try:
+                    chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._record(key, timers, start, size)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination shared by the large list endpoints.
+
+    Pages are fetched with `WHERE <ordering key> > <cursor> LIMIT n` against an
+    index on the ordering columns, so every page costs the same no matter how
+    deep the client goes, and no COUNT(*) is ever run. Subclasses set `ordering`.
+    Clients may pass ?page_size=N up to API_MAX_PAGE_SIZE.
+    """
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
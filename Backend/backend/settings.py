@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -60,7 +61,7 @@ ROOT_URLCONF = 'backend.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -74,6 +75,8 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+TEST_RUNNER = 'backend.test_runner.TestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -86,6 +89,54 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local-memory by default; point this at Redis/Memcached to share caches between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Rendered patient list/detail responses kept per process (patients.cache), LRU-evicted
+PATIENT_RESPONSE_CACHE_SIZE = 512
+
+# Server-sent events at /api/events/ (backend.events). LocalBackend only reaches
+# the streams of the publishing process; with several workers use
+# 'backend.events.RedisBackend' (pip install redis) to share them via EVENT_REDIS_URL
+EVENT_BACKEND = 'backend.events.LocalBackend'
+EVENT_REDIS_URL = 'redis://localhost:6379/0'
+# Events buffered per stream before a slow client is cut off (it reconnects and resyncs)
+EVENT_STREAM_QUEUE = 100
+# Seconds between keepalive comments on an idle stream
+EVENT_STREAM_HEARTBEAT = 15
+
+# Delta sync tombstones (patients.changes) older than this are pruned by
+# prune_patient_tombstones; clients with older tokens reload the list
+PATIENT_TOMBSTONE_RETENTION_DAYS = 30
+
+# Seconds the cached doctor directory (users.directory) lives without any invalidation
+DOCTOR_DIRECTORY_TTL = 3600
+
+# Sessions are read from the cache and written through to the database, and
+# request.user (with its groups) comes from the cache too (users.backends).
+# Invalidation is signal-driven, so with the per-process LocMemCache other
+# workers only see a logout, password or group change after USER_CACHE_TTL;
+# users.sessions caps cached sessions at USER_CACHE_TTL for that reason.
+SESSION_ENGINE = 'users.sessions'
+AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+USER_CACHE_TTL = 60
+
+# Login (users.login): password hashing runs on LOGIN_HASH_WORKERS threads with at
+# most LOGIN_HASH_QUEUE logins waiting (more get a 503), and each client IP and
+# username has a token bucket of (attempts per second, burst) checked before hashing.
+LOGIN_HASH_WORKERS = 2
+LOGIN_HASH_QUEUE = 16
+LOGIN_RATE_PER_IP = (0.5, 20)
+LOGIN_RATE_PER_USERNAME = (0.1, 10)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -127,6 +178,11 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# List endpoints with large tables use keyset pagination (backend.pagination).
+# API_PAGE_SIZE is the default page size, clients may ask for up to API_MAX_PAGE_SIZE.
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
 CORS_ALLOW_ALL_ORIGINS = False
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
@@ -140,3 +196,42 @@ CSRF_TRUSTED_ORIGINS = [
 
 # Encryption Key (In production, use environment variable)
 ENCRYPTION_KEY = 'jCPjH6m0CUcytXyeJc07VTchKFRUUfECOfUosap6_NI='
+# Retired keys, newest first. Data encrypted under them stays readable until
+# `manage.py rotate_patient_keys` has re-encrypted it under ENCRYPTION_KEY.
+ENCRYPTION_OLD_KEYS = []
+
+# HMAC key for the searchable blind indexes on patients (patients.search).
+# Must differ from ENCRYPTION_KEY; changing it requires running backfill_search_index.
+BLIND_INDEX_KEY = 'b5Xq2m8TzR1vK9pW4nL7cY0hJ3sD6fGa'
+
+# Bulk decryption (patients.utils.decrypt_many): lists at least this long are
+# split across a pool of ENCRYPTION_WORKERS ('thread', 'process' or 'inline').
+ENCRYPTION_PARALLEL_THRESHOLD = 2000
+ENCRYPTION_WORKERS = 4
+ENCRYPTION_EXECUTOR = 'thread'
+
+# Audit log writer (logs.audit.log_access). Entries are queued and written in
+# batches by a background thread; the test runner (backend.test_runner) writes synchronously.
+AUDIT_LOG_ASYNC = True
+AUDIT_LOG_BATCH_SIZE = 200
+AUDIT_LOG_FLUSH_INTERVAL = 0.5  # seconds
+AUDIT_LOG_QUEUE_SIZE = 10000
+AUDIT_LOG_SYNC_FALLBACK = True  # write inline when the queue is full (False = block)
+
+# Audit log retention (logs.archive, run `manage.py archive_audit_logs` from cron):
+# rows older than AUDIT_LOG_RETENTION_DAYS move into gzipped NDJSON segments of
+# up to AUDIT_LOG_SEGMENT_ROWS rows under AUDIT_LOG_ARCHIVE_DIR, and are still
+# served by the log list and export endpoints.
+AUDIT_LOG_RETENTION_DAYS = 180
+AUDIT_LOG_ARCHIVE_DIR = BASE_DIR / 'audit_archive'
+AUDIT_LOG_SEGMENT_ROWS = 50000
+
+# Tamper evidence (logs.chain): every audit row is HMAC-chained to the previous one
+# and each block of AUDIT_LOG_BLOCK_SIZE rows gets a signed Merkle checkpoint.
+# Keep the key out of the database; without it the chain cannot be rewritten.
+AUDIT_LOG_CHAIN_KEY = 'Qm7d0Vx2Lr9sK4pT8wZ1nF6yH3cJ5gBe'
+AUDIT_LOG_BLOCK_SIZE = 1024
+
+# Per-request metrics (backend.metrics) are always collected and served at /api/metrics;
+# Server-Timing response headers are only added when this is on.
+METRICS_SERVER_TIMING = DEBUG
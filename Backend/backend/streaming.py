@@ -0,0 +1,55 @@
+import csv
+import io
+import json
+import zlib
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def iter_csv(header, rows, chunk_rows=1000):
+    """Yield CSV text in chunks of `chunk_rows` rows, so memory stays bounded."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def iter_ndjson(records, chunk_rows=1000):
+    """Yield newline-delimited JSON text in chunks of `chunk_rows` records."""
+    # DRF's encoder, so dates etc. look exactly like in the JSON API responses
+    encoder = JSONEncoder()
+    lines = []
+    for record in records:
+        lines.append(encoder.encode(record))
+        if len(lines) >= chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def iter_gzip(chunks):
+    """Gzip-compress a stream of text chunks on the fly."""
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+def streaming_download(chunks, filename, content_type, gzip=False):
+    """
+    Wrap a generator of text chunks in a StreamingHttpResponse attachment.
+    With gzip=True the body is compressed as it streams and '.gz' is appended to the filename.
+    """
+    if gzip:
+        chunks = iter_gzip(chunks)
+        content_type = 'application/gzip'
+        filename += '.gz'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
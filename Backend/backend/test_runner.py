@@ -0,0 +1,15 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner that writes audit entries synchronously, so tests can assert on them right away."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._audit_sync = override_settings(AUDIT_LOG_ASYNC=False)
+        self._audit_sync.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._audit_sync.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User, Group
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from logs.audit import log_access
+from logs.models import AccessLog
+from patients.changes import make_token
+from patients.models import Patient
+from patients.utils import encrypt_data
+from . import events
+from .metrics import registry
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.admin = User.objects.create_user('admin', password='pass12345', is_staff=True)
+        self.client = APIClient()
+        self.client.force_login(self.admin)
+
+    def test_requests_are_recorded_per_endpoint(self):
+        AccessLog.objects.create(user=self.admin, action='USER_LOGIN')
+        self.client.get('/api/logs/')
+        self.client.get('/api/logs/export_csv/').getvalue()
+
+        body = self.client.get('/api/metrics').content.decode()
+        self.assertIn('http_requests_total{endpoint="log-list",method="GET",status="200"} 1', body)
+        self.assertIn('http_request_db_queries_count{endpoint="log-export-csv",method="GET"} 1', body)
+        self.assertIn('http_response_size_bytes_bucket{endpoint="log-list",method="GET",le="+Inf"} 1', body)
+
+    def test_streamed_body_is_measured_until_sent(self):
+        AccessLog.objects.bulk_create(AccessLog(user=self.admin, action='VIEW_PATIENT') for _ in range(50))
+        Patient.objects.create(name=encrypt_data('Ann Lee'), diagnosis=encrypt_data('Flu'), age=30, contact='555')
+        self.admin.groups.add(Group.objects.get(name='Admin'))
+        for url in ('/api/logs/export_csv/', '/api/patients/export/'):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+                self.assertIn(b'Ann Lee' if 'patients' in url else b'VIEW_PATIENT', response.getvalue())
+            self.assertIn(f'{len(ctx.captured_queries)}.000000', self.metric('http_request_db_queries_sum', url))
+
+        # The rows are read and decrypted while the body is sent, not in the view
+        self.assertGreater(len(ctx.captured_queries), 1)
+        crypto = self.metric('http_request_crypto_duration_seconds_sum', '/api/patients/export/')
+        self.assertGreater(float(crypto.rsplit(' ', 1)[1]), 0)
+
+    def metric(self, name, url):
+        endpoint = {'/api/logs/export_csv/': 'log-export-csv', '/api/patients/export/': 'patient-export'}[url]
+        prefix = f'{name}{{endpoint="{endpoint}",method="GET"}} '
+        return next(line for line in registry.render().splitlines() if line.startswith(prefix))
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get('/api/logs/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    def test_metrics_are_admin_only(self):
+        self.client.force_login(User.objects.create_user('nurse'))
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+
+
+class EventStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        doctor_group = Group.objects.get(name='Doctor')
+        cls.admin = User.objects.create_user('admin', password='pass12345', is_staff=True)
+        cls.admin.groups.add(Group.objects.get(name='Admin'))
+        cls.doctor = User.objects.create_user('house', password='pass12345')
+        cls.doctor.groups.add(doctor_group)
+        cls.other = User.objects.create_user('wilson', password='pass12345')
+        cls.other.groups.add(doctor_group)
+
+    async def open_stream(self, user):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        response = await client.get('/api/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        return stream
+
+    async def next_event(self, stream):
+        chunk = (await asyncio.wait_for(anext(stream), 5)).decode()
+        event, data = chunk.strip().split('\n')
+        return event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+    async def write(self, func):
+        # on_commit callbacks (which publish) only run when the test transaction is "committed";
+        # captured on the sync thread, which owns the database connection
+        def run():
+            with self.captureOnCommitCallbacks(execute=True):
+                return func()
+        return await sync_to_async(run)()
+
+    async def test_doctor_only_hears_about_own_patients(self):
+        stream = await self.open_stream(self.doctor)
+        await self.write(lambda: Patient.objects.create(name='x', diagnosis='y', age=40, contact='555', assigned_doctor=self.other))
+        mine = await self.write(lambda: Patient.objects.create(name='x', diagnosis='y', age=40, contact='556', assigned_doctor=self.doctor))
+        scope = f'doctor-{self.doctor.pk}'
+        self.assertEqual(await self.next_event(stream), ('patients', {'token': make_token(mine.change_seq, scope)}))
+
+        def reassign():
+            mine.assigned_doctor = self.other
+            mine.save()
+            return mine
+        moved = await self.write(reassign)
+        self.assertEqual(await self.next_event(stream), ('patients', {'token': make_token(moved.change_seq, scope)}))
+
+    async def test_staff_get_audit_entries(self):
+        stream = await self.open_stream(self.admin)
+        await self.write(lambda: log_access(self.doctor, 'VIEW_PATIENT', 'Viewed patient 1'))
+        event, data = await self.next_event(stream)
+        entry = data['entries'][0]
+        self.assertEqual(event, 'audit')
+        self.assertEqual((entry['user_name'], entry['action']), ('house', 'VIEW_PATIENT'))
+        self.assertEqual(entry['id'], await AccessLog.objects.values_list('id', flat=True).alatest('id'))
+
+    async def test_disconnect_unsubscribes_and_anonymous_is_rejected(self):
+        stream = await self.open_stream(self.doctor)
+        self.assertEqual(events.hub.subscriber_count(), 1)
+        reader = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        reader.cancel()  # what the ASGI handler does when the client goes away
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+        self.assertEqual(events.hub.subscriber_count(), 0)
+
+        self.assertEqual((await AsyncClient().get('/api/events/')).status_code, 403)
+
+    def test_wsgi_requests_get_no_content(self):
+        client = APIClient()
+        client.force_login(self.admin)
+        response = client.get('/api/events/')
+        self.assertEqual((response.status_code, response.content), (204, b''))
+        self.assertEqual(events.hub.subscriber_count(), 0)
+
+    async def test_unsent_stream_leaves_no_subscription(self):
+        client = AsyncClient()
+        await client.aforce_login(self.doctor)
+        response = await client.get('/api/events/')
+        response.close()  # e.g. the client went away before the body started
+        self.assertEqual(events.hub.subscriber_count(), 0)
+
+    async def test_fan_out_from_threads_and_slow_clients_are_cut_off(self):
+        subscriptions = [events.hub.subscribe({'patients'}, max_queue=2) for _ in range(1000)]
+        try:
+            thread = threading.Thread(target=events.hub.dispatch, args=('patients', {'n': 1}))
+            thread.start()
+            thread.join()
+            await asyncio.sleep(0)
+            self.assertTrue(all(s.queue.get_nowait() == ('patients', {'n': 1}) for s in subscriptions))
+        finally:
+            for subscription in subscriptions:
+                events.hub.unsubscribe(subscription)
+
+        slow = events.stream({'patients'}, lambda channel, payload: payload, max_queue=2)
+        self.assertEqual(await anext(slow), 'retry: 3000\n\n')
+        for n in range(3):
+            events.hub.dispatch('patients', {'n': n})
+        await asyncio.sleep(0)
+        # Overflowed: the stream ends (and the client reconnects and resyncs)
+        self.assertEqual([chunk async for chunk in slow], [])
+        self.assertEqual(events.hub.subscriber_count(), 0)
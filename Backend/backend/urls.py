@@ -4,6 +4,7 @@ from rest_framework.routers import DefaultRouter
 from patients.views import PatientViewSet
 from users.views import UserViewSet, LoginView, LogoutView, CurrentUserView
 from logs.views import AccessLogViewSet
+from .views import EventStreamView, MetricsView
 
 router = DefaultRouter()
 router.register(r'patients', PatientViewSet, basename='patient')
@@ -16,4 +17,6 @@ urlpatterns = [
     path('api/auth/login/', LoginView.as_view(), name='login'),
     path('api/auth/logout/', LogoutView.as_view(), name='logout'),
     path('api/auth/me/', CurrentUserView.as_view(), name='me'),
+    path('api/metrics', MetricsView.as_view(), name='metrics'),
+    path('api/events/', EventStreamView.as_view(), name='events'),
 ]
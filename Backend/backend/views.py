@@ -0,0 +1,56 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import permissions, views
+from patients.changes import change_scope, make_token
+from users.roles import get_roles
+from . import events
+from .metrics import registry
+
+
+class MetricsView(views.APIView):
+    """Prometheus scrape endpoint for the per-request metrics (see metrics.py), admin only."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class EventStreamView(View):
+    """
+    Server-sent events (see events.py): `patients` events tell Admins, Receptionists
+    and the affected Doctors that their patient list changed, with the delta sync
+    token to catch up to via /api/patients/changes/; staff also get `audit` events
+    with each new AccessLog entry. Async, so idle streams hold no thread; ASGI only.
+    """
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            # Under WSGI the async body would pin a worker thread without ever sending a byte.
+            # 204 tells EventSource not to reconnect; the pages then just refresh on reload
+            return HttpResponse(status=204)
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=403)
+        roles = await sync_to_async(get_roles)(user)
+        scope = change_scope(roles, user)
+        channels = set()
+        if scope is not None:
+            channels.add('patients')
+        if user.is_staff:  # same rule as the audit log endpoints (IsAdminUser)
+            channels.add('audit')
+        if not channels:
+            return JsonResponse({'detail': 'You do not have access to any event stream.'}, status=403)
+
+        def accept(channel, payload):
+            if channel == 'patients':
+                if scope != 'all' and user.pk not in payload['doctors']:
+                    return None
+                return {'token': make_token(payload['change_seq'], scope)}
+            return payload
+
+        response = StreamingHttpResponse(events.stream(channels, accept), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # no proxy buffering
+        return response
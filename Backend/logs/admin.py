@@ -1,11 +1,32 @@
 from django.contrib import admin
-from .models import AccessLog
+from backend.admin_tools import AutocompleteFilter, FastChangeListAdmin
+from .models import AccessLog, AccessLogRollup, AuditSegment
+
+
+class ActionFilter(admin.SimpleListFilter):
+    """Action choices from the small rollup table rather than SELECT DISTINCT over the log."""
+    title = 'action'
+    parameter_name = 'action'
+
+    def lookups(self, request, model_admin):
+        actions = AccessLogRollup.objects.filter(granularity=AccessLogRollup.DAY).values_list('action', flat=True)
+        return [(action, action) for action in actions.distinct().order_by('action')]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(action=self.value())
+        return queryset
+
 
 @admin.register(AccessLog)
-class AccessLogAdmin(admin.ModelAdmin):
+class AccessLogAdmin(FastChangeListAdmin):
     list_display = ('timestamp', 'user', 'action', 'details')
-    list_filter = ('action', 'timestamp', 'user')
-    search_fields = ('user__username', 'action', 'details')
+    list_select_related = ('user',)
+    list_filter = (ActionFilter, 'timestamp', ('user', AutocompleteFilter))
+    date_hierarchy = 'timestamp'
+    # Exact matches only: substring search over millions of details would scan the table
+    search_fields = ('=user__username', '=action')
+    search_help_text = 'Exact username or action'
     readonly_fields = ('timestamp', 'user', 'action', 'details')
 
     def has_add_permission(self, request):
@@ -16,3 +37,31 @@ class AccessLogAdmin(admin.ModelAdmin):
 
     def has_delete_permission(self, request, obj=None):
         return False
+
+
+@admin.register(AccessLogRollup)
+class AccessLogRollupAdmin(admin.ModelAdmin):
+    list_display = ('bucket', 'granularity', 'action', 'user', 'count')
+    list_filter = ('granularity', 'action')
+    date_hierarchy = 'bucket'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AuditSegment)
+class AuditSegmentAdmin(admin.ModelAdmin):
+    list_display = ('name', 'start', 'end', 'row_count', 'created_at')
+    readonly_fields = [f.name for f in AuditSegment._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,223 @@
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from backend.streaming import iter_gzip, iter_ndjson
+from .chain import trusted_through, verify_chain
+from .models import AccessLog, AuditSegment
+from .rollups import refresh_rollups
+
+logger = logging.getLogger(__name__)
+
+# Hot rows removed per DELETE transaction once a segment is safely on disk
+DELETE_CHUNK_SIZE = 5000
+
+# Rows read per round trip while writing a segment
+READ_CHUNK_SIZE = 2000
+
+ARCHIVE_FIELDS = ('id', 'user_id', 'action', 'details', 'timestamp', 'chain_hash')
+
+
+class TamperedLogError(Exception):
+    """The hash chain does not verify, so nothing is archived."""
+
+
+def archive_dir():
+    return Path(settings.AUDIT_LOG_ARCHIVE_DIR)
+
+def segment_path(segment):
+    return archive_dir() / segment.name
+
+def archived_through():
+    """Highest AccessLog id that lives in a segment (0 if nothing is archived)."""
+    return AuditSegment.objects.aggregate(top=Max('last_id'))['top'] or 0
+
+
+# --- Writing -----------------------------------------------------------------
+
+def _write_segment(rows):
+    """
+    Write the rows (dicts with ARCHIVE_FIELDS, ascending id) to a new segment
+    file plus its sidecar index and return the unsaved AuditSegment. The file is
+    written under a temporary name, fsynced, renamed and made read-only, so a
+    crash never leaves a partial segment behind.
+    """
+    directory = archive_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    stats = {'first_id': None, 'last_id': None, 'start': None, 'end': None, 'rows': 0, 'users': set()}
+
+    def tracked(records):
+        for record in records:
+            if stats['first_id'] is None:
+                stats['first_id'] = record['id']
+            stats['last_id'] = record['id']
+            moment = record['timestamp']
+            stats['start'] = moment if stats['start'] is None else min(stats['start'], moment)
+            stats['end'] = moment if stats['end'] is None else max(stats['end'], moment)
+            stats['rows'] += 1
+            if record['user_id'] is not None:
+                stats['users'].add(record['user_id'])
+            yield record
+
+    tmp_path = directory / f'.segment-{os.getpid()}.tmp'
+    digest = hashlib.sha256()
+    with open(tmp_path, 'wb') as out:
+        for data in iter_gzip(iter_ndjson(tracked(rows))):
+            digest.update(data)
+            out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+
+    if not stats['rows']:
+        tmp_path.unlink()
+        return None
+
+    segment = AuditSegment(
+        name=f"accesslog-{stats['first_id']:012d}-{stats['last_id']:012d}.ndjson.gz",
+        first_id=stats['first_id'],
+        last_id=stats['last_id'],
+        start=stats['start'],
+        end=stats['end'],
+        row_count=stats['rows'],
+        user_ids=sorted(stats['users']),
+        sha256=digest.hexdigest(),
+    )
+    final_path = segment_path(segment)
+    os.replace(tmp_path, final_path)
+    os.chmod(final_path, 0o444)
+
+    sidecar = {
+        'segment': segment.name,
+        'first_id': segment.first_id,
+        'last_id': segment.last_id,
+        'start': segment.start.isoformat(),
+        'end': segment.end.isoformat(),
+        'rows': segment.row_count,
+        'user_ids': segment.user_ids,
+        'sha256': segment.sha256,
+    }
+    sidecar_path = final_path.with_name(segment.name + '.idx.json')
+    sidecar_path.write_text(json.dumps(sidecar, indent=2))
+    os.chmod(sidecar_path, 0o444)
+    return segment
+
+
+def _delete_archived_rows(through_id):
+    """Remove hot rows up to `through_id` in short transactions."""
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            upper = list(
+                AccessLog.objects.filter(id__lte=through_id).order_by('id')
+                .values_list('id', flat=True)[DELETE_CHUNK_SIZE - 1:DELETE_CHUNK_SIZE]
+            )
+            chunk = AccessLog.objects.filter(id__lte=upper[0] if upper else through_id)
+            count, _ = chunk.delete()
+        deleted += count
+        if not upper:
+            return deleted
+
+
+def archive_old_logs(older_than=None, segment_rows=None):
+    """
+    Move AccessLog rows older than `older_than` (default AUDIT_LOG_RETENTION_DAYS
+    ago) into segments and delete them from the hot table.
+
+    Archiving always takes a contiguous id prefix: it stops at the first row that
+    is still inside the retention window, so the hot table is exactly the rows
+    above archived_through(). Only rows covered by a verified chain checkpoint
+    are archived, so segments never hold unverified data. Rows already in a
+    segment but still in the table (an interrupted run) are deleted first.
+    Returns (segments written, rows deleted).
+    """
+    if older_than is None:
+        older_than = timezone.now() - datetime.timedelta(days=settings.AUDIT_LOG_RETENTION_DAYS)
+    segment_rows = segment_rows or settings.AUDIT_LOG_SEGMENT_ROWS
+
+    # The rollups count from the hot table, so they must have seen every row first
+    refresh_rollups()
+    result = verify_chain()
+    if not result['ok']:
+        raise TamperedLogError(result['error'])
+
+    deleted = _delete_archived_rows(archived_through())
+    keep_from = AccessLog.objects.filter(timestamp__gte=older_than).aggregate(first=Min('id'))['first']
+    keep_from = min(keep_from or float('inf'), trusted_through() + 1)
+    segments = 0
+    while True:
+        after = archived_through()
+        pending = AccessLog.objects.filter(id__gt=after, id__lt=keep_from)
+        ids = pending.order_by('id').values_list('id', flat=True)
+        last = list(ids[segment_rows - 1:segment_rows]) or [pending.aggregate(top=Max('id'))['top']]
+        if last[0] is None:
+            break
+        rows = (
+            AccessLog.objects.filter(id__gt=after, id__lte=last[0])
+            .order_by('id').values(*ARCHIVE_FIELDS).iterator(chunk_size=READ_CHUNK_SIZE)
+        )
+        segment = _write_segment(rows)
+        if segment is None:
+            break
+        # The catalog row is the commit point: from here on readers use the segment
+        segment.save()
+        segments += 1
+        deleted += _delete_archived_rows(segment.last_id)
+    return segments, deleted
+
+
+# --- Reading -----------------------------------------------------------------
+
+def verify_segment(segment):
+    """True if the file on disk still has the checksum recorded when it was written."""
+    digest = hashlib.sha256()
+    with open(segment_path(segment), 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest() == segment.sha256
+
+def candidate_segments(start=None, end=None, user_id=None, before_id=None):
+    """Segments that can hold matching rows, newest first, chosen from the catalog alone."""
+    segments = AuditSegment.objects.order_by('-first_id')
+    if start is not None:
+        segments = segments.filter(end__gte=start)
+    if end is not None:
+        segments = segments.filter(start__lte=end)
+    if before_id is not None:
+        segments = segments.filter(first_id__lt=before_id)
+    segments = list(segments)
+    if user_id is not None:
+        segments = [s for s in segments if user_id in s.user_ids]
+    return segments
+
+def read_segment(segment):
+    """Yield the archived rows of one segment in id order as dicts."""
+    with gzip.open(segment_path(segment), 'rt') as f:
+        for line in f:
+            record = json.loads(line)
+            record['timestamp'] = parse_datetime(record['timestamp'])
+            yield record
+
+def iter_archived(start=None, end=None, action=None, user_id=None, before_id=None):
+    """
+    Archived rows matching the filters, newest segment first and descending id
+    within a segment (the hot table's order, since ids grow with time). Only one
+    segment's matching rows are held in memory at a time.
+    """
+    for segment in candidate_segments(start, end, user_id, before_id):
+        matches = [
+            record for record in read_segment(segment)
+            if (start is None or record['timestamp'] >= start)
+            and (end is None or record['timestamp'] <= end)
+            and (action is None or record['action'] == action)
+            and (user_id is None or record['user_id'] == user_id)
+            and (before_id is None or record['id'] < before_id)
+        ]
+        yield from reversed(matches)
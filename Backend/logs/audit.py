@@ -0,0 +1,173 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from backend import events
+from backend.metrics import timed
+from .models import AccessLog
+from .chain import seal_pending
+from .rollups import refresh_rollups
+
+logger = logging.getLogger(__name__)
+
+
+class AuditSink:
+    """
+    Buffers AccessLog entries in memory and writes them with bulk_create on a
+    background thread, so the request path never waits on the log table.
+
+    A batch is flushed when it reaches `batch_size` entries or `flush_interval`
+    seconds after its first entry, whichever comes first. If the queue is full,
+    entries are written synchronously (sync_fallback=True) or the caller blocks
+    until there is room (sync_fallback=False).
+    """
+
+    def __init__(self, batch_size=200, flush_interval=0.5, max_queue=10000, sync_fallback=True, autostart=True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sync_fallback = sync_fallback
+        self.autostart = autostart
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, entry):
+        if self.autostart:
+            self._ensure_worker()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            if self.sync_fallback:
+                self._write([entry])
+            else:
+                self._queue.put(entry)
+
+    def flush(self):
+        """Write everything queued so far on the calling thread."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def shutdown(self, timeout=5):
+        """Stop the worker and drain whatever is still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _ensure_worker(self):
+        # (Re)start the worker lazily, also after a fork into a new worker process
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+
+    def _take_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, entries):
+        close_old_connections()
+        try:
+            AccessLog.objects.bulk_create(entries, batch_size=self.batch_size)
+        except Exception:
+            logger.exception("Failed to write %d audit log entries", len(entries))
+            return
+        publish_entries(entries)
+        # Chain the new rows and keep the stats rollups current, a batch at a time;
+        # verification and /api/logs/stats/ catch up on anything missed here
+        try:
+            seal_pending()
+            refresh_rollups()
+        except Exception:
+            logger.exception("Failed to seal or roll up audit log entries")
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_sink():
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = AuditSink(
+                    batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+                    flush_interval=settings.AUDIT_LOG_FLUSH_INTERVAL,
+                    max_queue=settings.AUDIT_LOG_QUEUE_SIZE,
+                    sync_fallback=settings.AUDIT_LOG_SYNC_FALLBACK,
+                )
+                atexit.register(_sink.shutdown)
+    return _sink
+
+def publish_entries(entries):
+    """Push newly written entries to the staff event streams (shaped like AccessLogSerializer)."""
+    events.publish('audit', {'entries': [
+        {
+            'id': entry.pk,
+            'user': entry.user_id,
+            'user_name': entry.__dict__.get('_user_name'),
+            'action': entry.action,
+            'details': entry.details,
+            'timestamp': entry.timestamp,
+        }
+        for entry in entries
+    ]})
+
+def log_access(user, action, details=''):
+    """
+    Record an audit entry. The timestamp is taken now, the row is written
+    later by the background sink (or immediately if AUDIT_LOG_ASYNC is off).
+    """
+    entry = AccessLog(
+        user_id=user.pk if user is not None and user.is_authenticated else None,
+        action=action,
+        details=details,
+        timestamp=timezone.now(),
+    )
+    if entry.user_id is not None:
+        entry._user_name = user.username  # for publish_entries, saves a lookup per entry
+    with timed('audit'):
+        if not settings.AUDIT_LOG_ASYNC:
+            entry.save()
+            publish_entries([entry])
+            return
+        get_sink().submit(entry)
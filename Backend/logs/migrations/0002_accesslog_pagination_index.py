@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['-timestamp', 'id'], name='accesslog_ts_id_idx'),
+        ),
+    ]
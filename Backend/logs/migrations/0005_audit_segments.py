@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0004_accesslog_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('first_id', models.BigIntegerField()),
+                ('last_id', models.BigIntegerField(unique=True)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('row_count', models.PositiveIntegerField()),
+                ('user_ids', models.JSONField(default=list)),
+                ('sha256', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['first_id'],
+            },
+        ),
+    ]
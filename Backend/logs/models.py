@@ -1,11 +1,111 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class AccessLog(models.Model):
-    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # Rows are hash-chained (logs.chain), so deleting a user must not rewrite them:
+    # the id stays and the username shows as unknown
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True)
     action = models.CharField(max_length=255)
     details = models.TextField(blank=True, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, not when the buffered writer inserts it (see logs.audit)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    # HMAC over the previous row's chain_hash and this row, filled in by logs.chain.seal_pending
+    chain_hash = models.CharField(max_length=64, blank=True, default='', db_default='', editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the audit log, newest first
+            models.Index(fields=['-timestamp', 'id'], name='accesslog_ts_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.action} - {self.timestamp}"
+
+
+class AccessLogRollup(models.Model):
+    """
+    Pre-aggregated audit log counts per hour/day, action and user, so the stats
+    endpoint never has to GROUP BY over the full log table (see logs.rollups).
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITY_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day')]
+
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()  # start of the hour/day, UTC
+    action = models.CharField(max_length=255)
+    # Counts outlive both the raw rows and the user, so no FK constraint and no SET_NULL
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['granularity', 'bucket', 'action', 'user'], name='accesslog_rollup_key'),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket'], name='accesslog_rollup_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket} - {self.action} - {self.user_id}: {self.count}"
+
+
+class RollupWatermark(models.Model):
+    """Highest AccessLog id already counted in AccessLogRollup (a single row)."""
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class AuditSegment(models.Model):
+    """
+    An immutable gzipped NDJSON file of archived AccessLog rows (see logs.archive).
+    Segments hold contiguous id ranges; the time range and user ids are kept
+    here and in a sidecar file so readers can skip segments without opening them.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField(unique=True)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    row_count = models.PositiveIntegerField()
+    user_ids = models.JSONField(default=list)
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['first_id']
+
+    def __str__(self):
+        return f"{self.name} ({self.row_count} rows, {self.start:%Y-%m-%d} - {self.end:%Y-%m-%d})"
+
+
+class ChainHead(models.Model):
+    """Where sealing stopped: the last chained AccessLog row and the open block (a single row)."""
+    last_id = models.BigIntegerField(default=0)
+    last_hash = models.CharField(max_length=64, default='0' * 64)
+    block_first_id = models.BigIntegerField(null=True)
+    block_rows = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class AuditCheckpoint(models.Model):
+    """
+    Signed Merkle root over one block of AUDIT_LOG_BLOCK_SIZE chained rows.
+    Verification starts after the newest checkpoint with verified_at set.
+    """
+    block = models.PositiveIntegerField(unique=True)
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    row_count = models.PositiveIntegerField()
+    merkle_root = models.CharField(max_length=64)
+    end_hash = models.CharField(max_length=64)  # chain_hash of the block's last row
+    signature = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    verified_at = models.DateTimeField(null=True)
+
+    class Meta:
+        ordering = ['block']
+
+    def __str__(self):
+        return f"Block {self.block} (ids {self.first_id}-{self.last_id})"
@@ -0,0 +1,131 @@
+import datetime
+import logging
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from .models import AccessLog, AccessLogRollup, RollupWatermark
+
+logger = logging.getLogger(__name__)
+
+# Raw rows folded into the rollups per transaction
+ROLLUP_BATCH_SIZE = 10000
+
+TRUNCATE = {
+    AccessLogRollup.HOUR: TruncHour,
+    AccessLogRollup.DAY: TruncDay,
+}
+
+
+def _hour(moment):
+    return moment.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+def _day(moment):
+    return _hour(moment).replace(hour=0)
+
+TRUNCATE_PY = {
+    AccessLogRollup.HOUR: _hour,
+    AccessLogRollup.DAY: _day,
+}
+
+
+class WatermarkMoved(Exception):
+    """Another process rolled up the same rows first."""
+
+
+def _fold(rows):
+    """Add the counts of `rows` (an AccessLog queryset slice) to the rollup tables."""
+    for granularity, trunc in TRUNCATE.items():
+        groups = (
+            rows.annotate(bucket=trunc('timestamp', tzinfo=datetime.timezone.utc))
+            .values('bucket', 'action', 'user_id')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        counts = {(g['bucket'], g['action'], g['user_id']): g['n'] for g in groups}
+        if not counts:
+            continue
+
+        existing = AccessLogRollup.objects.filter(
+            granularity=granularity,
+            bucket__in={bucket for bucket, _, _ in counts},
+            action__in={action for _, action, _ in counts},
+        )
+        changed = []
+        for rollup in existing:
+            n = counts.pop((rollup.bucket, rollup.action, rollup.user_id), None)
+            if n:
+                rollup.count += n
+                changed.append(rollup)
+        AccessLogRollup.objects.bulk_update(changed, ['count'], batch_size=500)
+        AccessLogRollup.objects.bulk_create(
+            [
+                AccessLogRollup(granularity=granularity, bucket=bucket, action=action, user_id=user_id, count=n)
+                for (bucket, action, user_id), n in counts.items()
+            ],
+            batch_size=500,
+        )
+
+
+def refresh_rollups(batch_size=ROLLUP_BATCH_SIZE, max_batches=None):
+    """
+    Fold AccessLog rows above the watermark into the rollup tables, one batch
+    per transaction. Only new rows are read, so the cost is proportional to what
+    was logged since the last run, not to the size of the log table.
+    Returns the number of rows rolled up.
+    """
+    RollupWatermark.objects.get_or_create(pk=1)
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        try:
+            with transaction.atomic():
+                last_id = RollupWatermark.objects.values_list('last_id', flat=True).get(pk=1)
+                pending = AccessLog.objects.filter(id__gt=last_id)
+                # Upper id of this batch: the batch_size-th pending row, or the last one
+                upper = next(iter(pending.order_by('id').values_list('id', flat=True)[batch_size - 1:batch_size]), None)
+                if upper is None:
+                    upper = pending.aggregate(top=Max('id'))['top']
+                if upper is None:
+                    break
+                rows = AccessLog.objects.filter(id__gt=last_id, id__lte=upper)
+                batch = rows.count()
+                _fold(rows)
+                # Compare-and-set: if someone else moved the watermark, undo our counts
+                if not RollupWatermark.objects.filter(pk=1, last_id=last_id).update(last_id=upper):
+                    raise WatermarkMoved
+        except WatermarkMoved:
+            logger.info("Audit log rollup raced with another worker; retrying")
+            continue
+        total += batch
+        batches += 1
+    return total
+
+
+def rebuild_rollups():
+    """Drop all rollups and count the whole log table again."""
+    with transaction.atomic():
+        AccessLogRollup.objects.all().delete()
+        RollupWatermark.objects.update_or_create(pk=1, defaults={'last_id': 0})
+    return refresh_rollups()
+
+
+def query_stats(granularity=AccessLogRollup.DAY, group_by=('bucket', 'action'), start=None, end=None, action=None, user=None):
+    """
+    Summed counts from the rollup table. `start`/`end` are aware datetimes and
+    match whole buckets: a bucket is included when it starts within [start, end].
+    """
+    rollups = AccessLogRollup.objects.filter(granularity=granularity)
+    if start is not None:
+        rollups = rollups.filter(bucket__gte=TRUNCATE_PY[granularity](start))
+    if end is not None:
+        rollups = rollups.filter(bucket__lte=end)
+    if action:
+        rollups = rollups.filter(action=action)
+    if user:
+        rollups = rollups.filter(user_id=user) if str(user).isdigit() else rollups.filter(user__username=user)
+
+    fields = [f if f != 'user' else 'user_id' for f in group_by]
+    if 'user' in group_by:
+        fields.append('user__username')
+    return rollups.values(*fields).annotate(count=Sum('count')).order_by(*fields)
+
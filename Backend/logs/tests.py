@@ -1,3 +1,374 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
+import resource
+import shutil
+import sys
+import tempfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .audit import AuditSink
+from .archive import archive_old_logs, segment_path
+from .chain import seal_pending, verify_chain
+from .models import AccessLog, AccessLogRollup, AuditCheckpoint, AuditSegment
+from .rollups import rebuild_rollups, refresh_rollups
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class AuditLogExportTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='pass12345', is_staff=True)
+        self.alice = User.objects.create_user('alice', password='pass12345')
+        self.client = APIClient()
+        self.client.force_login(self.admin)
+
+    def export(self, query=''):
+        response = self.client.get('/api/logs/export_csv/' + query)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_export_filters_and_joins_username(self):
+        AccessLog.objects.create(user=self.alice, action='VIEW_PATIENT', details='Viewed patient 1')
+        AccessLog.objects.create(user=self.admin, action='USER_LOGIN', details='login')
+        AccessLog.objects.create(user=None, action='VIEW_PATIENT', details='orphan')
+
+        response = self.export('?action=VIEW_PATIENT')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['Timestamp', 'User', 'Action', 'Details'])
+        self.assertEqual(sorted(row[1] for row in rows[1:]), ['Unknown', 'alice'])
+
+        response = self.export('?user=alice')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 2)
+
+        response = self.export('?start=2000-01-01&end=2000-12-31')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 1)
+
+    def test_export_gzip(self):
+        AccessLog.objects.create(user=self.alice, action='VIEW_PATIENT', details='Viewed patient 1')
+        response = self.export('?gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        text = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn('alice,VIEW_PATIENT', text)
+
+    def test_export_rejects_bad_dates(self):
+        response = self.client.get('/api/logs/export_csv/?start=yesterday')
+        self.assertEqual(response.status_code, 400)
+
+    @skipUnless(connection.vendor == 'sqlite', 'seeds rows with a SQLite recursive CTE')
+    def test_export_of_one_million_rows_runs_in_bounded_memory(self):
+        rows = 1_000_000
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+                INSERT INTO logs_accesslog (user_id, action, details, timestamp)
+                SELECT CASE n %% 3 WHEN 0 THEN NULL ELSE %s END, 'VIEW_PATIENT',
+                       'Viewed patient ' || n, datetime('2025-01-01', '+' || n || ' seconds')
+                FROM seq
+                """,
+                [rows, self.alice.id],
+            )
+
+        baseline = peak_rss_mb()
+        response = self.export()
+        lines = 0
+        for chunk in response.streaming_content:
+            lines += chunk.count(b'\n')
+        growth = peak_rss_mb() - baseline
+
+        self.assertEqual(lines, rows + 1)
+        # Buffering the whole export (or loading model instances) needs hundreds of MB
+        self.assertLess(growth, 64)
+
+
+class AuditSinkTests(TestCase):
+    """The buffered writer, driven on the test thread (no background worker)."""
+
+    def entry(self, n):
+        return AccessLog(action='VIEW_PATIENT', details=f'Viewed patient {n}')
+
+    def test_flush_writes_queued_entries_in_batches(self):
+        sink = AuditSink(batch_size=10, autostart=False)
+        for n in range(25):
+            sink.submit(self.entry(n))
+        self.assertEqual(AccessLog.objects.count(), 0)
+        sink.flush()
+        self.assertEqual(AccessLog.objects.count(), 25)
+
+    def test_full_queue_falls_back_to_synchronous_write(self):
+        sink = AuditSink(max_queue=2, sync_fallback=True, autostart=False)
+        for n in range(5):
+            sink.submit(self.entry(n))
+        self.assertEqual(AccessLog.objects.count(), 3)
+        sink.shutdown()
+        self.assertEqual(AccessLog.objects.count(), 5)
+
+
+class AccessLogListQueryCountTests(TestCase):
+
+    def test_log_list_query_budget(self):
+        admin = User.objects.create_user('admin', password='pass12345', is_staff=True)
+        users = [User.objects.create_user(f'user{i}') for i in range(20)]
+        AccessLog.objects.bulk_create(
+            AccessLog(user=users[i % 20] if i % 7 else None, action='VIEW_PATIENT', details=f'Viewed patient {i}')
+            for i in range(400)
+        )
+        client = APIClient()
+        client.force_login(admin)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get('/api/logs/', {'page_size': 400})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 400)
+        # session + request user + one joined page query + archive check on the last page
+        self.assertLessEqual(len(ctx.captured_queries), 4)
+
+
+class AuditLogStatsTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='pass12345', is_staff=True)
+        self.alice = User.objects.create_user('alice', password='pass12345')
+        self.client = APIClient()
+        self.client.force_login(self.admin)
+
+    def log(self, user, action, when):
+        return AccessLog.objects.create(user=user, action=action, timestamp=when)
+
+    def stats(self, **params):
+        response = self.client.get('/api/logs/stats/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_rollups_are_incremental_and_match_group_by(self):
+        day1 = datetime.datetime(2025, 3, 1, 9, 30, tzinfo=datetime.timezone.utc)
+        day2 = day1 + datetime.timedelta(days=1)
+        for _ in range(3):
+            self.log(self.alice, 'VIEW_PATIENT', day1)
+        self.log(None, 'VIEW_PATIENT', day1)
+        self.log(self.admin, 'USER_LOGIN', day2)
+        self.assertEqual(refresh_rollups(batch_size=2), 5)
+
+        # Only rows above the watermark are read on the next refresh
+        self.log(self.alice, 'VIEW_PATIENT', day1 + datetime.timedelta(hours=1))
+        self.assertEqual(refresh_rollups(), 1)
+        self.assertEqual(refresh_rollups(), 0)
+
+        result = self.stats(group_by='action,user')
+        counts = {(r['action'], r['user_name']): r['count'] for r in result['results']}
+        self.assertEqual(counts, {('VIEW_PATIENT', 'alice'): 4, ('VIEW_PATIENT', None): 1, ('USER_LOGIN', 'admin'): 1})
+        self.assertEqual(result['total'], 6)
+
+        hourly = self.stats(granularity='hour', action='VIEW_PATIENT', group_by='bucket')
+        self.assertEqual([r['count'] for r in hourly['results']], [4, 1])
+
+        daily = self.stats(start='2025-03-02', end='2025-03-02', group_by='action')
+        self.assertEqual(daily['results'], [{'action': 'USER_LOGIN', 'count': 1}])
+
+        # The rollups agree with a full recount
+        before = set(AccessLogRollup.objects.values_list('granularity', 'bucket', 'action', 'user_id', 'count'))
+        rebuild_rollups()
+        after = set(AccessLogRollup.objects.values_list('granularity', 'bucket', 'action', 'user_id', 'count'))
+        self.assertEqual(before, after)
+
+    def test_stats_query_does_not_touch_raw_log(self):
+        self.log(self.alice, 'VIEW_PATIENT', datetime.datetime(2025, 3, 1, tzinfo=datetime.timezone.utc))
+        call_command('rollup_audit_logs', stdout=io.StringIO())
+        with CaptureQueriesContext(connection) as ctx:
+            self.stats(group_by='bucket,action,user')
+        self.assertFalse(any(
+            'logs_accesslog"' in q['sql'] and 'GROUP BY' in q['sql'] for q in ctx.captured_queries
+        ))
+
+    def test_stats_request_folds_in_a_bounded_batch(self):
+        day = datetime.datetime(2025, 3, 1, tzinfo=datetime.timezone.utc)
+        for _ in range(5):
+            self.log(self.alice, 'VIEW_PATIENT', day)
+        with mock.patch('logs.views.STATS_CATCH_UP_ROWS', 2):
+            self.assertEqual(self.stats()['total'], 2)
+            self.assertEqual(self.stats()['total'], 4)
+        call_command('rollup_audit_logs', stdout=io.StringIO())
+        self.assertEqual(self.stats()['total'], 5)
+
+    def test_stats_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/logs/stats/', {'granularity': 'week'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/logs/stats/', {'group_by': 'details'}).status_code, 400)
+
+
+class AuditLogArchiveTests(TestCase):
+
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        # Small chain blocks so the rows get verified checkpoints (only those are archived)
+        overrides = override_settings(AUDIT_LOG_ARCHIVE_DIR=self.archive_dir, AUDIT_LOG_BLOCK_SIZE=5)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.admin = User.objects.create_user('admin', password='pass12345', is_staff=True)
+        self.alice = User.objects.create_user('alice', password='pass12345')
+        self.client = APIClient()
+        self.client.force_login(self.admin)
+        self.now = datetime.datetime(2025, 6, 1, tzinfo=datetime.timezone.utc)
+        for n in range(25):
+            AccessLog.objects.create(
+                user=self.alice if n % 2 else None, action='VIEW_PATIENT', details=f'Viewed patient {n}',
+                timestamp=self.now - datetime.timedelta(days=25 - n),
+            )
+
+    def test_old_rows_move_to_segments_and_stay_queryable(self):
+        segments, deleted = archive_old_logs(older_than=self.now - datetime.timedelta(days=5), segment_rows=8)
+        self.assertEqual((segments, deleted), (3, 20))
+        self.assertEqual(AccessLog.objects.count(), 5)
+        segment = AuditSegment.objects.first()
+        self.assertTrue(segment_path(segment).exists())
+        self.assertTrue(segment_path(segment).with_name(segment.name + '.idx.json').exists())
+
+        # Paging runs through the hot rows and on into the archive without gaps or repeats
+        details, url = [], '/api/logs/?page_size=7'
+        while url:
+            page = self.client.get(url).json()
+            details += [row['details'] for row in page['results']]
+            url = page['next']
+        self.assertEqual(details, [f'Viewed patient {n}' for n in reversed(range(25))])
+
+        archived_id = segment.first_id
+        response = self.client.get(f'/api/logs/{archived_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['details'], 'Viewed patient 0')
+
+        response = self.client.get('/api/logs/export_csv/?user=alice')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows) - 1, 12)
+        self.assertEqual({row[1] for row in rows[1:]}, {'alice'})
+
+        response = self.client.get('/api/logs/export_csv/?start=2025-05-10&end=2025-05-12')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows) - 1, 3)
+
+    def test_interrupted_run_is_finished_without_duplicates(self):
+        archive_old_logs(older_than=self.now - datetime.timedelta(days=5), segment_rows=50)
+        # Simulate a crash part way through deleting the archived rows (deletes go in id order)
+        last_id = AuditSegment.objects.get().last_id
+        AccessLog.objects.create(id=last_id, action='VIEW_PATIENT', details='Viewed patient 19',
+                                 timestamp=self.now - datetime.timedelta(days=6))
+        response = self.client.get('/api/logs/export_csv/')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows) - 1, 25)
+
+        archive_old_logs(older_than=self.now - datetime.timedelta(days=5))
+        self.assertFalse(AccessLog.objects.filter(id=last_id).exists())
+
+
+@override_settings(AUDIT_LOG_BLOCK_SIZE=4)
+class AuditChainTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pass12345')
+        for n in range(10):
+            AccessLog.objects.create(user=self.alice, action='VIEW_PATIENT', details=f'Viewed patient {n}')
+
+    def test_sealing_is_batched_and_checkpoints_full_blocks(self):
+        self.assertEqual(seal_pending(batch_size=3), 10)
+        self.assertEqual(AuditCheckpoint.objects.count(), 2)
+        self.assertNotIn('', AccessLog.objects.values_list('chain_hash', flat=True))
+        result = verify_chain()
+        self.assertEqual((result['ok'], result['blocks_checked'], result['rows_checked']), (True, 2, 10))
+
+        # Verified blocks are trusted: the next run only reads the rows after them
+        AccessLog.objects.create(user=self.alice, action='USER_LOGIN')
+        AccessLog.objects.create(user=self.alice, action='USER_LOGOUT')
+        result = verify_chain()
+        self.assertEqual((result['ok'], result['blocks_checked'], result['rows_checked']), (True, 1, 4))
+
+    def test_edited_row_is_detected(self):
+        row = AccessLog.objects.order_by('id')[5]
+        seal_pending()
+        AccessLog.objects.filter(pk=row.pk).update(details='Viewed nothing')
+        result = verify_chain()
+        self.assertFalse(result['ok'])
+        self.assertEqual(result['error']['id'], row.pk)
+
+    def test_deleted_row_is_detected(self):
+        seal_pending()
+        AccessLog.objects.order_by('id')[2].delete()
+        self.assertFalse(verify_chain()['ok'])
+
+    def test_tampering_inside_a_trusted_block_needs_a_full_check(self):
+        self.assertTrue(verify_chain()['ok'])
+        AccessLog.objects.filter(pk=AccessLog.objects.order_by('id').first().pk).update(action='NOTHING')
+        self.assertTrue(verify_chain()['ok'])
+        self.assertFalse(verify_chain(full=True)['ok'])
+
+    def test_verify_endpoint_and_command(self):
+        admin = User.objects.create_user('admin', password='pass12345', is_staff=True)
+        client = APIClient()
+        client.force_login(admin)
+        # GET writes nothing: the rows stay unsealed and no checkpoint becomes trusted
+        with CaptureQueriesContext(connection) as ctx:
+            result = client.get('/api/logs/verify/').json()
+        self.assertEqual((result['ok'], result['rows_checked']), (True, 0))
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if not q['sql'].startswith('SELECT')])
+
+        result = client.post('/api/logs/verify/').json()
+        self.assertEqual((result['ok'], result['rows_checked'], result['blocks_checked']), (True, 10, 2))
+        self.assertEqual(AuditCheckpoint.objects.filter(verified_at__isnull=False).count(), 2)
+        self.assertEqual(client.get('/api/logs/verify/', {'full': 1}).json()['rows_checked'], 10)
+        out = io.StringIO()
+        call_command('verify_audit_log', '--full', stdout=out)
+        self.assertIn('Audit log intact', out.getvalue())
+
+
+class AccessLogAdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('root', password='pass12345')
+        self.alice = User.objects.create_user('alice', password='pass12345')
+        start = datetime.datetime(2024, 11, 20, tzinfo=datetime.timezone.utc)
+        AccessLog.objects.bulk_create(
+            AccessLog(user=self.alice if n % 2 else None, action='VIEW_PATIENT', details=f'Viewed patient {n}',
+                      timestamp=start + datetime.timedelta(hours=n * 7))
+            for n in range(500)
+        )
+        self.client.force_login(self.admin)
+
+    def get(self, query=''):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/admin/logs/accesslog/' + query)
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in ctx.captured_queries]
+
+    def test_changelist_avoids_full_table_counts_and_scans(self):
+        response, queries = self.get()
+        self.assertContains(response, 'Viewed patient 499')
+        # No DISTINCT for the date hierarchy or filters, no unbounded COUNT(*)
+        self.assertFalse([q for q in queries if 'DISTINCT' in q and 'FROM "logs_accesslog"' in q])
+        self.assertFalse([q for q in queries if 'COUNT(*)' in q and 'FROM "logs_accesslog"' in q])
+        self.assertContains(response, '2024')
+        self.assertContains(response, '2025')
+
+    def test_user_filter_and_date_drilldown(self):
+        response, _ = self.get(f'?user__id__exact={self.alice.pk}&timestamp__year=2025&timestamp__month=1')
+        self.assertContains(response, 'autocomplete-filter-user')
+        self.assertContains(response, 'alice')
+        rows = response.context['cl'].result_list
+        self.assertTrue(rows)
+        self.assertTrue(all(log.user_id == self.alice.pk and log.timestamp.month == 1 for log in rows))
+        # Drilldown lists the days of January that have entries
+        days = [choice['title'] for choice in response.context['cl'].fast_date_hierarchy['choices']]
+        self.assertEqual(days[0], 'January 1')
@@ -1,26 +1,231 @@
 from rest_framework import viewsets, permissions
-from .models import AccessLog
+from rest_framework.exceptions import ValidationError
+from .models import AccessLog, AccessLogRollup, AuditSegment
+from .archive import iter_archived, read_segment
+from .chain import verify_chain
+from .rollups import query_stats, refresh_rollups
 from .serializers import AccessLogSerializer
+from backend.pagination import KeysetPagination
+from backend.streaming import iter_csv, streaming_download
 
-import csv
-from django.http import HttpResponse
+import datetime
+from itertools import chain, islice
+from django.contrib.auth.models import User
+from django.db.models import Min
+from django.http import Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Columns /api/logs/stats/ can group by
+STATS_GROUPS = ('bucket', 'action', 'user')
+
+# Rows fetched per round trip by the export's server-side iterator
+EXPORT_CHUNK_SIZE = 2000
+
+# Log rows a /stats/ request folds into the rollups itself, at most. The audit sink
+# keeps them current and `manage.py rollup_audit_logs` folds in any larger backlog.
+STATS_CATCH_UP_ROWS = 1000
+
+def parse_bound(value, end_of_day=False):
+    """Parse an ISO date or datetime query parameter into an aware datetime."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError(f"Invalid date: {value!r}")
+        moment = datetime.datetime.combine(day, datetime.time.max if end_of_day else datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+class AccessLogPagination(KeysetPagination):
+    ordering = ('-timestamp', 'id')
 
 class AccessLogViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = AccessLog.objects.all().order_by('-timestamp')
+    # AccessLogSerializer reads user.username for every row
+    queryset = AccessLog.objects.select_related('user').only(
+        'id', 'action', 'details', 'timestamp', 'chain_hash', 'user__username'
+    ).order_by('-timestamp')
     serializer_class = AccessLogSerializer
     permission_classes = [permissions.IsAdminUser] # Only admin can view logs
+    pagination_class = AccessLogPagination
 
-    @action(detail=False, methods=['get'])
-    def export_csv(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="audit_logs.csv"'
+    def filter_by_params(self, queryset, params):
+        """
+        Apply the optional export filters:
+        ?start= / ?end= (ISO date or datetime, inclusive), ?action=, ?user= (id or username).
+        """
+        if params.get('start'):
+            queryset = queryset.filter(timestamp__gte=parse_bound(params['start']))
+        if params.get('end'):
+            queryset = queryset.filter(timestamp__lte=parse_bound(params['end'], end_of_day=True))
+        if params.get('action'):
+            queryset = queryset.filter(action=params['action'])
+        if params.get('user'):
+            user = params['user']
+            queryset = queryset.filter(user_id=user) if user.isdigit() else queryset.filter(user__username=user)
+        return queryset
 
-        writer = csv.writer(response)
-        writer.writerow(['Timestamp', 'User', 'Action', 'Details'])
+    def archive_filters(self, params):
+        """The filter_by_params filters as keyword arguments for logs.archive.iter_archived."""
+        filters = {
+            'start': parse_bound(params['start']) if params.get('start') else None,
+            'end': parse_bound(params['end'], end_of_day=True) if params.get('end') else None,
+            'action': params.get('action') or None,
+            'user_id': None,
+        }
+        if params.get('user'):
+            user = params['user']
+            if user.isdigit():
+                filters['user_id'] = int(user)
+            else:
+                # An unknown username matches nothing, not everything
+                filters['user_id'] = User.objects.filter(username=user).values_list('id', flat=True).first() or -1
+        return filters
 
-        logs = self.get_queryset()
+    def oldest_hot_id(self):
+        """
+        Archived rows are read below the oldest id still in the table, so rows of an
+        interrupted archive run (on disk and not yet deleted) are never served twice.
+        """
+        return AccessLog.objects.aggregate(first=Min('id'))['first']
+
+    def archived_logs(self, records):
+        """Turn archived records into unsaved AccessLog instances with their users attached."""
+        logs = [AccessLog(**record) for record in records]
+        users = User.objects.in_bulk({log.user_id for log in logs if log.user_id}) if logs else {}
         for log in logs:
-            writer.writerow([log.timestamp, log.user.username if log.user else 'Unknown', log.action, log.details])
+            # Same as the hot table: a deleted user shows as no user
+            log.user = users.get(log.user_id)
+        return logs
 
+    def list(self, request, *args, **kwargs):
+        """
+        Hot rows come first through the keyset paginator; once they run out the
+        `next` link continues into the archived segments (?archive_cursor=<id>).
+        """
+        if 'archive_cursor' in request.query_params:
+            return self.list_archived(request)
+        response = super().list(request, *args, **kwargs)
+        if response.data.get('next') is None and AuditSegment.objects.exists():
+            url = remove_query_param(request.build_absolute_uri(), self.paginator.cursor_query_param)
+            response.data['next'] = replace_query_param(url, 'archive_cursor', self.oldest_hot_id() or '')
         return response
+
+    def list_archived(self, request):
+        cursor = request.query_params['archive_cursor']
+        if cursor and not cursor.isdigit():
+            raise ValidationError("Invalid archive_cursor")
+        page_size = self.paginator.get_page_size(request)
+        records = list(islice(iter_archived(before_id=int(cursor) if cursor else None), page_size + 1))
+        logs = self.archived_logs(records[:page_size])
+        next_url = None
+        if len(records) > page_size:
+            next_url = replace_query_param(request.build_absolute_uri(), 'archive_cursor', logs[-1].id)
+        return Response({
+            'next': next_url,
+            'previous': None,
+            'results': self.get_serializer(logs, many=True).data,
+        })
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            pk = kwargs.get('pk', '')
+            segment = AuditSegment.objects.filter(first_id__lte=pk, last_id__gte=pk).first() if pk.isdigit() else None
+            record = next((r for r in read_segment(segment) if r['id'] == int(pk)), None) if segment else None
+            if record is None:
+                raise
+            return Response(self.get_serializer(self.archived_logs([record])[0]).data)
+
+    @action(detail=False, methods=['get'])
+    def export_csv(self, request):
+        """
+        Stream the audit log as CSV (add ?gzip=1 for a compressed download).
+        Rows are read with a chunked iterator and the username comes from a SQL join,
+        so memory use does not grow with the size of the table. Archived rows follow
+        the hot ones, one segment in memory at a time.
+        """
+        logs = self.filter_by_params(self.get_queryset(), request.query_params)
+        hot_rows = (
+            (timestamp, username or 'Unknown', action, details)
+            for timestamp, username, action, details in logs.values_list(
+                'timestamp', 'user__username', 'action', 'details'
+            ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        archived = iter_archived(before_id=self.oldest_hot_id(), **self.archive_filters(request.query_params))
+        rows = chain(hot_rows, self.archived_rows(archived))
+        chunks = iter_csv(['Timestamp', 'User', 'Action', 'Details'], rows)
+        return streaming_download(
+            chunks, 'audit_logs.csv', 'text/csv',
+            gzip=request.query_params.get('gzip') in ('1', 'true'),
+        )
+
+    def archived_rows(self, records):
+        """CSV rows for archived records, with usernames looked up per chunk."""
+        usernames = {}
+        while True:
+            chunk = list(islice(records, EXPORT_CHUNK_SIZE))
+            if not chunk:
+                return
+            missing = {r['user_id'] for r in chunk if r['user_id'] and r['user_id'] not in usernames}
+            if missing:
+                usernames.update(User.objects.filter(id__in=missing).values_list('id', 'username'))
+            for r in chunk:
+                yield r['timestamp'], usernames.get(r['user_id'], 'Unknown'), r['action'], r['details']
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Audit log counts served from the hourly/daily rollup tables.
+        ?granularity=day|hour, ?group_by=bucket,action,user (any subset),
+        plus the same ?start= / ?end= / ?action= / ?user= filters as the export.
+        """
+        params = request.query_params
+        granularity = params.get('granularity', AccessLogRollup.DAY)
+        if granularity not in (AccessLogRollup.HOUR, AccessLogRollup.DAY):
+            raise ValidationError("granularity must be 'hour' or 'day'")
+        group_by = [g for g in params.get('group_by', 'bucket,action').split(',') if g]
+        if not group_by or set(group_by) - set(STATS_GROUPS):
+            raise ValidationError(f"group_by must be a comma separated subset of {', '.join(STATS_GROUPS)}")
+
+        # Fold in whatever was logged since the last refresh (usually nothing), bounded
+        # so a GET never does the backlog's worth of writes
+        refresh_rollups(batch_size=STATS_CATCH_UP_ROWS, max_batches=1)
+        rows = query_stats(
+            granularity=granularity,
+            group_by=group_by,
+            start=parse_bound(params['start']) if params.get('start') else None,
+            end=parse_bound(params['end'], end_of_day=True) if params.get('end') else None,
+            action=params.get('action'),
+            user=params.get('user'),
+        )
+        results = []
+        for row in rows:
+            if 'user' in group_by:
+                row['user'] = row.pop('user_id')
+                row['user_name'] = row.pop('user__username')
+            results.append(row)
+        return Response({
+            'granularity': granularity,
+            'total': sum(row['count'] for row in results),
+            'results': results,
+        })
+
+    @action(detail=False, methods=['get', 'post'])
+    def verify(self, request):
+        """
+        Check the audit log hash chain from the last verified checkpoint on
+        (?full=1 re-checks everything, archived segments included). GET only
+        reads what is already sealed; POST seals pending rows first and marks
+        the checkpoints it verified as trusted.
+        """
+        result = verify_chain(
+            full=request.query_params.get('full') in ('1', 'true'),
+            read_only=request.method == 'GET',
+        )
+        return Response(result)
@@ -1,18 +1,35 @@
 from django.contrib import admin
+from backend.admin_tools import AutocompleteFilter, FastChangeListAdmin
 from .models import Patient
-from .utils import decrypt_data
+from .utils import decrypt_fields, get_decrypted
+from .search import search_q
 
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(FastChangeListAdmin):
     list_display = ('id', 'get_decrypted_name', 'anonymized_name', 'age', 'contact', 'anonymized_contact', 'assigned_doctor', 'date_added')
-    search_fields = ('contact', 'assigned_doctor__username', 'anonymized_name')
-    list_filter = ('assigned_doctor', 'date_added')
+    list_select_related = ('assigned_doctor',)
+    # Name and contact are matched exactly through the blind index (get_search_results),
+    # so no LIKE scans over the table
+    search_fields = ('=assigned_doctor__username', '=anonymized_name')
+    search_help_text = 'Full patient name, contact number, doctor username or anonymized ID (Patient-XXXXXXXX)'
+    list_filter = (('assigned_doctor', AutocompleteFilter), 'date_added')
+    date_hierarchy = 'date_added'
+    exclude = ('name_bidx', 'contact_bidx')
+    autocomplete_fields = ('assigned_doctor',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Also match the encrypted name (and normalized contact) through the blind index
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term.strip():
+            results |= queryset.filter(search_q(search_term))
+        return results, may_have_duplicates
+
+    def prepare_results(self, results):
+        # One batch decryption for the page instead of a Fernet call per row
+        decrypt_fields(results, ('name',), default="[Encrypted]")
 
     def get_decrypted_name(self, obj):
-        try:
-            return decrypt_data(obj.name)
-        except:
-            return "[Encrypted]"
+        return get_decrypted(obj, 'name', default="[Encrypted]")
     get_decrypted_name.short_description = 'Name'
 
     # We can also show diagnosis decrypted if needed, but let's keep it safe or optional
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PatientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'patients'
+
+    def ready(self):
+        from . import cache  # noqa: F401 - registers the response cache invalidation signal handlers
+        from . import changes  # noqa: F401 - registers the delta sync tombstone signal handlers
@@ -0,0 +1,108 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+from .models import Patient, PatientChangeCounter
+
+# Sent whenever the patient table changed (after the version was bumped)
+patients_changed = Signal()
+
+
+def get_table_version():
+    """
+    (version, last modified datetime) of the patient table: the delta sync change
+    counter, which every patient write advances in its own transaction. One row
+    read, so every worker sees a change as soon as it commits.
+    """
+    state = PatientChangeCounter.objects.filter(pk=1).values_list('value', 'changed_at').first()
+    if state is None:
+        counter, _ = PatientChangeCounter.objects.get_or_create(pk=1)
+        state = (counter.value, counter.changed_at)
+    return state
+
+def bump_table_version():
+    """
+    Mark every cached patient response stale after a change that stamps no
+    patient row: a user rename (responses embed the doctor's username) or a
+    blind index rebuild (search results).
+    """
+    with transaction.atomic():
+        PatientChangeCounter.advance()
+    patients_changed.send(sender=Patient)
+
+
+class LRUCache:
+    """Small thread-safe in-process LRU map."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+response_cache = LRUCache(settings.PATIENT_RESPONSE_CACHE_SIZE)
+
+def cached_response(request, roles, build):
+    """
+    Serve a patient list/detail response for this user, role set and URL.
+
+    The ETag is derived from the table version, so a client revalidating an
+    unchanged resource gets a 304 before any query or decryption runs. Otherwise
+    the rendered data is served from the LRU cache, or built with build()
+    and cached when it is a 200.
+    """
+    version, modified = get_table_version()
+    identity = f"{version}|{request.user.pk}|{','.join(sorted(roles))}|{request.build_absolute_uri()}"
+    etag = f'W/"{hashlib.sha1(identity.encode()).hexdigest()}"'
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(modified.timestamp()))
+    if response is None:
+        data = response_cache.get(etag)
+        if data is not None:
+            response = Response(data)
+        else:
+            response = build()
+            if response.status_code != 200:
+                return response
+            response_cache.set(etag, response.data)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified.timestamp())
+    response['Cache-Control'] = 'private, no-cache'  # browsers revalidate with If-None-Match
+    return response
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, update_fields=None, **kwargs):
+    # Responses embed the assigned doctor's username; logins only touch last_login
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_table_version()
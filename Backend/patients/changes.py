@@ -0,0 +1,121 @@
+"""
+Delta sync for the patient list: /api/patients/changes/?since=<token>.
+
+Every patient write stamps the row with the next value of one global sequence
+(PatientChangeCounter) and every row that leaves a visible set leaves a
+PatientTombstone, so "what changed since" is an index range scan over both
+tables. A token is a sequence value plus the caller's scope (everyone, or one
+doctor's patients), so a token is never resumed against a different set.
+Each change is also published to the /api/events/ streams (backend.events).
+
+Writers that bypass Patient.save() (bulk_create, QuerySet.update) stamp
+change_seq and record tombstones themselves; the counter is also the version of the
+cached patient responses (patients.cache).
+"""
+import base64
+from django.contrib.auth.models import User
+from django.db.models import F, Max
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from backend import events
+from users.roles import ADMIN, DOCTOR, RECEPTIONIST
+from .models import Patient, PatientChangeCounter, PatientTombstone
+
+
+class InvalidToken(Exception):
+    """The token cannot be resumed from: the client has to reload the list and start over."""
+
+
+def change_scope(roles, user):
+    """The set of patients a caller syncs (as in PatientViewSet.get_queryset), or None."""
+    if ADMIN in roles:
+        return 'all'
+    if DOCTOR in roles:
+        return f'doctor-{user.pk}'
+    if RECEPTIONIST in roles:
+        return 'all'
+    return None
+
+def make_token(seq, scope):
+    return base64.urlsafe_b64encode(f'{scope}:{seq}'.encode()).decode().rstrip('=')
+
+def parse_token(token, scope):
+    """Sequence value of a token. ValueError if malformed, InvalidToken if issued for another scope."""
+    try:
+        token_scope, seq = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode().rsplit(':', 1)
+        seq = int(seq)
+    except ValueError:
+        raise ValueError('Malformed change token.')
+    if token_scope != scope:
+        raise InvalidToken('The token was issued for a different set of patients.')
+    return seq
+
+
+def changes_since(patients, since, doctor_id=None, limit=1000):
+    """
+    Changes to `patients` (the caller's visible queryset) after sequence value
+    `since`: (current sequence value, changed patients, removed patient ids).
+    Tombstones are everyone's deletions, or for a doctor every patient that was
+    deleted or moved away from them. Raises InvalidToken when tombstones the
+    client needs were pruned or there are more than `limit` changes.
+    """
+    upper, pruned_through = PatientChangeCounter.current()
+    if since > upper:
+        raise InvalidToken('The token is ahead of the server; reload the list.')
+    if since < pruned_through:
+        raise InvalidToken('The token has expired; reload the list.')
+
+    changed = list(
+        patients.filter(change_seq__gt=since, change_seq__lte=upper).order_by('change_seq', 'id')[:limit + 1]
+    )
+    tombstones = PatientTombstone.objects.filter(change_seq__gt=since, change_seq__lte=upper)
+    tombstones = tombstones.filter(doctor_id=doctor_id) if doctor_id else tombstones.filter(deleted=True)
+    removed = set(tombstones.values_list('patient_id', flat=True)[:limit + 1])
+    if len(changed) + len(removed) > limit:
+        raise InvalidToken('Too many changes since the token; reload the list.')
+    # A patient that moved away and back again is just changed
+    removed -= {patient.pk for patient in changed}
+    return upper, changed, sorted(removed)
+
+
+def prune_tombstones(older_than):
+    """Delete tombstones removed before `older_than`; tokens from before them stop working."""
+    stale = PatientTombstone.objects.filter(removed_at__lt=older_than)
+    top = stale.aggregate(top=Max('change_seq'))['top']
+    if top is None:
+        return 0
+    PatientChangeCounter.objects.get_or_create(pk=1)
+    PatientChangeCounter.objects.filter(pk=1).update(pruned_through=Greatest(F('pruned_through'), top))
+    count, _ = PatientTombstone.objects.filter(change_seq__lte=top).delete()
+    return count
+
+
+def publish_change(change_seq, doctor_ids):
+    """Tell the event streams of Admins, Receptionists and these doctors that patients changed."""
+    events.publish('patients', {
+        'change_seq': change_seq,
+        'doctors': sorted({doctor_id for doctor_id in doctor_ids if doctor_id is not None}),
+    })
+
+
+@receiver(post_save, sender=Patient)
+def patient_saved(sender, instance, **kwargs):
+    publish_change(instance.change_seq, [instance.assigned_doctor_id, instance.__dict__.pop('_moved_from', None)])
+
+@receiver(post_delete, sender=Patient)
+def patient_deleted(sender, instance, **kwargs):
+    # Sent inside the deletion's transaction
+    change_seq = PatientChangeCounter.advance()
+    PatientTombstone.record([(instance.pk, instance.assigned_doctor_id)], change_seq, deleted=True)
+    publish_change(change_seq, [instance.assigned_doctor_id])
+
+@receiver(pre_delete, sender=User)
+def doctor_deleted(sender, instance, **kwargs):
+    # on_delete=SET_NULL unassigns the doctor's patients with an UPDATE that bypasses save()
+    patients = Patient.objects.filter(assigned_doctor=instance)
+    if patients.exists():
+        change_seq = PatientChangeCounter.advance()
+        patients.update(change_seq=change_seq, updated_at=timezone.now())
+        publish_change(change_seq, [])
@@ -0,0 +1,53 @@
+from .serializers import DECRYPT_ERROR, RESTRICTED, ENCRYPTED_FIELDS, role_projection
+from .utils import decrypt_many
+
+# Output columns (same names and order as PatientSerializer) and the lookups they are read from
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('assigned_doctor_name', 'assigned_doctor__username'),
+    ('name', 'name'),
+    ('diagnosis', 'diagnosis'),
+    ('age', 'age'),
+    ('contact', 'contact'),
+    ('date_added', 'date_added'),
+    ('anonymized_name', 'anonymized_name'),
+    ('anonymized_contact', 'anonymized_contact'),
+    ('assigned_doctor', 'assigned_doctor_id'),
+)
+
+def export_columns(roles):
+    """Column names visible to a caller, applying the same projection as PatientSerializer."""
+    hidden, _ = role_projection(roles)
+    return [name for name, _ in EXPORT_COLUMNS if name not in hidden]
+
+def iter_patient_records(queryset, roles, chunk_size=1000):
+    """
+    Yield one dict per patient for the caller's role.
+
+    Rows are read with a server-side iterator as plain tuples (no model instances);
+    restricted columns are never selected and the visible encrypted columns are
+    decrypted with one batch call per chunk, so memory stays bounded.
+    """
+    hidden, restricted = role_projection(roles)
+    columns = [(name, lookup) for name, lookup in EXPORT_COLUMNS if name not in hidden]
+    selected = [(name, lookup) for name, lookup in columns if name not in restricted]
+    encrypted = [i for i, (name, _) in enumerate(selected) if name in ENCRYPTED_FIELDS]
+
+    rows = queryset.values_list(*[lookup for _, lookup in selected]).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from _project_chunk(chunk, columns, selected, encrypted, restricted)
+            chunk = []
+    if chunk:
+        yield from _project_chunk(chunk, columns, selected, encrypted, restricted)
+
+def _project_chunk(chunk, columns, selected, encrypted, restricted):
+    plaintext = iter(decrypt_many([row[i] for row in chunk for i in encrypted], default=DECRYPT_ERROR))
+    for row in chunk:
+        values = list(row)
+        for i in encrypted:
+            values[i] = next(plaintext)
+        record = dict(zip((name for name, _ in selected), values))
+        yield {name: RESTRICTED if name in restricted else record[name] for name, _ in columns}
@@ -0,0 +1,202 @@
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from logs.audit import log_access
+from . import search
+from .changes import publish_change
+from .models import Patient, PatientChangeCounter, PatientSearchToken
+from .serializers import PatientImportRowSerializer
+from .utils import encrypt_many
+
+# Only this many row errors are returned in the summary (the count is always exact)
+MAX_REPORTED_ERRORS = 1000
+
+FIELDS = ('name', 'diagnosis', 'age', 'contact', 'assigned_doctor')
+
+
+def detect_format(filename, content_type=''):
+    filename = (filename or '').lower()
+    if filename.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type:
+        return 'ndjson'
+    return 'csv'
+
+def _decode_lines(stream, bad_lines):
+    """
+    Decode a binary stream line by line. A line that is not UTF-8 is decoded
+    with replacement characters and its number added to `bad_lines`, so one
+    bad byte costs one row instead of the rest of the file.
+    """
+    for line_number, raw in enumerate(stream, 1):
+        encoding = 'utf-8-sig' if line_number == 1 else 'utf-8'
+        try:
+            yield raw.decode(encoding)
+        except UnicodeDecodeError:
+            bad_lines.add(line_number)
+            yield raw.decode(encoding, errors='replace')
+
+def iter_records(stream, fmt):
+    """
+    Yield (row_number, record) from a binary stream of CSV (with a header row)
+    or NDJSON. Rows that cannot be decoded or parsed are yielded as (row_number, None).
+    """
+    bad_lines = set()
+    lines = _decode_lines(stream, bad_lines)
+
+    if fmt == 'ndjson':
+        for row_number, line in enumerate(lines, 1):
+            if row_number in bad_lines:
+                bad_lines.discard(row_number)
+                yield row_number, None
+                continue
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield row_number, record if isinstance(record, dict) else None
+        return
+
+    # Row 1 is the header. A quoted field may span lines, so a record is bad
+    # if any line the reader consumed for it was
+    reader = csv.DictReader(lines)
+    row_number = 1
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error:
+            record = None
+        row_number += 1
+        if bad_lines:
+            bad_lines.clear()
+            record = None
+        yield row_number, record
+
+def _resolve_doctors(values):
+    """Map assigned_doctor values (user id or username) to user ids with one query."""
+    ids = {v for v in values if v.isdigit()}
+    names = {v for v in values if not v.isdigit()}
+    users = User.objects.filter(pk__in=ids) | User.objects.filter(username__in=names)
+    resolved = {}
+    for pk, username in users.values_list('pk', 'username'):
+        resolved[str(pk)] = pk
+        resolved[username] = pk
+    return resolved
+
+
+class PatientImporter:
+    """
+    Imports patients in batches: validate each row, encrypt the batch across
+    worker processes, bulk_create it in one transaction and write one audit
+    entry per batch. Invalid rows are reported and skipped, never abort a batch.
+    """
+
+    def __init__(self, user=None, batch_size=1000, workers=None):
+        self.user = user
+        self.batch_size = batch_size
+        self.workers = workers if workers is not None else getattr(settings, 'ENCRYPTION_WORKERS', 4)
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, records):
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else 'inline'
+        try:
+            batch = []
+            for row in records:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self._import_batch(batch, pool)
+                    batch = []
+            if batch:
+                self._import_batch(batch, pool)
+        finally:
+            if pool != 'inline':
+                pool.shutdown()
+        return self.summary()
+
+    def summary(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+    def _error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def _import_batch(self, batch, pool):
+        valid = []
+        for row_number, record in batch:
+            if record is None:
+                self._error(row_number, {'non_field_errors': ['Malformed row.']})
+                continue
+            serializer = PatientImportRowSerializer(data={k: record.get(k) for k in FIELDS if k in record})
+            if serializer.is_valid():
+                valid.append((row_number, serializer.validated_data))
+            else:
+                self._error(row_number, serializer.errors)
+
+        doctors = _resolve_doctors({str(data['assigned_doctor']).strip() for _, data in valid if data.get('assigned_doctor')})
+        rows = []
+        for row_number, data in valid:
+            doctor = str(data.get('assigned_doctor') or '').strip()
+            if doctor and doctor not in doctors:
+                self._error(row_number, {'assigned_doctor': [f'Unknown user {doctor!r}.']})
+                continue
+            rows.append((data, doctors.get(doctor)))
+        if not rows:
+            return
+
+        # One parallel pass for both encrypted columns
+        ciphertexts = encrypt_many(
+            [data['name'] for data, _ in rows] + [data['diagnosis'] for data, _ in rows],
+            executor=pool,
+        )
+        names, diagnoses = ciphertexts[:len(rows)], ciphertexts[len(rows):]
+
+        patients = []
+        for (data, doctor_id), name, diagnosis in zip(rows, names, diagnoses):
+            patient = Patient(
+                name=name,
+                diagnosis=diagnosis,
+                age=data['age'],
+                contact=data['contact'],
+                assigned_doctor_id=doctor_id,
+                name_bidx=search.name_index(data['name']),
+                contact_bidx=search.contact_index(data['contact']),
+            )
+            patient.fill_anonymized_fields()
+            patients.append(patient)
+
+        with transaction.atomic():
+            # bulk_create bypasses Patient.save(), so stamp the delta sync sequence here
+            change_seq = PatientChangeCounter.advance()
+            for patient in patients:
+                patient.change_seq = change_seq
+            Patient.objects.bulk_create(patients, batch_size=500)
+            PatientSearchToken.objects.bulk_create(
+                (
+                    PatientSearchToken(patient_id=patient.pk, digest=digest)
+                    for patient, (data, _) in zip(patients, rows)
+                    for digest in search.name_token_digests(data['name'])
+                ),
+                batch_size=2000,
+            )
+
+        publish_change(change_seq, [patient.assigned_doctor_id for patient in patients])
+        self.created += len(patients)
+        first, last = batch[0][0], batch[-1][0]
+        log_access(
+            user=self.user,
+            action="IMPORT_PATIENTS",
+            details=f"Imported {len(patients)} patients from rows {first}-{last} ({len(batch) - len(patients)} rejected)"
+        )
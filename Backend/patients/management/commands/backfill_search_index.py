@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from patients import search
+from patients.cache import bump_table_version
+from patients.models import Patient, PatientSearchToken
+from patients.utils import decrypt_many
+
+
+class Command(BaseCommand):
+    help = 'Compute the blind search indexes (name/contact/name prefixes) for existing patients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help='Reindex every row, not only rows without an index')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        patients = Patient.objects.order_by('pk').only('pk', 'name', 'contact')
+        if not options['all']:
+            patients = patients.filter(name_bidx='')
+
+        last_pk = 0
+        done = 0
+        while True:
+            chunk = list(patients.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            names = decrypt_many([p.name for p in chunk], default='')
+            tokens = []
+            for patient, name in zip(chunk, names):
+                patient.name_bidx = search.name_index(name or '')
+                patient.contact_bidx = search.contact_index(patient.contact)
+                tokens.extend(
+                    PatientSearchToken(patient_id=patient.pk, digest=digest)
+                    for digest in search.name_token_digests(name or '')
+                )
+            with transaction.atomic():
+                Patient.objects.bulk_update(chunk, ['name_bidx', 'contact_bidx'])
+                PatientSearchToken.objects.filter(patient__in=chunk).delete()
+                PatientSearchToken.objects.bulk_create(tokens)
+            bump_table_version()  # bulk_update stamps no change_seq, but search results changed
+
+            last_pk = chunk[-1].pk
+            done += len(chunk)
+            self.stdout.write(f"Indexed {done} patients (up to id {last_pk})")
+
+        self.stdout.write(self.style.SUCCESS(f'Search index backfilled for {done} patients'))
@@ -0,0 +1,261 @@
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from logs.audit import get_sink
+from logs.models import AccessLog
+from patients.cache import response_cache
+from patients.models import Patient
+from patients.utils import decrypt_data
+from users import login as login_module
+from users.login import TokenBucketLimiter
+
+# (name, role, method, path, params, heavy). Paths and params are formatted with
+# the context built in resolve_context(); heavy scenarios only run with --heavy.
+SCENARIOS = (
+    ('patient-list', 'admin', 'get', '/api/patients/', {'page_size': 50}, False),
+    ('patient-list', 'doctor', 'get', '/api/patients/', {'page_size': 50}, False),
+    ('patient-list', 'receptionist', 'get', '/api/patients/', {'page_size': 50}, False),
+    ('patient-search', 'admin', 'get', '/api/patients/', {'search': '{search}'}, False),
+    ('patient-detail', 'admin', 'get', '/api/patients/{patient}/', {}, False),
+    ('patient-detail', 'doctor', 'get', '/api/patients/{doctor_patient}/', {}, False),
+    ('patient-changes', 'doctor', 'get', '/api/patients/changes/', {'since': '{doctor_token}'}, False),
+    ('doctor-directory', 'receptionist', 'get', '/api/users/doctors/', {}, False),
+    ('log-list', 'admin', 'get', '/api/logs/', {'page_size': 50}, False),
+    ('log-stats', 'admin', 'get', '/api/logs/stats/', {'granularity': 'day'}, False),
+    ('log-export-csv-day', 'admin', 'get', '/api/logs/export_csv/', {'start': '{yesterday}'}, False),
+    ('login', 'anonymous', 'post', '/api/auth/login/', {'username': '{doctor_username}', 'password': '{password}'}, False),
+    ('log-export-csv', 'admin', 'get', '/api/logs/export_csv/', {}, True),
+    ('patient-export', 'admin', 'get', '/api/patients/export/', {}, True),
+)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the API routes as each role and report throughput, p50/p95/p99 latency, query counts '
+        'and peak memory as JSON. Runs against users made by seed_synthetic, or with --fresh on a '
+        'throwaway test database seeded for the run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per scenario first')
+        parser.add_argument('--heavy', action='store_true', help='Also run the full exports')
+        parser.add_argument('--heavy-iterations', type=int, default=1)
+        parser.add_argument('--only', nargs='*', default=None, help='Scenario names to run')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the patient response cache between requests (default: measure the real work)')
+        parser.add_argument('--prefix', default='synth', help='Username prefix used by seed_synthetic')
+        parser.add_argument('--password', default='synthetic-pass-123')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument('--compare', help='A previous JSON report to print p95/throughput changes against')
+        parser.add_argument('--fresh', action='store_true', help='Seed and use a throwaway test database')
+        parser.add_argument('--patients', type=int, default=10000, help='With --fresh: patients to seed')
+        parser.add_argument('--doctors', type=int, default=100, help='With --fresh: doctors to seed')
+        parser.add_argument('--logs', type=int, default=100000, help='With --fresh: audit rows to seed')
+        parser.add_argument('--seed', type=int, default=42, help='With --fresh: seed_synthetic --seed')
+
+    def handle(self, *args, **options):
+        if not options['fresh']:
+            # The test client sends Host: testserver, which setup_test_environment() allows under --fresh
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                return self.run(options)
+        setup_test_environment()
+        test_file = None
+        if connection.vendor == 'sqlite':
+            # The audit sink thread writes while requests read and write. Use a file, not the
+            # shared-cache in-memory default ("table is locked"), and take the write lock when a
+            # transaction begins, since SQLite cannot wait to upgrade a read lock ("database is locked")
+            fd, test_file = tempfile.mkstemp(prefix='benchmark-', suffix='.sqlite3')
+            os.close(fd)
+            connection.settings_dict['TEST']['NAME'] = test_file
+            connection.settings_dict['OPTIONS'].update(transaction_mode='IMMEDIATE', timeout=30)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            call_command(
+                'seed_synthetic', patients=options['patients'], doctors=options['doctors'], logs=options['logs'],
+                seed=options['seed'], prefix=options['prefix'], password=options['password'], stdout=self.stderr,
+            )
+            return self.run(options)
+        finally:
+            # Write the audit entries still queued while their table exists
+            get_sink().shutdown()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if test_file and os.path.exists(test_file):
+                os.remove(test_file)
+
+    def run(self, options):
+        clients = self.login_clients(options['prefix'])
+        context = self.resolve_context(clients, options)
+        scenarios = [
+            s for s in SCENARIOS
+            if (options['heavy'] or not s[5]) and (options['only'] is None or s[0] in options['only'])
+        ]
+
+        # Open the login token buckets, or the login scenario would measure 429s
+        unlimited = TokenBucketLimiter(1e9, 1e9)
+        results = []
+        with mock.patch.object(login_module, 'ip_limiter', unlimited), \
+                mock.patch.object(login_module, 'username_limiter', unlimited):
+            for name, role, method, path, params, heavy in scenarios:
+                iterations = options['heavy_iterations'] if heavy else options['iterations']
+                results.append(self.measure(
+                    name, role, clients[role], method, path.format(**context),
+                    {key: value.format(**context) if isinstance(value, str) else value for key, value in params.items()},
+                    iterations, 0 if heavy else options['warmup'], options['warm_cache'],
+                ))
+
+        report = {
+            'commit': self.git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'patients': Patient.objects.count(),
+                'audit_rows': AccessLog.objects.count(),
+                'users': User.objects.count(),
+            },
+            'options': {key: options[key] for key in ('iterations', 'warmup', 'heavy', 'warm_cache')},
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'scenarios': results,
+        }
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+        else:
+            self.stdout.write(text)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def login_clients(self, prefix):
+        clients = {'anonymous': Client()}
+        for role in ('admin', 'doctor', 'receptionist'):
+            user = User.objects.filter(username=f'{prefix}-{role}-0').first()
+            if user is None:
+                raise CommandError(f'No user {prefix}-{role}-0: run seed_synthetic first, or pass --fresh.')
+            clients[role] = Client()
+            clients[role].force_login(user)
+        return clients
+
+    def resolve_context(self, clients, options):
+        doctor = User.objects.get(username=f"{options['prefix']}-doctor-0")
+        patient = Patient.objects.order_by('-id').first()
+        doctor_patient = Patient.objects.filter(assigned_doctor=doctor).order_by('-id').first()
+        if patient is None or doctor_patient is None:
+            raise CommandError('The database has no patients assigned to the benchmark doctor.')
+        return {
+            'patient': patient.pk,
+            'doctor_patient': doctor_patient.pk,
+            # A surname that exists, so the search has matches to decrypt
+            'search': decrypt_data(patient.name).split()[-1],
+            'doctor_token': clients['doctor'].get('/api/patients/changes/').json()['token'],
+            'doctor_username': doctor.username,
+            'password': options['password'],
+            'yesterday': (timezone.now() - datetime.timedelta(days=1)).isoformat(),
+        }
+
+    def request(self, client, method, path, params, warm_cache):
+        if not warm_cache:
+            response_cache.clear()
+        if method == 'post':
+            response = client.post(path, params, content_type='application/json')
+        else:
+            response = client.get(path, params)
+        # Streamed responses do their work while the body is read
+        size = len(response.getvalue()) if response.streaming else len(response.content)
+        return response.status_code, size
+
+    def measure(self, name, role, client, method, path, params, iterations, warmup, warm_cache):
+        for _ in range(warmup):
+            self.request(client, method, path, params, warm_cache)
+
+        latencies, queries, statuses, size = [], [], {}, 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                status, size = self.request(client, method, path, params, warm_cache)
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries.append(len(ctx.captured_queries))
+            statuses[status] = statuses.get(status, 0) + 1
+        elapsed = time.perf_counter() - started
+
+        # One more request under tracemalloc (which slows Python down, so it is not timed)
+        tracemalloc.start()
+        try:
+            self.request(client, method, path, params, warm_cache)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.stderr.write(f'  {name:<20} {role:<13} p95 {percentile(latencies, 0.95):9.1f} ms')
+        return {
+            'name': name,
+            'role': role,
+            'method': method.upper(),
+            'path': path,
+            'requests': iterations,
+            'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+            'errors': sum(count for code, count in statuses.items() if code >= 400),
+            'throughput_rps': round(iterations / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50), 2),
+                'p95': round(percentile(latencies, 0.95), 2),
+                'p99': round(percentile(latencies, 0.99), 2),
+                'mean': round(statistics.fmean(latencies), 2),
+                'max': round(max(latencies), 2),
+            },
+            'queries': {'mean': round(statistics.fmean(queries), 2), 'max': max(queries)},
+            'response_bytes': size,
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, path, results):
+        """Print p95 latency and throughput against a previous report (to stderr, stdout may be the JSON)."""
+        with open(path) as f:
+            baseline = json.load(f)
+        previous = {(s['name'], s['role']): s for s in baseline['scenarios']}
+        self.stderr.write(f"Compared with {baseline.get('commit') or path}:")
+        for result in results:
+            before = previous.get((result['name'], result['role']))
+            if before is None:
+                continue
+            p95, old_p95 = result['latency_ms']['p95'], before['latency_ms']['p95']
+            change = (p95 - old_p95) / old_p95 * 100 if old_p95 else 0.0
+            self.stderr.write(
+                f"  {result['name']:<20} {result['role']:<13} p95 {old_p95:9.1f} -> {p95:9.1f} ms ({change:+.0f}%)"
+                f"  rps {before['throughput_rps']} -> {result['throughput_rps']}"
+            )
@@ -0,0 +1,41 @@
+import time
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from patients.utils import encrypt_data, decrypt_data, decrypt_many
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark of per-row patient field decryption (uncached vs cached vs batched)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Number of patient rows to simulate')
+        parser.add_argument('--executor', default='thread', choices=['inline', 'thread', 'process'])
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        # Two encrypted columns per patient row (name + diagnosis)
+        tokens = [encrypt_data(f"Patient {i} / diagnosis {i}") for i in range(rows * 2)]
+
+        def uncached(token):
+            # What utils.decrypt_data used to do: parse the key on every call
+            return Fernet(settings.ENCRYPTION_KEY.encode()).decrypt(token.encode()).decode()
+
+        results = [
+            ('uncached (new Fernet per call)', self._time(lambda: [uncached(t) for t in tokens])),
+            ('cached engine, per-row calls', self._time(lambda: [decrypt_data(t) for t in tokens])),
+            ('decrypt_many, inline', self._time(lambda: decrypt_many(tokens, executor='inline'))),
+            (f"decrypt_many, {options['executor']} pool",
+             self._time(lambda: decrypt_many(tokens, executor=options['executor']))),
+        ]
+
+        baseline = results[0][1]
+        self.stdout.write(f"{rows} rows, {len(tokens)} decrypts")
+        for label, elapsed in results:
+            per_row = elapsed / rows * 1e6
+            self.stdout.write(f"  {label:<34} {elapsed * 1000:9.1f} ms  {per_row:8.2f} us/row  x{baseline / elapsed:.2f}")
+
+    def _time(self, fn):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
@@ -0,0 +1,19 @@
+import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from patients.changes import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Delete delta sync tombstones older than PATIENT_TOMBSTONE_RETENTION_DAYS (older change tokens stop working)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Override PATIENT_TOMBSTONE_RETENTION_DAYS')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else settings.PATIENT_TOMBSTONE_RETENTION_DAYS
+        with transaction.atomic():
+            count = prune_tombstones(timezone.now() - datetime.timedelta(days=days))
+        self.stdout.write(self.style.SUCCESS(f'Pruned {count} tombstones older than {days} days'))
@@ -0,0 +1,100 @@
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from patients.models import Patient, KeyRotationCheckpoint
+from patients.utils import rotate_many
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-encrypt patient name/diagnosis under the primary ENCRYPTION_KEY, online and resumable. '
+        'Add the previous key to ENCRYPTION_OLD_KEYS before running.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows per transaction')
+        parser.add_argument('--workers', type=int, default=settings.ENCRYPTION_WORKERS, help='Encryption worker processes')
+        parser.add_argument('--max-rate', type=float, default=0, help='Throttle to this many rows/second (0 = unthrottled)')
+        parser.add_argument('--restart', action='store_true', help='Ignore any checkpoint and start from the first row')
+        parser.add_argument('--status', action='store_true', help='Show the checkpoint and exit')
+
+    def handle(self, *args, **options):
+        if not settings.ENCRYPTION_OLD_KEYS and not options['status']:
+            raise CommandError('ENCRYPTION_OLD_KEYS is empty: there is nothing to rotate from.')
+
+        # The checkpoint belongs to the key being rotated *to*, never store the key itself
+        key_id = hashlib.sha256(settings.ENCRYPTION_KEY.encode()).hexdigest()[:16]
+        checkpoint, _ = KeyRotationCheckpoint.objects.get_or_create(key_id=key_id)
+        if options['status']:
+            state = f'finished {checkpoint.finished_at}' if checkpoint.finished_at else 'in progress'
+            self.stdout.write(f'{checkpoint} - {checkpoint.rows_rotated} rows rotated, {state}')
+            return
+        if options['restart']:
+            checkpoint.last_pk = checkpoint.rows_rotated = 0
+            checkpoint.finished_at = None
+            checkpoint.save()
+        elif checkpoint.last_pk:
+            self.stdout.write(f'Resuming after patient {checkpoint.last_pk}')
+
+        pool = ProcessPoolExecutor(max_workers=options['workers']) if options['workers'] > 1 else 'inline'
+        try:
+            self.rotate(checkpoint, pool, options['chunk_size'], options['max_rate'])
+        finally:
+            if pool != 'inline':
+                pool.shutdown()
+
+    def rotate(self, checkpoint, pool, chunk_size, max_rate):
+        started = time.perf_counter()
+        rotated_this_run = 0
+        skipped = 0
+        while True:
+            chunk_start = time.perf_counter()
+            rows = list(
+                Patient.objects.filter(pk__gt=checkpoint.last_pk)
+                .order_by('pk')
+                .values_list('pk', 'name', 'diagnosis')[:chunk_size]
+            )
+            if not rows:
+                break
+
+            tokens = rotate_many([name for _, name, _ in rows] + [diagnosis for _, _, diagnosis in rows], executor=pool)
+            names, diagnoses = tokens[:len(rows)], tokens[len(rows):]
+
+            with transaction.atomic():
+                for (pk, old_name, old_diagnosis), name, diagnosis in zip(rows, names, diagnoses):
+                    if (old_name and name is None) or (old_diagnosis and diagnosis is None):
+                        self.stderr.write(f'Patient {pk}: no configured key can decrypt this row, left as is')
+                        skipped += 1
+                        continue
+                    # Compare-and-set: a row edited by live traffic meanwhile is already under the new key
+                    updated = Patient.objects.filter(pk=pk, name=old_name, diagnosis=old_diagnosis).update(
+                        name=name, diagnosis=diagnosis
+                    )
+                    rotated_this_run += updated
+                    checkpoint.rows_rotated += updated
+                checkpoint.last_pk = rows[-1][0]
+                checkpoint.save(update_fields=['last_pk', 'rows_rotated', 'updated_at'])
+
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'Rotated up to patient {checkpoint.last_pk}: {checkpoint.rows_rotated} rows total, '
+                f'{rotated_this_run / elapsed:,.0f} rows/s'
+            )
+
+            # Throttle so live traffic keeps getting the database
+            if max_rate:
+                min_duration = len(rows) / max_rate
+                spent = time.perf_counter() - chunk_start
+                if spent < min_duration:
+                    time.sleep(min_duration - spent)
+
+        checkpoint.finished_at = timezone.now()
+        checkpoint.save(update_fields=['finished_at', 'updated_at'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Key rotation finished: {checkpoint.rows_rotated} rows under the primary key ({skipped} unreadable rows skipped). '
+            'The old key can be removed from ENCRYPTION_OLD_KEYS.'
+        ))
@@ -0,0 +1,171 @@
+import datetime
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Group
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from logs.chain import seal_pending
+from logs.models import AccessLog
+from logs.rollups import refresh_rollups
+from patients import search
+from patients.models import Patient, PatientChangeCounter, PatientSearchToken
+from patients.utils import encrypt_many
+from users.backends import invalidate_cached_user
+from users.directory import invalidate_doctor_directory
+
+FIRST_NAMES = (
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'Ahmed', 'Fatima', 'Wei', 'Mei', 'Carlos', 'Sofia', 'Ivan', 'Olga', 'Kwame', 'Amara',
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Khan', 'Ali',
+    'Chen', 'Wang', 'Rodriguez', 'Martinez', 'Petrov', 'Ivanova', 'Mensah', 'Okafor', 'Nguyen', 'Kim',
+)
+DIAGNOSES = (
+    'Hypertension', 'Type 2 diabetes', 'Asthma', 'Migraine', 'Influenza', 'Bronchitis',
+    'Anemia', 'Hypothyroidism', 'Gastritis', 'Osteoarthritis', 'Allergic rhinitis', 'Back pain',
+)
+# (action, relative frequency) of the synthetic audit trail
+AUDIT_ACTIONS = (
+    ('VIEW_PATIENT', 60), ('USER_LOGIN', 12), ('USER_LOGOUT', 8), ('UPDATE_PATIENT_FULL', 6),
+    ('UPDATE_PATIENT_DOCTOR', 5), ('CREATE_PATIENT', 4), ('USER_LOGIN_FAILED', 3), ('EXPORT_PATIENTS', 2),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic users, encrypted patients and audit log rows with bulk inserts, '
+        'e.g. --patients 100000 --doctors 300 --logs 10000000. The same --seed gives the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100000)
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--receptionists', type=int, default=20)
+        parser.add_argument('--admins', type=int, default=2)
+        parser.add_argument('--logs', type=int, default=1000000, help='Audit log rows')
+        parser.add_argument('--days', type=int, default=365, help='Audit rows are spread over this many days before now')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=None, help='Encryption processes (default ENCRYPTION_WORKERS)')
+        parser.add_argument('--prefix', default='synth', help='Username prefix; existing users with it are reused')
+        parser.add_argument('--password', default='synthetic-pass-123', help='Password of every synthetic user')
+        parser.add_argument('--no-seal', action='store_true', help='Skip hash-chaining and rolling up the audit rows')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        started = time.perf_counter()
+        users = self.seed_users(options['prefix'], options['password'], {
+            'Admin': options['admins'], 'Doctor': options['doctors'], 'Receptionist': options['receptionists'],
+        })
+        self.report('users', sum(len(ids) for ids in users.values()), started)
+
+        started = time.perf_counter()
+        workers = options['workers'] if options['workers'] is not None else getattr(settings, 'ENCRYPTION_WORKERS', 4)
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else 'inline'
+        try:
+            for offset in range(0, options['patients'], batch_size):
+                self.seed_patients(rng, min(batch_size, options['patients'] - offset), users['Doctor'], pool)
+        finally:
+            if pool != 'inline':
+                pool.shutdown()
+        self.report('patients', options['patients'], started)
+
+        started = time.perf_counter()
+        all_users = [pk for ids in users.values() for pk in ids]
+        end = timezone.now()
+        start = end - datetime.timedelta(days=options['days'])
+        step = (end - start) / max(options['logs'], 1)
+        for offset in range(0, options['logs'], batch_size):
+            count = min(batch_size, options['logs'] - offset)
+            self.seed_logs(rng, [start + step * (offset + i) for i in range(count)], all_users)
+        self.report('audit log rows', options['logs'], started)
+
+        if options['logs'] and not options['no_seal']:
+            started = time.perf_counter()
+            seal_pending()
+            refresh_rollups()
+            self.report('audit rows chained and rolled up', options['logs'], started)
+
+    def report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        rate = f' ({count / elapsed:,.0f}/s)' if elapsed and count else ''
+        self.stdout.write(f'{label:<34} {count:>12,} in {elapsed:8.1f}s{rate}')
+
+    def seed_users(self, prefix, password, counts):
+        """Create {prefix}-{role}-{n} users (all sharing one password hash) and return role -> user ids."""
+        encoded = make_password(password)  # hashed once, not per user
+        ids = {}
+        for role, count in counts.items():
+            usernames = [f'{prefix}-{role.lower()}-{n}' for n in range(count)]
+            existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+            User.objects.bulk_create(
+                User(username=name, password=encoded, is_staff=(role == 'Admin'))
+                for name in usernames if name not in existing
+            )
+            ids[role] = list(User.objects.filter(username__in=usernames).order_by('id').values_list('id', flat=True))
+            group = Group.objects.get(name=role)
+            User.groups.through.objects.bulk_create(
+                (User.groups.through(user_id=pk, group_id=group.pk) for pk in ids[role]),
+                ignore_conflicts=True,
+            )
+        # bulk_create and the through-model inserts send no signals
+        for pk in (pk for role_ids in ids.values() for pk in role_ids):
+            invalidate_cached_user(pk)
+        invalidate_doctor_directory()
+        return ids
+
+    def seed_patients(self, rng, count, doctor_ids, pool):
+        names = [f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}' for _ in range(count)]
+        diagnoses = [rng.choice(DIAGNOSES) for _ in range(count)]
+        contacts = [f'555{rng.randrange(10 ** 7):07d}' for _ in range(count)]
+        # About one patient in ten is not assigned to a doctor
+        doctors = [rng.choice(doctor_ids) if doctor_ids and rng.random() >= 0.1 else None for _ in range(count)]
+        anonymized = [f'Patient-{rng.getrandbits(32):08X}' for _ in range(count)]
+
+        ciphertexts = encrypt_many(names + diagnoses, executor=pool)
+        with transaction.atomic():
+            change_seq = PatientChangeCounter.advance()
+            patients = []
+            for i in range(count):
+                patient = Patient(
+                    name=ciphertexts[i],
+                    diagnosis=ciphertexts[count + i],
+                    age=rng.randint(1, 99),
+                    contact=contacts[i],
+                    assigned_doctor_id=doctors[i],
+                    anonymized_name=anonymized[i],
+                    name_bidx=search.name_index(names[i]),
+                    contact_bidx=search.contact_index(contacts[i]),
+                    change_seq=change_seq,
+                )
+                patient.fill_anonymized_fields()
+                patients.append(patient)
+            Patient.objects.bulk_create(patients, batch_size=1000)
+            PatientSearchToken.objects.bulk_create(
+                (
+                    PatientSearchToken(patient_id=patient.pk, digest=digest)
+                    for patient, name in zip(patients, names)
+                    for digest in search.name_token_digests(name)
+                ),
+                batch_size=5000,
+            )
+
+    def seed_logs(self, rng, timestamps, user_ids):
+        actions, weights = zip(*AUDIT_ACTIONS)
+        rows = []
+        for moment, action in zip(timestamps, rng.choices(actions, weights, k=len(timestamps))):
+            user_id = rng.choice(user_ids) if user_ids and action != 'USER_LOGIN_FAILED' else None
+            rows.append(AccessLog(
+                user_id=user_id,
+                action=action,
+                details=f'Synthetic {action.lower()} #{rng.randrange(10 ** 6)}',
+                timestamp=moment,
+            ))
+        AccessLog.objects.bulk_create(rows, batch_size=5000)
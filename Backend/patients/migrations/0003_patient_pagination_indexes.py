@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0002_rename_contact_info_patient_contact_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['date_added', 'id'], name='patient_added_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['assigned_doctor', 'date_added', 'id'], name='patient_doctor_added_idx'),
+        ),
+    ]
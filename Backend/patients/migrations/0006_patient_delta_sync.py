@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_counter(apps, schema_editor):
+    apps.get_model('patients', 'PatientChangeCounter').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_key_rotation_checkpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientChangeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+                ('pruned_through', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PatientTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('change_seq', models.BigIntegerField()),
+                ('removed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['change_seq'], name='patient_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['assigned_doctor', 'change_seq'], name='patient_doctor_change_idx'),
+        ),
+        migrations.AddField(
+            model_name='patienttombstone',
+            name='doctor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='patienttombstone',
+            index=models.Index(fields=['doctor', 'change_seq'], name='tombstone_doctor_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patienttombstone',
+            index=models.Index(fields=['change_seq'], name='tombstone_change_seq_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='patienttombstone',
+            constraint=models.UniqueConstraint(fields=('patient_id', 'doctor'), name='patient_tombstone_unique'),
+        ),
+        migrations.RunPython(create_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_patient_delta_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientchangecounter',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .utils import encrypt_data, decrypt_data
+from . import search
 
 import uuid
 
@@ -19,7 +22,25 @@ class Patient(models.Model):
     anonymized_name = models.CharField(max_length=100, blank=True)
     anonymized_contact = models.CharField(max_length=100, blank=True)
 
-    def save(self, *args, **kwargs):
+    # Blind indexes (keyed HMACs, see search.py) so encrypted/normalized values can be matched exactly
+    name_bidx = models.CharField(max_length=32, blank=True, db_index=True)
+    contact_bidx = models.CharField(max_length=32, blank=True, db_index=True)
+
+    # Delta sync (see changes.py): every write stamps the row with the next change sequence value
+    updated_at = models.DateTimeField(auto_now=True)
+    change_seq = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination: (date_added, id) for everyone, scoped per doctor for Doctors
+            models.Index(fields=['date_added', 'id'], name='patient_added_id_idx'),
+            models.Index(fields=['assigned_doctor', 'date_added', 'id'], name='patient_doctor_added_idx'),
+            # Delta sync: rows changed since a token, for everyone and per doctor
+            models.Index(fields=['change_seq'], name='patient_change_seq_idx'),
+            models.Index(fields=['assigned_doctor', 'change_seq'], name='patient_doctor_change_idx'),
+        ]
+
+    def fill_anonymized_fields(self):
         # Auto-generate anonymized data if missing
         if not self.anonymized_name:
             self.anonymized_name = f"Patient-{uuid.uuid4().hex[:8].upper()}"
@@ -31,7 +52,177 @@ class Patient(models.Model):
             else:
                 self.anonymized_contact = "******"
 
-        super().save(*args, **kwargs)
+    def save(self, *args, **kwargs):
+        self.fill_anonymized_fields()
+
+        # Keep the blind indexes in step with name/contact
+        update_fields = kwargs.get('update_fields')
+        reindex_name = self._name_changed() and (update_fields is None or 'name' in update_fields)
+        if reindex_name:
+            plain_name = self.__dict__.pop('_plain_name', None)
+            if plain_name is None:
+                try:
+                    plain_name = decrypt_data(self.name) or ''
+                except Exception:
+                    plain_name = ''
+            self.name_bidx = search.name_index(plain_name)
+        if 'contact' in self.__dict__:
+            self.contact_bidx = search.contact_index(self.contact)
+        if update_fields is not None:
+            extra = {'change_seq', 'updated_at'} | ({'name_bidx'} if reindex_name else set())
+            if 'contact' in update_fields:
+                extra.add('contact_bidx')
+            kwargs['update_fields'] = set(update_fields) | extra
+
+        # Drop any plaintext cached by utils.decrypt_fields; the ciphertext may have changed
+        self.__dict__.pop('_decrypted', None)
+
+        adding = self._state.adding
+        moved_from = None
+        if not adding and (update_fields is None or {'assigned_doctor', 'assigned_doctor_id'} & set(update_fields)):
+            moved_from = self.__dict__.get('_loaded_values', {}).get('assigned_doctor_id')
+            if moved_from == self.assigned_doctor_id:
+                moved_from = None
+        # Read by the post_save handler in changes.py, which also notifies that doctor's event streams
+        self._moved_from = moved_from
+
+        # One transaction, so the change sequence value commits together with the row
+        with transaction.atomic():
+            self.change_seq = PatientChangeCounter.advance()
+            super().save(*args, **kwargs)
+
+            if moved_from is not None:
+                PatientTombstone.record([(self.pk, moved_from)], self.change_seq)
+            if reindex_name:
+                if not adding:
+                    self.search_tokens.all().delete()
+                PatientSearchToken.objects.bulk_create(
+                    PatientSearchToken(patient=self, digest=digest)
+                    for digest in search.name_token_digests(plain_name)
+                )
+        self._indexed_name = self.__dict__.get('name')
+        self._snapshot()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ciphertext the stored blind index was computed from
+        if instance.__dict__.get('name_bidx'):
+            instance._indexed_name = instance.__dict__.get('name')
+        instance._snapshot()
+        return instance
+
+    def _snapshot(self):
+        # Column values as last loaded from / written to the database, for dirty_fields()
+        self._loaded_values = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields if field.attname in self.__dict__
+        }
+
+    def dirty_fields(self):
+        """
+        Names of the loaded columns whose value differs from the database row,
+        suitable for save(update_fields=...). None for an unsaved instance.
+        """
+        loaded = self.__dict__.get('_loaded_values')
+        if self._state.adding or loaded is None:
+            return None
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in loaded and self.__dict__.get(field.attname) != loaded[field.attname]
+        ]
+
+    def set_plain_name(self, plain_name):
+        """Give save() the plaintext of a freshly encrypted name so it does not have to decrypt it again."""
+        self._plain_name = plain_name
+
+    def _name_changed(self):
+        if 'name' not in self.__dict__:
+            return False  # deferred, not being saved
+        return self.name != self.__dict__.get('_indexed_name')
 
     def __str__(self):
         return f"Patient {self.id} ({self.anonymized_name})"
+
+
+class PatientSearchToken(models.Model):
+    """Blind-indexed name prefixes of a patient, for token/prefix search without decrypting."""
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='search_tokens')
+    digest = models.CharField(max_length=32)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['digest', 'patient'], name='patient_search_digest_idx'),
+        ]
+
+
+class PatientChangeCounter(models.Model):
+    """
+    The global patient change sequence (a single row). advance() increments it
+    inside the writer's transaction; the row lock is held until commit, so values
+    become visible in order and a reader never skips one that commits later.
+    It is also the version of the cached patient responses (patients.cache).
+    """
+    value = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+    # Tokens older than this may have missed pruned tombstones (see prune_patient_tombstones)
+    pruned_through = models.BigIntegerField(default=0)
+
+    @classmethod
+    def advance(cls):
+        """Allocate the next sequence value. Call inside a transaction that also does the write."""
+        if not cls.objects.filter(pk=1).update(value=F('value') + 1, changed_at=timezone.now()):
+            cls.objects.get_or_create(pk=1)
+            cls.objects.filter(pk=1).update(value=F('value') + 1, changed_at=timezone.now())
+        return cls.objects.values_list('value', flat=True).get(pk=1)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list('value', 'pruned_through').first() or (0, 0)
+
+
+class PatientTombstone(models.Model):
+    """
+    A patient that left a doctor's visible set: reassigned away from `doctor`, or
+    deleted (deleted=True, which also removes it for Admins and Receptionists).
+    One row per (patient, doctor), moved forward on every new removal.
+    """
+    patient_id = models.BigIntegerField()
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    deleted = models.BooleanField(default=False)
+    change_seq = models.BigIntegerField()
+    removed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient_id', 'doctor'], name='patient_tombstone_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['doctor', 'change_seq'], name='tombstone_doctor_change_idx'),
+            models.Index(fields=['change_seq'], name='tombstone_change_seq_idx'),
+        ]
+
+    @classmethod
+    def record(cls, removals, change_seq, deleted=False):
+        """Upsert tombstones for (patient id, doctor id) pairs."""
+        cls.objects.bulk_create(
+            [cls(patient_id=patient_id, doctor_id=doctor_id, deleted=deleted, change_seq=change_seq)
+             for patient_id, doctor_id in removals],
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['patient_id', 'doctor'],
+            update_fields=['deleted', 'change_seq', 'removed_at'],
+        )
+
+
+class KeyRotationCheckpoint(models.Model):
+    """Progress of rotate_patient_keys towards one primary key, so the job can resume."""
+    key_id = models.CharField(max_length=16, unique=True)  # fingerprint of the target primary key
+    last_pk = models.BigIntegerField(default=0)
+    rows_rotated = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Key {self.key_id}: up to patient {self.last_pk}"
@@ -0,0 +1,71 @@
+import hashlib
+import hmac
+import re
+import unicodedata
+from django.conf import settings
+from django.db.models import Count, Q
+
+# Shortest prefix of a name token that is indexed (and can be searched for)
+MIN_PREFIX = 3
+
+
+def normalize(text):
+    """Case- and accent-insensitive form of a name: 'José  SMITH-Jones' -> 'jose smith jones'."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    return ' '.join(re.findall(r'\w+', text))
+
+def normalize_contact(contact):
+    """Phone numbers are compared on their digits only: '(555) 010-1234' -> '5550101234'."""
+    return re.sub(r'\D', '', contact or '')
+
+def blind_index(kind, value):
+    """
+    Keyed HMAC of a normalized value. The key is separate from the encryption key,
+    so the index can be matched without ever being reversible to plaintext.
+    """
+    message = f"{kind}:{value}".encode()
+    return hmac.new(settings.BLIND_INDEX_KEY.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+def name_index(name):
+    normalized = normalize(name)
+    return blind_index('name', normalized) if normalized else ''
+
+def contact_index(contact):
+    digits = normalize_contact(contact)
+    return blind_index('contact', digits) if digits else ''
+
+def name_token_digests(name):
+    """Digests of every prefix (MIN_PREFIX chars or longer) of every word in the name."""
+    digests = set()
+    for token in normalize(name).split():
+        if len(token) < MIN_PREFIX:
+            digests.add(blind_index('prefix', token))
+        for end in range(MIN_PREFIX, len(token) + 1):
+            digests.add(blind_index('prefix', token[:end]))
+    return digests
+
+def search_q(query):
+    """
+    Q object matching patients for a free-text search, using only indexed lookups:
+    exact full name, exact contact number, or every query word matching the start
+    of some word of the name.
+    """
+    from .models import PatientSearchToken
+
+    condition = Q(pk__in=[])
+    digits = normalize_contact(query)
+    if digits and len(digits) == len(re.sub(r'[\s()+.-]', '', query)):
+        condition |= Q(contact_bidx=contact_index(query))
+    if normalize(query):
+        condition |= Q(name_bidx=name_index(query))
+        digests = {blind_index('prefix', token) for token in normalize(query).split()}
+        matching = (
+            PatientSearchToken.objects.filter(digest__in=digests)
+            .values('patient')
+            .annotate(matched=Count('digest', distinct=True))
+            .filter(matched=len(digests))
+            .values('patient')
+        )
+        condition |= Q(pk__in=matching)
+    return condition
@@ -1,26 +1,79 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Patient
-from .utils import decrypt_data
+from .utils import decrypt_fields, get_decrypted
 from users.serializers import UserSerializer
+from users.roles import ADMIN, DOCTOR, RECEPTIONIST, get_roles
+
+DECRYPT_ERROR = "Error Decrypting"
+RESTRICTED = "RESTRICTED"
+ENCRYPTED_FIELDS = ('name', 'diagnosis')
+
+def role_projection(roles):
+    """
+    What a caller with `roles` may see of a patient, as (hidden, restricted):
+    hidden fields are left out, restricted ones are replaced by "RESTRICTED".
+    Returns None for users with no patient role.
+    Shared by PatientSerializer and the streaming export (exporter.py).
+    """
+    if ADMIN in roles:
+        # Admin sees EVERYTHING
+        return (), ()
+    if DOCTOR in roles:
+        # Doctor sees Anonymized Data + Diagnosis, MUST NOT see real name or contact
+        return ('name', 'contact'), ()
+    if RECEPTIONIST in roles:
+        # Receptionist sees Real Name/Contact but NO Diagnosis
+        return (), ('diagnosis',)
+    return None
+
+def decrypted_fields(roles):
+    """Encrypted columns the caller will actually see, so only those get decrypted."""
+    projection = role_projection(roles)
+    if projection is None:
+        return ()
+    hidden, restricted = projection
+    return tuple(f for f in ENCRYPTED_FIELDS if f not in hidden and f not in restricted)
+
+class PatientListSerializer(serializers.ListSerializer):
+    """
+    Decrypts the visible encrypted columns for the whole list in one batch
+    before the per-row to_representation runs, instead of per row.
+    """
+    def to_representation(self, data):
+        iterable = data.all() if hasattr(data, 'all') else data
+        fields = self.child.get_decrypted_fields()
+        instances = decrypt_fields(iterable, fields, default=DECRYPT_ERROR)
+        return [self.child.to_representation(item) for item in instances]
 
 class PatientSerializer(serializers.ModelSerializer):
     assigned_doctor_name = serializers.ReadOnlyField(source='assigned_doctor.username')
 
     class Meta:
         model = Patient
-        fields = '__all__'
+        exclude = ('name_bidx', 'contact_bidx')  # blind indexes are internal
+        read_only_fields = ('change_seq', 'updated_at')  # stamped by Patient.save()
+        list_serializer_class = PatientListSerializer
         extra_kwargs = {
             'diagnosis': {'required': False, 'allow_blank': True},  # Allow empty for Receptionist updates
         }
-    
+
+    def get_roles(self):
+        """Caller's roles, resolved once per request by the viewset (see RoleContextMixin)."""
+        if 'roles' in self.context:
+            return self.context['roles']
+        request = self.context.get('request')
+        return get_roles(request.user) if request else frozenset()
+
+    def get_decrypted_fields(self):
+        return decrypted_fields(self.get_roles())
+
     def validate(self, data):
         """
         Custom validation to ensure diagnosis is provided for Admin/Doctor,
         but allow Receptionist to skip it during updates.
         """
-        request = self.context.get('request')
-        is_receptionist = request and request.user.groups.filter(name='Receptionist').exists()
+        is_receptionist = RECEPTIONIST in self.get_roles()
         
         # If it's an update and user is Receptionist, allow empty/missing diagnosis
         if self.instance and is_receptionist:
@@ -40,41 +93,21 @@ class PatientSerializer(serializers.ModelSerializer):
         if not request:
             return ret
 
-        user = request.user
-        is_admin = user.groups.filter(name='Admin').exists()
-        is_doctor = user.groups.filter(name='Doctor').exists()
-        is_receptionist = user.groups.filter(name='Receptionist').exists()
-
-        # Decrypt data
-        try:
-            real_name = decrypt_data(instance.name)
-            real_diagnosis = decrypt_data(instance.diagnosis)
-        except Exception:
-            real_name = "Error Decrypting"
-            real_diagnosis = "Error Decrypting"
+        projection = role_projection(self.get_roles())
+        if projection is None:
+            return ret
+        hidden, restricted = projection
 
         # Common fields are already in ret (age, date_added, assigned_doctor, anonymized_*)
-        # We just need to override/remove sensitive ones based on role.
+        # We just need to decrypt the visible ones and remove/mask sensitive ones based on role.
+        # (Decryption is already done in bulk when serializing a list.)
+        for field in decrypted_fields(self.get_roles()):
+            ret[field] = get_decrypted(instance, field, default=DECRYPT_ERROR)
+        for field in hidden:
+            ret.pop(field, None)
+        for field in restricted:
+            ret[field] = RESTRICTED
 
-        if is_admin:
-            # Admin sees EVERYTHING
-            ret['name'] = real_name
-            ret['diagnosis'] = real_diagnosis
-            # contact is already there
-        
-        elif is_doctor:
-            # Doctor sees Anonymized Data + Diagnosis
-            # MUST NOT see real name or contact
-            ret.pop('name', None)
-            ret.pop('contact', None)
-            ret['diagnosis'] = real_diagnosis
-        
-        elif is_receptionist:
-            # Receptionist sees Real Name/Contact but NO Diagnosis
-            ret['name'] = real_name
-            ret['diagnosis'] = "RESTRICTED"
-            # contact is already there
-        
         return ret
 
     def create(self, validated_data):
@@ -89,27 +122,153 @@ class PatientSerializer(serializers.ModelSerializer):
         # And "if it doesn't look like fernet...".
         # Let's explicitly encrypt here to be safe.
         from .utils import encrypt_data
+        plain_name = validated_data.get('name')
         if 'name' in validated_data:
             validated_data['name'] = encrypt_data(validated_data['name'])
         if 'diagnosis' in validated_data:
             validated_data['diagnosis'] = encrypt_data(validated_data['diagnosis'])
-        return super().create(validated_data)
+        # Build the instance ourselves so save() gets the plaintext for the search index
+        instance = Patient(**validated_data)
+        instance.set_plain_name(plain_name)
+        instance.save()
+        return instance
 
     def update(self, instance, validated_data):
-        request = self.context.get('request')
-        if request and request.user.groups.filter(name='Receptionist').exists():
+        if RECEPTIONIST in self.get_roles():
             # Receptionist can ONLY update assigned_doctor
             # We ignore all other fields in validated_data
             new_doctor = validated_data.get('assigned_doctor')
-            if new_doctor is not None:
-                instance.assigned_doctor = new_doctor
-                instance.save()
-            return instance
-        
-        # For Admin (or others), proceed with full update
+            validated_data = {'assigned_doctor': new_doctor} if new_doctor is not None else {}
+
+        # Only write what actually changed: the form PUTs every field, and
+        # re-encrypting an unchanged name would also rebuild its search tokens
         from .utils import encrypt_data
-        if 'name' in validated_data:
-            validated_data['name'] = encrypt_data(validated_data['name'])
-        if 'diagnosis' in validated_data:
-            validated_data['diagnosis'] = encrypt_data(validated_data['diagnosis'])
-        return super().update(instance, validated_data)
+        for field, value in validated_data.items():
+            if field in ENCRYPTED_FIELDS:
+                if value == get_decrypted(instance, field):
+                    continue
+                if field == 'name':
+                    instance.set_plain_name(value)
+                value = encrypt_data(value)
+            setattr(instance, field, value)
+
+        # Read by PatientViewSet.perform_update to decide whether to audit
+        self.changed_fields = instance.dirty_fields()
+        if self.changed_fields:
+            instance.save(update_fields=self.changed_fields)
+        return instance
+
+
+class PatientImportRowSerializer(serializers.Serializer):
+    """
+    Validates one row of a bulk import (see importer.py). assigned_doctor is a
+    user id or username, resolved for the whole batch rather than per row.
+    """
+    name = serializers.CharField(max_length=1000)
+    diagnosis = serializers.CharField()
+    age = serializers.IntegerField(min_value=0, max_value=150)
+    contact = serializers.CharField(max_length=100)
+    assigned_doctor = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class BulkAssignFilterSerializer(serializers.Serializer):
+    # Patients currently assigned to this doctor (null = unassigned), optionally narrowed by ?search= semantics
+    assigned_doctor = serializers.IntegerField(required=False, allow_null=True)
+    search = serializers.CharField(required=False, allow_blank=False)
+
+
+class BulkAssignSerializer(serializers.Serializer):
+    """Input of PatientViewSet.bulk_assign: explicit ids or a filter, and the target doctor (null unassigns)."""
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                allow_empty=False, max_length=100000)
+    filter = BulkAssignFilterSerializer(required=False)
+    doctor = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(groups__name=DOCTOR), allow_null=True)
+
+    def validate(self, data):
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError("Send either 'ids' or 'filter'.")
+        return data
+
+
+# Read-only serializers compiled per role. PatientViewSet picks one for list/retrieve
+# so each role only loads and decrypts the columns it is allowed to see; the
+# rules mirror role_projection() above.
+
+PATIENT_FIELDS = (
+    'id', 'assigned_doctor_name', 'name', 'diagnosis', 'age', 'contact',
+    'date_added', 'anonymized_name', 'anonymized_contact', 'assigned_doctor',
+)
+
+class EncryptedField(serializers.Field):
+    """Plaintext of an encrypted column (batch-decrypted by PatientListSerializer)."""
+    def __init__(self, **kwargs):
+        super().__init__(read_only=True, **kwargs)
+
+    def get_attribute(self, instance):
+        return get_decrypted(instance, self.source, default=DECRYPT_ERROR)
+
+    def to_representation(self, value):
+        return value
+
+class RestrictedField(serializers.Field):
+    """Column the role may not read: always "RESTRICTED", never loaded or decrypted."""
+    def __init__(self, **kwargs):
+        super().__init__(read_only=True, **kwargs)
+
+    def get_attribute(self, instance):
+        return RESTRICTED
+
+    def to_representation(self, value):
+        return value
+
+class RolePatientSerializer(serializers.ModelSerializer):
+    assigned_doctor_name = serializers.ReadOnlyField(source='assigned_doctor.username')
+
+    class Meta:
+        model = Patient
+        fields = PATIENT_FIELDS
+        read_only_fields = PATIENT_FIELDS
+        list_serializer_class = PatientListSerializer
+
+    def get_decrypted_fields(self):
+        return tuple(name for name, field in self.fields.items() if isinstance(field, EncryptedField))
+
+    @classmethod
+    def loaded_columns(cls):
+        """Patient columns this serializer reads, for queryset.only()."""
+        model_columns = {f.name for f in Patient._meta.concrete_fields}
+        return [
+            name for name in cls.Meta.fields
+            if name in model_columns and not isinstance(cls._declared_fields.get(name), RestrictedField)
+        ]
+
+class AdminPatientSerializer(RolePatientSerializer):
+    # Admin sees EVERYTHING
+    name = EncryptedField()
+    diagnosis = EncryptedField()
+
+class DoctorPatientSerializer(RolePatientSerializer):
+    # Doctor sees Anonymized Data + Diagnosis, MUST NOT see real name or contact
+    diagnosis = EncryptedField()
+
+    class Meta(RolePatientSerializer.Meta):
+        fields = tuple(f for f in PATIENT_FIELDS if f not in ('name', 'contact'))
+        read_only_fields = fields
+
+class ReceptionistPatientSerializer(RolePatientSerializer):
+    # Receptionist sees Real Name/Contact but NO Diagnosis
+    name = EncryptedField()
+    diagnosis = RestrictedField()
+
+ROLE_SERIALIZERS = (
+    (ADMIN, AdminPatientSerializer),
+    (DOCTOR, DoctorPatientSerializer),
+    (RECEPTIONIST, ReceptionistPatientSerializer),
+)
+
+def role_serializer_class(roles):
+    """Read serializer for the caller's highest role, or None if they have no patient role."""
+    for role, serializer_class in ROLE_SERIALIZERS:
+        if role in roles:
+            return serializer_class
+    return None
@@ -1,3 +1,598 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from cryptography.fernet import Fernet
+from django.contrib.auth.models import User, Group
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from logs.models import AccessLog
+from .cache import response_cache
+from .models import Patient, PatientChangeCounter, PatientSearchToken, KeyRotationCheckpoint
+from .utils import encrypt_data, decrypt_data
+from .views import BULK_ASSIGN_CHUNK_SIZE
+
+
+def make_user(username, role, **extra):
+    user = User.objects.create_user(username, password='pass12345', **extra)
+    user.groups.add(Group.objects.get(name=role))
+    return user
+
+def make_patients(count, doctor=None):
+    for i in range(count):
+        Patient.objects.create(
+            name=encrypt_data(f"Patient {i}"),
+            diagnosis=encrypt_data(f"Diagnosis {i}"),
+            age=30 + i % 50,
+            contact=f"555000{i:04d}",
+            assigned_doctor=doctor,
+        )
+
+
+class PatientListQueryCountTests(TestCase):
+    """The patient list must not issue extra queries per row (role checks, doctor names)."""
+
+    # session + request user + role lookup + one joined page query
+    QUERY_BUDGET = 4
+
+    def setUp(self):
+        self.doctor = make_user('doctor', 'Doctor')
+        self.client = APIClient()
+
+    def count_list_queries(self, user):
+        self.client.force_login(user)
+        # Session and user are cached after the first request (users.backends)
+        self.client.get('/api/auth/me/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/patients/', {'page_size': 500})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_constant_in_number_of_rows(self):
+        for role in ('Admin', 'Doctor', 'Receptionist'):
+            with self.subTest(role=role):
+                user = self.doctor if role == 'Doctor' else make_user(role.lower(), role)
+                Patient.objects.all().delete()
+                make_patients(3, doctor=self.doctor)
+                few = self.count_list_queries(user)
+                make_patients(300, doctor=self.doctor)
+                many = self.count_list_queries(user)
+                self.assertEqual(few, many)
+                self.assertLessEqual(many, self.QUERY_BUDGET)
+
+
+class RoleSerializerColumnTests(TestCase):
+    """Each role's list query must not even select the columns that role cannot see."""
+
+    def patient_select(self, user):
+        client = APIClient()
+        client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get('/api/patients/')
+        self.assertEqual(response.status_code, 200)
+        return next(q['sql'] for q in ctx.captured_queries if 'FROM "patients_patient"' in q['sql'])
+
+    def test_restricted_columns_are_not_loaded(self):
+        doctor = make_user('doctor', 'Doctor')
+        make_patients(2, doctor=doctor)
+        doctor_sql = self.patient_select(doctor)
+        self.assertNotIn('"patients_patient"."name"', doctor_sql)
+        self.assertNotIn('"patients_patient"."contact"', doctor_sql)
+        self.assertIn('"patients_patient"."diagnosis"', doctor_sql)
+
+        receptionist_sql = self.patient_select(make_user('reception', 'Receptionist'))
+        self.assertNotIn('"patients_patient"."diagnosis"', receptionist_sql)
+        self.assertIn('"patients_patient"."name"', receptionist_sql)
+
+
+class PatientSearchTests(TestCase):
+    """?search= matches encrypted names and contacts through the blind index."""
+
+    def setUp(self):
+        self.admin = make_user('admin', 'Admin')
+        self.client = APIClient()
+        self.client.force_login(self.admin)
+        for name, contact in (('John Smith', '(555) 010-1234'), ('Johanna Smithers', '5550109999'), ('Mary Major', '5550100000')):
+            response = self.client.post('/api/patients/', {'name': name, 'diagnosis': 'Flu', 'age': 40, 'contact': contact}, format='json')
+            self.assertEqual(response.status_code, 201)
+
+    def search(self, query):
+        response = self.client.get('/api/patients/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['name'] for row in response.json()['results'])
+
+    def test_exact_prefix_and_contact_matches(self):
+        self.assertEqual(self.search('john smith'), ['John Smith'])
+        self.assertEqual(self.search('JOH smi'), ['Johanna Smithers', 'John Smith'])
+        self.assertEqual(self.search('smithers'), ['Johanna Smithers'])
+        self.assertEqual(self.search('555-010-1234'), ['John Smith'])
+        self.assertEqual(self.search('nobody'), [])
+
+    def test_renaming_reindexes(self):
+        patient = Patient.objects.get(contact='5550100000')
+        response = self.client.put(f'/api/patients/{patient.id}/', {'name': 'Mary Minor', 'diagnosis': 'Flu', 'age': 40, 'contact': '5550100000'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search('major'), [])
+        self.assertEqual(self.search('minor'), ['Mary Minor'])
+
+    def test_backfill_command(self):
+        Patient.objects.update(name_bidx='', contact_bidx='')
+        PatientSearchToken.objects.all().delete()
+        self.assertEqual(self.search('mary'), [])
+        call_command('backfill_search_index', chunk_size=2, stdout=io.StringIO())
+        self.assertEqual(self.search('mary'), ['Mary Major'])
+
+
+class PatientImportTests(TestCase):
+
+    def setUp(self):
+        self.admin = make_user('admin', 'Admin')
+        self.doctor = make_user('drwho', 'Doctor')
+        self.client = APIClient()
+        self.client.force_login(self.admin)
+
+    def test_csv_import_reports_row_errors_without_aborting(self):
+        body = (
+            "name,diagnosis,age,contact,assigned_doctor\n"
+            "Ann Lee,Flu,34,5550001111,drwho\n"
+            "Bad Age,Flu,abc,5550002222,\n"
+            f"Bo Chen,Cold,51,5550003333,{self.doctor.id}\n"
+            "No Doc,Cold,51,5550004444,nobody\n"
+        )
+        response = self.client.generic('POST', '/api/patients/import/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()
+        self.assertEqual(summary['created'], 2)
+        self.assertEqual([error['row'] for error in summary['errors']], [3, 5])
+
+        self.assertEqual(Patient.objects.filter(assigned_doctor=self.doctor).count(), 2)
+        self.assertEqual(AccessLog.objects.filter(action='IMPORT_PATIENTS').count(), 1)
+        # Imported rows are encrypted, anonymized and searchable like API-created ones
+        response = self.client.get('/api/patients/', {'search': 'ann'})
+        self.assertEqual([row['name'] for row in response.json()['results']], ['Ann Lee'])
+        self.assertEqual(Patient.objects.exclude(anonymized_name='').count(), 2)
+
+    def test_ndjson_command_import(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+            for i in range(25):
+                f.write(f'{{"name": "Person {i}", "diagnosis": "Dx", "age": {i}, "contact": "555{i:07d}"}}\n')
+            f.write('not json\n')
+        self.addCleanup(os.remove, f.name)
+        out = io.StringIO()
+        call_command('import_patients', f.name, batch_size=10, workers=2, user='admin', stdout=out, stderr=io.StringIO())
+        self.assertEqual(Patient.objects.count(), 25)
+        self.assertEqual(AccessLog.objects.filter(action='IMPORT_PATIENTS', user=self.admin).count(), 3)
+        self.assertIn('1 rows rejected', out.getvalue())
+
+    def test_undecodable_and_unparsable_rows_are_reported(self):
+        body = (
+            b"name,diagnosis,age,contact\n"
+            b"Ann Lee,Flu,34,5550001111\n"
+            b"Bad \xff Byte,Flu,40,5550002222\n"
+            b"Bare \r Return,Flu,40,5550003333\n"
+            b'"Multi\nLine",Cold,51,5550004444\n'
+            b"Bo Chen,Cold,51,5550005555\n"
+        )
+        summary = self.client.generic('POST', '/api/patients/import/', body, content_type='text/csv').json()
+        self.assertEqual(summary['created'], 3)
+        self.assertEqual([error['row'] for error in summary['errors']], [3, 4])
+
+        body = b'{"name": "Ann", "diagnosis": "Dx", "age": 1, "contact": "5551"}\n\xfe\xff\n{"name": "Bo", "diagnosis": "Dx", "age": 2, "contact": "5552"}\n'
+        summary = self.client.generic('POST', '/api/patients/import/', body, content_type='application/x-ndjson').json()
+        self.assertEqual((summary['created'], [error['row'] for error in summary['errors']]), (2, [2]))
+
+    def test_only_admins_can_import(self):
+        self.client.force_login(self.doctor)
+        response = self.client.generic('POST', '/api/patients/import/', 'name\n', content_type='text/csv')
+        self.assertEqual(response.status_code, 403)
+
+
+class PatientExportTests(TestCase):
+    """The streaming export applies the same role projection as the list endpoint."""
+
+    def setUp(self):
+        self.doctor = make_user('doctor', 'Doctor')
+        make_patients(5, doctor=self.doctor)
+        make_patients(2)
+        self.client = APIClient()
+
+    def export(self, user, query=''):
+        self.client.force_login(user)
+        response = self.client.get('/api/patients/export/' + query)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_matches_list_representation_per_role(self):
+        for user in (make_user('admin', 'Admin'), self.doctor, make_user('reception', 'Receptionist')):
+            with self.subTest(user=user.username):
+                exported = [json.loads(line) for line in self.export(user).splitlines()]
+                listed = self.client.get('/api/patients/', {'page_size': 100}).json()['results']
+                # The export always has every column; the API omits assigned_doctor_name when unassigned
+                for record in listed:
+                    record.setdefault('assigned_doctor_name', None)
+                self.assertEqual(exported, listed)
+
+    def test_csv_columns_follow_role(self):
+        rows = list(csv.reader(io.StringIO(self.export(self.doctor, '?file_format=csv'))))
+        self.assertNotIn('name', rows[0])
+        self.assertNotIn('contact', rows[0])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][rows[0].index('diagnosis')], 'Diagnosis 0')
+
+
+class PatientResponseCacheTests(TestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        self.doctor = make_user('doctor', 'Doctor')
+        make_patients(3, doctor=self.doctor)
+        self.client = APIClient()
+        self.client.force_login(self.doctor)
+
+    def test_unchanged_list_revalidates_with_304_without_touching_patients(self):
+        first = self.client.get('/api/patients/')
+        self.assertEqual(first.status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get('/api/patients/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertFalse(any('"patients_patient"' in q['sql'] for q in ctx.captured_queries))
+
+        # Without the validator the body comes from the response cache
+        with CaptureQueriesContext(connection) as ctx:
+            third = self.client.get('/api/patients/')
+        self.assertEqual(third.json(), first.json())
+        self.assertFalse(any('"patients_patient"' in q['sql'] for q in ctx.captured_queries))
+
+    def test_saving_a_patient_invalidates(self):
+        first = self.client.get('/api/patients/')
+        patient = Patient.objects.first()
+        patient.age = 99
+        patient.save()
+        second = self.client.get('/api/patients/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertIn(99, [row['age'] for row in second.json()['results']])
+
+    def test_write_from_another_worker_invalidates(self):
+        other = make_user('other', 'Doctor')
+        patient = Patient.objects.first()
+        self.assertEqual(self.client.get(f'/api/patients/{patient.id}/').status_code, 200)
+        # Another process reassigns the patient: no signal reaches this one, only the committed counter
+        with transaction.atomic():
+            Patient.objects.filter(pk=patient.pk).update(assigned_doctor=other, change_seq=PatientChangeCounter.advance())
+        self.assertEqual(self.client.get(f'/api/patients/{patient.id}/').status_code, 404)
+
+    def test_cache_is_per_user(self):
+        etag = self.client.get('/api/patients/')['ETag']
+        self.client.force_login(make_user('admin', 'Admin'))
+        response = self.client.get('/api/patients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('name', response.json()['results'][0])
+
+    def test_detail_views_are_still_audited(self):
+        patient = Patient.objects.first()
+        etag = self.client.get(f'/api/patients/{patient.id}/')['ETag']
+        self.assertEqual(self.client.get(f'/api/patients/{patient.id}/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(AccessLog.objects.filter(action='VIEW_PATIENT').count(), 2)
+
+
+class KeyRotationTests(TestCase):
+
+    def test_rotation_reencrypts_and_resumes_from_checkpoint(self):
+        old_key, new_key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        with override_settings(ENCRYPTION_KEY=old_key, ENCRYPTION_OLD_KEYS=[]):
+            make_patients(7)
+
+        with override_settings(ENCRYPTION_KEY=new_key, ENCRYPTION_OLD_KEYS=[old_key]):
+            # Old data stays readable while rotating
+            self.assertEqual(decrypt_data(Patient.objects.order_by('pk').first().name), 'Patient 0')
+
+            # Pretend an earlier run crashed after the first 3 rows
+            third = Patient.objects.order_by('pk')[2].pk
+            KeyRotationCheckpoint.objects.create(
+                key_id=hashlib.sha256(new_key.encode()).hexdigest()[:16], last_pk=third
+            )
+            call_command('rotate_patient_keys', chunk_size=2, workers=1, stdout=io.StringIO())
+
+        new_only = Fernet(new_key.encode())
+        patients = list(Patient.objects.order_by('pk'))
+        for patient in patients[3:]:
+            self.assertEqual(new_only.decrypt(patient.diagnosis.encode()).decode(), f'Diagnosis {patients.index(patient)}')
+        for patient in patients[:3]:
+            self.assertRaises(Exception, new_only.decrypt, patient.name.encode())
+        self.assertIsNotNone(KeyRotationCheckpoint.objects.get().finished_at)
+
+    def test_rotation_uses_the_worker_pool_for_small_chunks(self):
+        old_key, new_key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        with override_settings(ENCRYPTION_KEY=old_key, ENCRYPTION_OLD_KEYS=[]):
+            make_patients(4)
+
+        # Threads stand in for the worker processes; chunks stay far below ENCRYPTION_PARALLEL_THRESHOLD
+        pool = mock.Mock(wraps=ThreadPoolExecutor(max_workers=2))
+        with override_settings(ENCRYPTION_KEY=new_key, ENCRYPTION_OLD_KEYS=[old_key]), \
+                mock.patch('patients.management.commands.rotate_patient_keys.ProcessPoolExecutor', return_value=pool):
+            call_command('rotate_patient_keys', chunk_size=2, workers=2, stdout=io.StringIO())
+
+        self.assertEqual(pool.map.call_count, 2)
+        name = Patient.objects.order_by('pk').last().name
+        self.assertEqual(Fernet(new_key.encode()).decrypt(name.encode()).decode(), 'Patient 3')
+        pool.shutdown.assert_called_once()
+
+
+class PatientAdminTests(TestCase):
+
+    def setUp(self):
+        self.doctor = make_user('doctor', 'Doctor')
+        make_patients(60, doctor=self.doctor)
+        self.client.force_login(User.objects.create_superuser('root', password='pass12345'))
+
+    def test_changelist_decrypts_page_in_one_batch(self):
+        with mock.patch('patients.utils.decrypt_data', side_effect=AssertionError('per-row decrypt')):
+            response = self.client.get('/admin/patients/patient/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Patient 59')
+        self.assertContains(response, 'autocomplete-filter-assigned_doctor')
+
+    def test_search_uses_blind_index_for_contact(self):
+        response = self.client.get('/admin/patients/patient/', {'q': '5550000042'})
+        self.assertEqual([p.contact for p in response.context['cl'].result_list], ['5550000042'])
+
+    def test_search_by_anonymized_id(self):
+        patient = Patient.objects.order_by('pk')[7]
+        response = self.client.get('/admin/patients/patient/', {'q': patient.anonymized_name.lower()})
+        self.assertEqual([p.pk for p in response.context['cl'].result_list], [patient.pk])
+
+    def test_doctor_filter(self):
+        other = make_user('other', 'Doctor')
+        Patient.objects.filter(pk=Patient.objects.order_by('pk').first().pk).update(assigned_doctor=other)
+        response = self.client.get('/admin/patients/patient/', {'assigned_doctor__id__exact': other.pk})
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+
+
+class BulkAssignTests(TestCase):
+
+    def setUp(self):
+        self.old_doctor = make_user('old', 'Doctor')
+        self.new_doctor = make_user('new', 'Doctor')
+        self.receptionist = make_user('front', 'Receptionist')
+        self.client = APIClient()
+        self.client.force_login(self.receptionist)
+
+    def bulk_patients(self, count, doctor):
+        name, diagnosis = encrypt_data('Patient'), encrypt_data('Diagnosis')
+        Patient.objects.bulk_create(
+            Patient(name=name, diagnosis=diagnosis, age=40, contact=f'555{i:07d}', assigned_doctor=doctor)
+            for i in range(count)
+        )
+
+    def assign(self, payload):
+        return self.client.post('/api/patients/bulk_assign/', payload, format='json')
+
+    def test_moves_ten_thousand_patients_in_chunked_updates_with_one_audit_entry(self):
+        self.bulk_patients(10000, self.old_doctor)
+        ids = list(Patient.objects.values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.assign({'ids': ids, 'doctor': self.new_doctor.pk})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['updated'], response.json()['missing']), (10000, []))
+        # One UPDATE per chunk, never one per patient, and a single audit insert
+        statements = [q['sql'] for q in ctx.captured_queries]
+        updates = [sql for sql in statements if sql.startswith('UPDATE "patients_patient"')]
+        self.assertEqual(len(updates), math.ceil(10000 / BULK_ASSIGN_CHUNK_SIZE))
+        self.assertEqual(len([sql for sql in statements if sql.startswith('INSERT INTO "logs_accesslog"')]), 1)
+        self.assertEqual(Patient.objects.filter(assigned_doctor=self.new_doctor).count(), 10000)
+        entry = AccessLog.objects.get(action='BULK_ASSIGN_DOCTOR')
+        self.assertEqual(entry.details, f'Assigned 10000 patients to new: {min(ids)}-{max(ids)}')
+
+    def test_filter_mode_and_cache_invalidation(self):
+        make_patients(3, doctor=self.old_doctor)
+        make_patients(2)
+        self.client.get('/api/patients/')  # fill the response cache
+        response = self.assign({'filter': {'assigned_doctor': self.old_doctor.pk}, 'doctor': self.new_doctor.pk})
+        self.assertEqual(response.json(), {'updated': 3, 'doctor': self.new_doctor.pk})
+        doctors = [p['assigned_doctor'] for p in self.client.get('/api/patients/').json()['results']]
+        self.assertEqual(sorted(doctors, key=str), sorted([self.new_doctor.pk] * 3 + [None] * 2, key=str))
+
+    def test_missing_ids_and_permissions(self):
+        make_patients(1)
+        patient = Patient.objects.get()
+        response = self.assign({'ids': [patient.pk, 999999], 'doctor': self.new_doctor.pk})
+        self.assertEqual(response.json()['missing'], [999999])
+
+        self.assertEqual(self.assign({'ids': [patient.pk], 'doctor': self.receptionist.pk}).status_code, 400)
+        self.assertEqual(self.assign({'doctor': self.new_doctor.pk}).status_code, 400)
+        self.client.force_login(self.old_doctor)
+        self.assertEqual(self.assign({'ids': [patient.pk], 'doctor': self.old_doctor.pk}).status_code, 403)
+
+
+class PatientDirtyUpdateTests(TestCase):
+    """Updates only encrypt and write the columns whose value actually changed."""
+
+    def setUp(self):
+        self.admin = make_user('admin', 'Admin')
+        self.client = APIClient()
+        self.client.force_login(self.admin)
+        self.form = {'name': 'Mary Major', 'diagnosis': 'Flu', 'age': 40, 'contact': '5550100000'}
+        response = self.client.post('/api/patients/', self.form, format='json')
+        self.patient = Patient.objects.get(pk=response.json()['id'])
+
+    def put(self, **changes):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.put(f'/api/patients/{self.patient.pk}/', {**self.form, **changes}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith(('UPDATE', 'INSERT', 'DELETE'))]
+
+    def test_unchanged_put_writes_and_logs_nothing(self):
+        with mock.patch('patients.utils.encrypt_data', side_effect=AssertionError('re-encrypted')):
+            writes = self.put()
+        self.assertEqual(writes, [])
+        self.assertFalse(AccessLog.objects.filter(action='UPDATE_PATIENT_FULL').exists())
+        self.assertEqual(Patient.objects.get(pk=self.patient.pk).name, self.patient.name)
+
+    def test_sync_columns_are_read_only(self):
+        # A client echoing back a stale change_seq neither counts as a change nor rewinds it
+        self.assertEqual(self.put(change_seq=0, updated_at='2000-01-01T00:00:00Z'), [])
+        self.assertEqual(Patient.objects.get(pk=self.patient.pk).change_seq, self.patient.change_seq)
+
+    def test_only_changed_columns_are_written(self):
+        writes = self.put(diagnosis='Measles', age=41)
+        updates = [sql for sql in writes if sql.startswith('UPDATE "patients_patient"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"diagnosis"', updates[0])
+        self.assertIn('"age"', updates[0])
+        self.assertNotIn('"name"', updates[0])
+        self.assertFalse(any('patients_patientsearchtoken' in sql for sql in writes))
+
+        patient = Patient.objects.get(pk=self.patient.pk)
+        self.assertEqual(patient.name, self.patient.name)
+        self.assertEqual(decrypt_data(patient.diagnosis), 'Measles')
+        entry = AccessLog.objects.get(action='UPDATE_PATIENT_FULL')
+        self.assertEqual(entry.details, f'Admin updated patient {patient.pk} details (diagnosis, age)')
+
+
+class PatientDeltaSyncTests(TestCase):
+    """/api/patients/changes/ returns only what changed in the caller's view since a token."""
+
+    def setUp(self):
+        self.admin = make_user('admin', 'Admin')
+        self.doctor = make_user('house', 'Doctor')
+        self.other = make_user('wilson', 'Doctor')
+        self.receptionist = make_user('front', 'Receptionist')
+        self.client = APIClient()
+        make_patients(2, doctor=self.doctor)
+        self.mine, self.also_mine = Patient.objects.order_by('id')
+        self.mine_id, self.also_mine_id = self.mine.pk, self.also_mine.pk
+
+    def changes(self, user, token=None):
+        self.client.force_login(user)
+        response = self.client.get('/api/patients/changes/', {'since': token} if token else {})
+        return response
+
+    def sync(self, user, token):
+        response = self.changes(user, token)
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        return body['token'], sorted(row['id'] for row in body['changed']), body['removed']
+
+    def test_doctor_sees_edits_moves_and_deletes(self):
+        token = self.changes(self.doctor).json()['token']
+        self.assertEqual(self.sync(self.doctor, token)[1:], ([], []))
+
+        self.mine.age = 99
+        self.mine.save()
+        make_patients(1, doctor=self.other)  # not visible to house
+        token, changed, removed = self.sync(self.doctor, token)
+        self.assertEqual((changed, removed), ([self.mine_id], []))
+
+        self.client.force_login(self.receptionist)
+        self.client.patch(f'/api/patients/{self.mine_id}/', {'assigned_doctor': self.other.pk}, format='json')
+        self.also_mine.delete()
+        token, changed, removed = self.sync(self.doctor, token)
+        self.assertEqual((changed, removed), ([], sorted([self.mine_id, self.also_mine_id])))
+
+        # Moving back shows up as a change, not a removal
+        patient = Patient.objects.get(pk=self.mine_id)
+        patient.assigned_doctor = self.doctor
+        patient.save()
+        self.assertEqual(self.sync(self.doctor, token)[1:], ([self.mine_id], []))
+
+    def test_admin_only_gets_deletions_as_removals(self):
+        token = self.changes(self.admin).json()['token']
+        self.client.post('/api/patients/bulk_assign/', {'ids': [self.mine_id], 'doctor': self.other.pk}, format='json')
+        self.also_mine.delete()
+        token, changed, removed = self.sync(self.admin, token)
+        self.assertEqual((changed, removed), ([self.mine_id], [self.also_mine_id]))
+        self.assertEqual(self.sync(self.admin, token)[1:], ([], []))
+
+    def test_bulk_assign_and_import_are_tracked(self):
+        doctor_token = self.changes(self.doctor).json()['token']
+        other_token = self.changes(self.other).json()['token']
+        self.client.force_login(self.admin)
+        self.client.post('/api/patients/bulk_assign/', {'filter': {'assigned_doctor': self.doctor.pk}, 'doctor': self.other.pk}, format='json')
+        self.assertEqual(self.sync(self.doctor, doctor_token)[1:], ([], sorted([self.mine_id, self.also_mine_id])))
+        self.assertEqual(self.sync(self.other, other_token)[1], sorted([self.mine_id, self.also_mine_id]))
+
+        admin_token = self.changes(self.admin).json()['token']
+        self.client.force_login(self.admin)
+        self.client.post('/api/patients/import/', 'name,diagnosis,age,contact,assigned_doctor\nAnn,Flu,30,5550101111,\n', content_type='text/csv')
+        _, changed, _ = self.sync(self.admin, admin_token)
+        self.assertEqual(changed, [Patient.objects.latest('id').pk])
+
+    def test_unusable_tokens(self):
+        doctor_token = self.changes(self.doctor).json()['token']
+        response = self.changes(self.other, doctor_token)
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(self.sync(self.other, response.json()['token'])[1:], ([], []))
+
+        self.assertEqual(self.changes(self.doctor, 'not-a-token').status_code, 400)
+
+        self.mine.delete()
+        call_command('prune_patient_tombstones', days=-1, stdout=io.StringIO())
+        self.assertEqual(self.changes(self.doctor, doctor_token).status_code, 410)
+
+        with mock.patch('patients.views.CHANGES_LIMIT', 1):
+            token = self.changes(self.admin).json()['token']
+            make_patients(2)
+            self.assertEqual(self.changes(self.admin, token).status_code, 410)
+
+
+class SyntheticDataTests(TestCase):
+    """seed_synthetic builds a consistent dataset that benchmark_api can drive every route against."""
+
+    def seed(self, **options):
+        options = {'patients': 60, 'doctors': 3, 'receptionists': 1, 'admins': 1, 'logs': 250, **options}
+        call_command('seed_synthetic', batch_size=25, workers=1, stdout=io.StringIO(), **options)
+
+    @override_settings(AUDIT_LOG_BLOCK_SIZE=100)
+    def test_seed_is_reproducible_searchable_and_chained(self):
+        self.seed()
+        self.assertEqual(Patient.objects.count(), 60)
+        self.assertEqual(User.objects.filter(username__startswith='synth-doctor-').count(), 3)
+        self.assertEqual(AccessLog.objects.count(), 250)
+        names = [decrypt_data(p.name) for p in Patient.objects.order_by('id')]
+
+        # Every seeded name is found through the blind index
+        self.client.force_login(User.objects.get(username='synth-admin-0'))
+        results = self.client.get('/api/patients/', {'search': names[0], 'page_size': 100}).json()['results']
+        self.assertIn(names[0], [row['name'] for row in results])
+
+        from logs.chain import verify_chain
+        self.assertTrue(verify_chain(full=True)['ok'])
+
+        # Same seed, same patients; users are reused rather than duplicated
+        self.seed(logs=0)
+        again = [decrypt_data(p.name) for p in Patient.objects.order_by('id')[60:]]
+        self.assertEqual(again, names)
+        self.assertEqual(User.objects.filter(username__startswith='synth-').count(), 5)
+
+    @override_settings(ALLOWED_HOSTS=[])  # the repo's setting, not the test runner's
+    def test_benchmark_reports_every_scenario(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'bench.json')
+            call_command('benchmark_api', iterations=2, warmup=0, heavy=True, output=output,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+            with open(output) as f:
+                report = json.load(f)
+            call_command('benchmark_api', iterations=1, warmup=0, only=['patient-list'], compare=output,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(report['dataset']['patients'], 60)
+        scenarios = {(s['name'], s['role']): s for s in report['scenarios']}
+        self.assertIn(('patient-list', 'doctor'), scenarios)
+        self.assertIn(('login', 'anonymous'), scenarios)
+        self.assertIn(('log-export-csv', 'admin'), scenarios)
+        for scenario in report['scenarios']:
+            self.assertEqual(scenario['errors'], 0, scenario)
+            self.assertGreater(scenario['queries']['max'], 0, scenario)
+            self.assertEqual(set(scenario['latency_ms']), {'p50', 'p95', 'p99', 'mean', 'max'})
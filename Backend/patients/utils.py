@@ -1,17 +1,147 @@
-from cryptography.fernet import Fernet
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from cryptography.fernet import Fernet, MultiFernet
 from django.conf import settings
+from backend.metrics import timed
+
+
+@lru_cache(maxsize=4)
+def _fernet_for_key(keys):
+    # Parsing the key and setting up the HMAC/AES keys is the expensive part,
+    # so keep one Fernet instance per key set for the lifetime of the process.
+    # With old keys configured, MultiFernet encrypts with the first (primary)
+    # key and decrypts with any of them.
+    if isinstance(keys, str):
+        keys = (keys,)
+    if len(keys) == 1:
+        return Fernet(keys[0].encode())
+    return MultiFernet([Fernet(key.encode()) for key in keys])
+
+def encryption_keys():
+    """The primary key followed by the retired keys that can still decrypt."""
+    return (settings.ENCRYPTION_KEY, *getattr(settings, 'ENCRYPTION_OLD_KEYS', ()))
 
 def get_fernet():
-    return Fernet(settings.ENCRYPTION_KEY.encode())
+    return _fernet_for_key(encryption_keys())
 
 def encrypt_data(data):
     if not data:
         return None
     f = get_fernet()
-    return f.encrypt(data.encode()).decode()
+    with timed('crypto'):
+        return f.encrypt(data.encode()).decode()
 
 def decrypt_data(data):
     if not data:
         return None
     f = get_fernet()
-    return f.decrypt(data.encode()).decode()
+    with timed('crypto'):
+        return f.decrypt(data.encode()).decode()
+
+
+def _decrypt_chunk(key, tokens, default):
+    """Decrypt a list of tokens with one key set. Runs inline or inside a pool worker."""
+    f = _fernet_for_key(key)
+    result = []
+    for token in tokens:
+        if not token:
+            result.append(None)
+            continue
+        try:
+            result.append(f.decrypt(token.encode()).decode())
+        except Exception:
+            result.append(default)
+    return result
+
+def _encrypt_chunk(key, values):
+    f = _fernet_for_key(key)
+    return [f.encrypt(value.encode()).decode() if value else None for value in values]
+
+def _map_chunked(func, items, extra_args, executor):
+    """
+    Apply func(keys, chunk, *extra_args) over `items`, preserving order.
+
+    Lists of ENCRYPTION_PARALLEL_THRESHOLD items or more are split into chunks and
+    fanned out over a pool: `executor` is 'thread', 'process', 'inline', an existing
+    concurrent.futures Executor to reuse, or None for settings.ENCRYPTION_EXECUTOR.
+    An existing Executor is always used: its owner already paid for the workers.
+    """
+    key = encryption_keys()
+    executor = executor or getattr(settings, 'ENCRYPTION_EXECUTOR', 'thread')
+    workers = getattr(settings, 'ENCRYPTION_WORKERS', 4)
+    threshold = getattr(settings, 'ENCRYPTION_PARALLEL_THRESHOLD', 2000)
+
+    with timed('crypto'):
+        return _run_chunked(func, key, items, extra_args, executor, workers, threshold)
+
+def _run_chunked(func, key, items, extra_args, executor, workers, threshold):
+    if not items or executor == 'inline' or (isinstance(executor, str) and (workers <= 1 or len(items) < threshold)):
+        return func(key, items, *extra_args)
+
+    chunk_size = -(-len(items) // max(workers, 1))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    columns = [[key] * len(chunks), chunks] + [[arg] * len(chunks) for arg in extra_args]
+    if isinstance(executor, str):
+        pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        with pool_class(max_workers=workers) as pool:
+            parts = list(pool.map(func, *columns))
+    else:
+        parts = list(executor.map(func, *columns))
+    return [value for part in parts for value in part]
+
+def _rotate_chunk(key, tokens):
+    """Re-encrypt tokens under the primary key; tokens that no key can read come back as None."""
+    f = _fernet_for_key(key)
+    result = []
+    for token in tokens:
+        if not token:
+            result.append(token)
+            continue
+        try:
+            result.append(f.rotate(token.encode()).decode() if isinstance(f, MultiFernet) else token)
+        except Exception:
+            result.append(None)
+    return result
+
+def decrypt_many(tokens, default=None, executor=None):
+    """
+    Decrypt a list of tokens in one call, preserving order.
+    Tokens that fail to decrypt are replaced by `default`.
+    Large batches are fanned out over a pool (see _map_chunked).
+    """
+    return _map_chunked(_decrypt_chunk, list(tokens), (default,), executor)
+
+def encrypt_many(values, executor=None):
+    """Encrypt a list of strings in one call, preserving order (empty values become None)."""
+    return _map_chunked(_encrypt_chunk, list(values), (), executor)
+
+def rotate_many(tokens, executor=None):
+    """Re-encrypt a list of tokens under the primary key (see rotate_patient_keys)."""
+    return _map_chunked(_rotate_chunk, list(tokens), (), executor)
+
+def decrypt_fields(instances, fields=('name', 'diagnosis'), default=None, executor=None):
+    """
+    Decrypt the given encrypted columns for a whole list of model instances
+    in one batch. Plaintext is stored on each instance in `_decrypted`, where
+    `get_decrypted` picks it up without decrypting again.
+    """
+    instances = list(instances)
+    tokens = [getattr(obj, field) for obj in instances for field in fields]
+    values = iter(decrypt_many(tokens, default=default, executor=executor))
+    for obj in instances:
+        cache = obj.__dict__.setdefault('_decrypted', {})
+        for field in fields:
+            cache[field] = next(values)
+    return instances
+
+def get_decrypted(instance, field, default=None):
+    """Return the plaintext of an encrypted column, using the batch cache if present."""
+    cache = instance.__dict__.get('_decrypted', {})
+    if field in cache:
+        return cache[field]
+    try:
+        value = decrypt_data(getattr(instance, field))
+    except Exception:
+        value = default
+    instance.__dict__.setdefault('_decrypted', {})[field] = value
+    return value
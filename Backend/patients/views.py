@@ -1,33 +1,91 @@
-from rest_framework import viewsets, permissions
+import io
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
 from django.contrib.auth.models import User
-from .models import Patient
-from .serializers import PatientSerializer
-from logs.models import AccessLog
+from .models import Patient, PatientChangeCounter, PatientTombstone
+from .serializers import BulkAssignSerializer, PatientSerializer, role_projection, role_serializer_class
+from .search import search_q
+from .importer import PatientImporter, detect_format, iter_records
+from .exporter import export_columns, iter_patient_records
+from .cache import cached_response
+from .changes import InvalidToken, change_scope, changes_since, make_token, parse_token, publish_change
+from backend.streaming import iter_csv, iter_ndjson, streaming_download
+from logs.audit import log_access
+from users.roles import ADMIN, DOCTOR, RECEPTIONIST, RoleContextMixin
+from backend.pagination import KeysetPagination
 
-class PatientViewSet(viewsets.ModelViewSet):
+# Actions served by the read-only per-role serializers
+READ_ACTIONS = ('list', 'retrieve', 'changes')
+
+# Patients updated per UPDATE ... WHERE id IN (...) in bulk_assign
+BULK_ASSIGN_CHUNK_SIZE = 500
+
+# More changed + removed rows than this since a token and the client reloads the list instead
+CHANGES_LIMIT = 1000
+
+def compact_ids(ids):
+    """Render sorted ids as ranges for audit details, e.g. [1, 2, 3, 7, 9, 10] -> '1-3,7,9-10'."""
+    parts = []
+    start = prev = None
+    for pk in ids:
+        if prev is not None and pk == prev + 1:
+            prev = pk
+            continue
+        if start is not None:
+            parts.append(str(start) if start == prev else f'{start}-{prev}')
+        start = prev = pk
+    if start is not None:
+        parts.append(str(start) if start == prev else f'{start}-{prev}')
+    return ','.join(parts)
+
+class PatientPagination(KeysetPagination):
+    ordering = ('date_added', 'id')
+
+class PatientViewSet(RoleContextMixin, viewsets.ModelViewSet):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PatientPagination
+
+    def get_serializer_class(self):
+        if self.action in READ_ACTIONS:
+            return role_serializer_class(self.roles) or PatientSerializer
+        return PatientSerializer
 
     def get_queryset(self):
         user = self.request.user
-        if user.groups.filter(name='Admin').exists():
-            return Patient.objects.all()
-        elif user.groups.filter(name='Doctor').exists():
-            return Patient.objects.filter(assigned_doctor=user)
-        elif user.groups.filter(name='Receptionist').exists():
-            return Patient.objects.all() # Receptionist sees all to register/check, but fields are restricted in serializer
+        roles = self.roles
+        patients = Patient.objects.select_related('assigned_doctor')
+        serializer_class = self.get_serializer_class()
+        if self.action in READ_ACTIONS and serializer_class is not PatientSerializer:
+            # Only the columns this role's serializer shows: restricted ciphertext is never loaded
+            patients = patients.only(*serializer_class.loaded_columns(), 'assigned_doctor__username')
+        query = self.request.query_params.get('search', '').strip()
+        if query:
+            # Blind-index lookup; Doctors never see names/contacts so may only search anonymized names
+            if DOCTOR in roles and ADMIN not in roles:
+                patients = patients.filter(anonymized_name__iexact=query)
+            else:
+                patients = patients.filter(search_q(query))
+        if ADMIN in roles:
+            return patients.all()
+        elif DOCTOR in roles:
+            return patients.filter(assigned_doctor=user)
+        elif RECEPTIONIST in roles:
+            return patients.all() # Receptionist sees all to register/check, but fields are restricted in serializer
         return Patient.objects.none()
 
     def perform_create(self, serializer):
         # Restrict creation to Admin only
-        if not self.request.user.groups.filter(name='Admin').exists():
-            from rest_framework.exceptions import PermissionDenied
+        if ADMIN not in self.roles:
             raise PermissionDenied("Only Admins can register new patients.")
 
         # Log the action
-        AccessLog.objects.create(
+        log_access(
             user=self.request.user,
             action="CREATE_PATIENT",
             details=f"Created patient record"
@@ -37,42 +95,197 @@ class PatientViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         user = self.request.user
         patient_id = serializer.instance.id
-        
+
+        serializer.save()
+        if not serializer.changed_fields:
+            return  # Nothing changed: no write, so nothing to audit
+        changed = ', '.join(serializer.changed_fields)
+
         # Determine if user is Receptionist
-        is_receptionist = user.groups.filter(name='Receptionist').exists()
-        is_admin = user.groups.filter(name='Admin').exists()
+        is_receptionist = RECEPTIONIST in self.roles
+        is_admin = ADMIN in self.roles
         
         if is_receptionist:
             # Receptionist only updates assigned doctor
-            AccessLog.objects.create(
+            log_access(
                 user=user,
                 action="UPDATE_PATIENT_DOCTOR",
                 details=f"Receptionist updated assigned doctor for patient {patient_id}"
             )
         elif is_admin:
             # Admin can update all fields
-            AccessLog.objects.create(
+            log_access(
                 user=user,
                 action="UPDATE_PATIENT_FULL",
-                details=f"Admin updated patient {patient_id} details"
+                details=f"Admin updated patient {patient_id} details ({changed})"
             )
         else:
             # Generic update for other roles
-            AccessLog.objects.create(
+            log_access(
                 user=user,
                 action="UPDATE_PATIENT",
-                details=f"Updated patient {patient_id}"
+                details=f"Updated patient {patient_id} ({changed})"
             )
-        
-        serializer.save()
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, self.roles, lambda: super(PatientViewSet, self).list(request, *args, **kwargs))
 
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        # Log the view action
-        AccessLog.objects.create(
+        def build():
+            instance = self.get_object()
+            serializer = self.get_serializer(instance)
+            return Response(serializer.data)
+
+        response = cached_response(request, self.roles, build)
+        if response.status_code in (200, 304):
+            # Log the view action (also when served from cache)
+            log_access(
+                user=request.user,
+                action="VIEW_PATIENT",
+                details=f"Viewed patient {kwargs['pk']}"
+            )
+        return response
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Delta sync: ?since=<token> returns the patients in the caller's list that
+        were added or modified since the token ("changed", serialized like the list)
+        and the ids that were deleted or left the caller's view ("removed"), plus a
+        new token. Without ?since= only the current token is returned: take it before
+        loading the list. 410 Gone means the token cannot be resumed (expired, too
+        many changes, or the caller's role changed) and the list must be reloaded
+        from the token in the response.
+        """
+        scope = change_scope(self.roles, request.user)
+        if scope is None:
+            raise PermissionDenied("You do not have access to patient records.")
+
+        since = request.query_params.get('since')
+        if not since:
+            upper, _ = PatientChangeCounter.current()
+            return Response({'token': make_token(upper, scope), 'changed': [], 'removed': []})
+        try:
+            doctor_id = request.user.pk if scope != 'all' else None
+            upper, changed, removed = changes_since(self.get_queryset(), parse_token(since, scope), doctor_id, CHANGES_LIMIT)
+        except InvalidToken as e:
+            upper, _ = PatientChangeCounter.current()
+            return Response({'detail': str(e), 'token': make_token(upper, scope)}, status=status.HTTP_410_GONE)
+        except ValueError as e:
+            raise ValidationError({'since': str(e)})
+
+        serializer = self.get_serializer(changed, many=True)
+        return Response({'token': make_token(upper, scope), 'changed': serializer.data, 'removed': removed})
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """
+        Bulk-create patients from CSV (header: name,diagnosis,age,contact,assigned_doctor)
+        or NDJSON, sent as a multipart 'file' upload or as the raw request body.
+        Rows are validated, encrypted and inserted in batches; invalid rows are
+        reported in the response and skipped.
+        """
+        if ADMIN not in self.roles:
+            raise PermissionDenied("Only Admins can import patients.")
+
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                raise ValidationError({'file': 'Upload a CSV or NDJSON file.'})
+            stream = upload.file
+            fmt = detect_format(upload.name, upload.content_type or '')
+        else:
+            # Raw body, e.g. Content-Type: text/csv or application/x-ndjson
+            stream = io.BytesIO(request.body)
+            fmt = detect_format('', request.content_type)
+
+        importer = PatientImporter(user=request.user)
+        summary = importer.run(iter_records(stream, fmt))
+        return Response(summary, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the patients visible to the caller as NDJSON (default) or CSV
+        (?file_format=csv), with the same per-role fields as the list endpoint.
+        Honours ?search= and supports ?gzip=1.
+        """
+        if role_projection(self.roles) is None:
+            raise PermissionDenied("You do not have access to patient records.")
+
+        file_format = request.query_params.get('file_format', 'ndjson')
+        if file_format not in ('ndjson', 'csv'):
+            raise ValidationError({'file_format': 'Must be "ndjson" or "csv".'})
+
+        log_access(
             user=request.user,
-            action="VIEW_PATIENT",
-            details=f"Viewed patient {instance.id}"
+            action="EXPORT_PATIENTS",
+            details=f"Exported patients as {file_format}"
         )
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        records = iter_patient_records(self.get_queryset().order_by('pk'), self.roles)
+        gzip = request.query_params.get('gzip') in ('1', 'true')
+        if file_format == 'csv':
+            columns = export_columns(self.roles)
+            chunks = iter_csv(columns, ([record[c] for c in columns] for record in records))
+            return streaming_download(chunks, 'patients.csv', 'text/csv', gzip=gzip)
+        return streaming_download(iter_ndjson(records), 'patients.ndjson', 'application/x-ndjson', gzip=gzip)
+
+    @action(detail=False, methods=['post'])
+    def bulk_assign(self, request):
+        """
+        Move many patients to one doctor: {"ids": [...], "doctor": <user id>} or
+        {"filter": {"assigned_doctor": <id|null>, "search": "..."}, "doctor": <id|null>}.
+        Permissions are checked once, rows are updated with one UPDATE per chunk of
+        ids in a single transaction, and one audit entry lists the affected ids.
+        """
+        roles = self.roles
+        if ADMIN not in roles and RECEPTIONIST not in roles:
+            raise PermissionDenied("Only Admins and Receptionists can reassign patients.")
+
+        serializer = BulkAssignSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        doctor = serializer.validated_data['doctor']
+
+        if 'ids' in serializer.validated_data:
+            requested = sorted(set(serializer.validated_data['ids']))
+            candidates = Patient.objects.filter(id__in=requested)
+        else:
+            filters = serializer.validated_data['filter']
+            requested = None
+            candidates = Patient.objects.all()
+            if 'assigned_doctor' in filters:
+                candidates = candidates.filter(assigned_doctor_id=filters['assigned_doctor'])
+            if filters.get('search'):
+                candidates = candidates.filter(search_q(filters['search']))
+
+        updated = []
+        with transaction.atomic():
+            ids = list(candidates.order_by('id').values_list('id', flat=True))
+            # update() bypasses Patient.save(), so stamp the delta sync sequence and tombstones here
+            change_seq = PatientChangeCounter.advance() if ids else None
+            now = timezone.now()
+            previous_doctors = set()
+            for i in range(0, len(ids), BULK_ASSIGN_CHUNK_SIZE):
+                chunk = ids[i:i + BULK_ASSIGN_CHUNK_SIZE]
+                moved = Patient.objects.filter(id__in=chunk, assigned_doctor__isnull=False)
+                if doctor is not None:
+                    moved = moved.exclude(assigned_doctor=doctor)
+                moved = list(moved.values_list('id', 'assigned_doctor_id'))
+                PatientTombstone.record(moved, change_seq)
+                previous_doctors.update(doctor_id for _, doctor_id in moved)
+                Patient.objects.filter(id__in=chunk).update(assigned_doctor=doctor, change_seq=change_seq, updated_at=now)
+                updated.extend(chunk)
+        # Audited once committed, so a rolled back assignment leaves no entry
+        if updated:
+            log_access(
+                user=request.user,
+                action="BULK_ASSIGN_DOCTOR",
+                details=(f"Assigned {len(updated)} patients to "
+                         f"{doctor.username if doctor else 'no doctor'}: {compact_ids(updated)}"),
+            )
+            publish_change(change_seq, previous_doctors | {doctor.pk if doctor else None})
+
+        response = {'updated': len(updated), 'doctor': doctor.pk if doctor else None}
+        if requested is not None:
+            response['missing'] = sorted(set(requested) - set(updated))
+        return Response(response, status=status.HTTP_200_OK)
@@ -0,0 +1,86 @@
+import uuid
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User, Group
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .serializers import GROUPS_PREFETCH
+
+GROUPS_VERSION_KEY = 'auth:groups:version'
+
+
+def _groups_version():
+    # Renaming or deleting a group changes every member's role set; a new
+    # version retires all cached users at once instead of finding the members
+    version = cache.get(GROUPS_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(GROUPS_VERSION_KEY, version, timeout=None)
+        version = cache.get(GROUPS_VERSION_KEY, version)
+    return version
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}:{_groups_version()}'
+
+def invalidate_cached_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user() (called by AuthenticationMiddleware on every
+    request) is served from the cache. The user comes with its groups prefetched
+    and its role set resolved (users.roles.get_roles), so an authenticated
+    request needs no queries for the user at all. Entries live for
+    USER_CACHE_TTL seconds and are dropped on logout, user saves (password
+    changes included) and group changes.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = User._default_manager.prefetch_related(GROUPS_PREFETCH).filter(pk=user_id).first()
+            if user is None:
+                return None
+            user._role_names = frozenset(group.name for group in user.groups.all())
+            cache.set(key, user, timeout=settings.USER_CACHE_TTL)
+        return user if self.user_can_authenticate(user) else None
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which nothing reads from request.user
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_cached_user(instance.pk)
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, user, **kwargs):
+    if user is not None:
+        invalidate_cached_user(user.pk)
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_cached_user(instance.pk)
+    elif pk_set:
+        # group.user_set.add(...) and friends
+        for user_id in pk_set:
+            invalidate_cached_user(user_id)
+    else:
+        # group.user_set.clear() does not say which users were removed
+        cache.delete(GROUPS_VERSION_KEY)
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    cache.delete(GROUPS_VERSION_KEY)
@@ -0,0 +1,70 @@
+import hashlib
+import json
+import uuid
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .roles import DOCTOR
+from .serializers import UserSerializer, GROUPS_PREFETCH, LIST_COLUMNS
+
+VERSION_KEY = 'users:doctor-directory:version'
+DATA_KEY = 'users:doctor-directory'
+
+# Per-process copy of the last directory, valid while the shared version matches
+_local = {}
+
+
+def _build(version):
+    doctors = User.objects.filter(groups__name=DOCTOR).prefetch_related(GROUPS_PREFETCH).only(*LIST_COLUMNS)
+    data = UserSerializer(doctors, many=True).data
+    digest = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    return {'version': version, 'data': data, 'etag': f'"{digest}"'}
+
+def get_doctor_directory():
+    """
+    Return (data, etag) for the doctor list.
+
+    Served from this process's copy, then from Django's cache, and only rebuilt
+    from the database after invalidate_doctor_directory() changed the version.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(VERSION_KEY, version, timeout=None)
+        version = cache.get(VERSION_KEY, version)
+
+    entry = _local.get('entry')
+    if entry is None or entry['version'] != version:
+        entry = cache.get(DATA_KEY)
+        if entry is None or entry['version'] != version:
+            entry = _build(version)
+            cache.set(DATA_KEY, entry, timeout=settings.DOCTOR_DIRECTORY_TTL)
+        _local['entry'] = entry
+    return entry['data'], entry['etag']
+
+def invalidate_doctor_directory():
+    # A new version makes every process's and the shared copy stale at once
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    _local.pop('entry', None)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which the directory does not show
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_doctor_directory()
+
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def user_or_group_changed(sender, **kwargs):
+    invalidate_doctor_directory()
+
+@receiver(m2m_changed, sender=User.groups.through)
+def group_membership_changed(sender, action, **kwargs):
+    # Covers user.groups.add() in UserSerializer.create as well as group.user_set changes
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_doctor_directory()
@@ -0,0 +1,139 @@
+"""
+Login throttling and password-hash offloading for the async LoginView.
+
+Password hashing (PBKDF2, about a million iterations) is the most expensive
+thing the API does. LoginView runs it on a small bounded thread pool instead of
+on the request worker; hashlib releases the GIL while hashing, so the pool uses
+real cores and everything else keeps being served. Attempts over the per-IP or
+per-username token bucket are rejected before any hashing, and when the pool's
+queue is full new logins are shed with a 503 instead of piling up.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, verify_password
+from django.contrib.auth.models import User
+from .backends import CachedModelBackend
+
+
+class TokenBucketLimiter:
+    """
+    In-memory token buckets: each key may spend `burst` attempts at once and
+    regains `rate` attempts per second. Per process, like the other caches.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Take a token for `key`. Returns (allowed, seconds until the next token)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return False, (1 - tokens) / self.rate
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return True, 0.0
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def _prune(self, now):
+        # Buckets that have refilled completely behave exactly like missing ones
+        full_after = self.burst / self.rate
+        self._buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+            if now - updated < full_after
+        }
+
+
+class PoolOverloaded(Exception):
+    """More logins are waiting for the hashing pool than LOGIN_HASH_QUEUE allows."""
+
+
+class HashingPool:
+    """A fixed-size thread pool with a cap on running plus queued jobs."""
+
+    def __init__(self, workers, queue_size):
+        self.limit = workers + queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='login-hash')
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.limit:
+                raise PoolOverloaded
+            self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def hashing_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(settings.LOGIN_HASH_WORKERS, settings.LOGIN_HASH_QUEUE)
+    return _pool
+
+ip_limiter = TokenBucketLimiter(*settings.LOGIN_RATE_PER_IP)
+username_limiter = TokenBucketLimiter(*settings.LOGIN_RATE_PER_USERNAME)
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+def check_rate(request, username):
+    """Spend one attempt from the IP's and the username's bucket. Returns seconds to wait, or 0."""
+    allowed, wait_ip = ip_limiter.allow(client_ip(request))
+    if not allowed:
+        return wait_ip
+    allowed, wait_user = username_limiter.allow(username.lower())
+    return 0 if allowed else wait_user
+
+
+def _find_user(username):
+    try:
+        return User._default_manager.get_by_natural_key(username)
+    except User.DoesNotExist:
+        return None
+
+def _upgrade_password(user, password):
+    user.set_password(password)
+    user.save(update_fields=['password'])
+
+async def authenticate_offloaded(username, password):
+    """
+    What ModelBackend.authenticate does, with the hashing moved to the pool:
+    the user lookup and any hash upgrade run on Django's sync thread, only
+    verify_password runs on the pool. Raises PoolOverloaded when shedding load.
+    """
+    user = await sync_to_async(_find_user)(username)
+    # For an unknown user verify_password hashes a dummy value, so timing does not reveal usernames
+    # (it needs a string: identify_hasher() fails on None)
+    encoded = user.password if user is not None else UNUSABLE_PASSWORD_PREFIX
+    is_correct, must_update = await hashing_pool().run(verify_password, password, encoded)
+    if user is None or not is_correct or not CachedModelBackend().user_can_authenticate(user):
+        return None
+    if must_update:
+        await sync_to_async(_upgrade_password)(user, password)
+    return user
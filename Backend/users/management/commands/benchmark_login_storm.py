@@ -0,0 +1,109 @@
+import asyncio
+import statistics
+import time
+from contextlib import nullcontext
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User, Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import setup_test_environment, teardown_test_environment
+from patients.cache import response_cache
+from patients.models import Patient
+from patients.utils import encrypt_data
+from users import login as login_module
+from users.login import TokenBucketLimiter
+
+
+class InlineHashing:
+    """What the old synchronous LoginView amounted to under ASGI: hashing on Django's shared sync thread."""
+
+    async def run(self, func, *args):
+        return await sync_to_async(func)(*args)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure patient list latency through the ASGI app while a storm of logins runs, '
+        'with hashing on the bounded pool vs on the shared sync thread. Uses a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=40, help='Concurrent login attempts in the storm')
+        parser.add_argument('--samples', type=int, default=30, help='Patient list requests per phase')
+        parser.add_argument('--patients', type=int, default=200, help='Patients to seed')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.seed(options['patients'])
+            # Open the token buckets so the whole storm reaches the hashing stage
+            # (a real storm from one client would mostly be rejected with 429 before it)
+            unlimited = TokenBucketLimiter(1e6, 1e6)
+            with mock.patch.object(login_module, 'ip_limiter', unlimited), \
+                    mock.patch.object(login_module, 'username_limiter', unlimited):
+                asyncio.run(self.run(options['logins'], options['samples']))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def seed(self, patients):
+        admin = User.objects.create_user('bench-admin', password='bench-pass-123', is_staff=True)
+        admin.groups.add(Group.objects.get(name='Admin'))
+        User.objects.create_user('bench-user', password='bench-pass-123')
+        Patient.objects.bulk_create(
+            Patient(name=encrypt_data(f'Patient {i}'), diagnosis=encrypt_data(f'Diagnosis {i}'),
+                    age=30 + i % 50, contact=f'555{i:07d}')
+            for i in range(patients)
+        )
+
+    async def run(self, logins, samples):
+        reader = AsyncClient()
+        await reader.aforce_login(await User.objects.aget(username='bench-admin'))
+        await self.patient_list(reader)  # warm up caches and connections
+
+        idle = [await self.patient_list(reader) for _ in range(samples)]
+        self.report('idle', idle)
+
+        phases = (
+            ('storm, hashing on bounded pool', nullcontext()),
+            ('storm, hashing on sync thread', mock.patch.object(login_module, 'hashing_pool', InlineHashing)),
+        )
+        for label, hashing in phases:
+            with hashing:
+                latencies, statuses, elapsed = await self.storm(reader, logins, samples)
+            self.report(label, latencies)
+            counts = {status: statuses.count(status) for status in sorted(set(statuses))}
+            self.stdout.write(f'    {logins} logins in {elapsed:.1f}s, status codes {counts}')
+
+    async def storm(self, reader, logins, samples):
+        async def attempt():
+            response = await AsyncClient().post(
+                '/api/auth/login/', {'username': 'bench-user', 'password': 'bench-pass-123'},
+                content_type='application/json',
+            )
+            return response.status_code
+
+        start = time.perf_counter()
+        storm = asyncio.gather(*(attempt() for _ in range(logins)))
+        await asyncio.sleep(0.05)  # let the logins queue up first
+        latencies = [await self.patient_list(reader) for _ in range(samples)]
+        statuses = await storm
+        return latencies, statuses, time.perf_counter() - start
+
+    async def patient_list(self, client):
+        response_cache.clear()  # measure the real list, not a cached response
+        start = time.perf_counter()
+        response = await client.get('/api/patients/', {'page_size': 50})
+        if response.status_code != 200:
+            raise CommandError(f'Patient list returned {response.status_code}')
+        return time.perf_counter() - start
+
+    def report(self, label, latencies):
+        ms = sorted(value * 1000 for value in latencies)
+        p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+        self.stdout.write(
+            f'  {label:<34} patient list p50 {statistics.median(ms):7.1f} ms  p95 {p95:7.1f} ms  max {ms[-1]:7.1f} ms'
+        )
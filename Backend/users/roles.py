@@ -0,0 +1,45 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+ADMIN = 'Admin'
+DOCTOR = 'Doctor'
+RECEPTIONIST = 'Receptionist'
+
+
+def get_roles(user):
+    """
+    Return the set of group names for `user`.
+    Loaded with a single query the first time and cached on the user object,
+    which lives for the whole request, so later checks are set lookups.
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_role_names', None)
+    if roles is None:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        user._role_names = roles
+    return roles
+
+
+class RoleContextMixin:
+    """
+    Viewset mixin that resolves the caller's roles once per request and
+    hands them to serializers as context['roles'].
+    """
+
+    @property
+    def roles(self):
+        return get_roles(self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['roles'] = self.roles
+        return context
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def clear_cached_roles(sender, instance, **kwargs):
+    # Group membership changed on this user object, drop its cached role set
+    if isinstance(instance, User):
+        instance.__dict__.pop('_role_names', None)
@@ -1,11 +1,16 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User, Group
+from django.db.models import Prefetch
 
 class GroupSerializer(serializers.ModelSerializer):
     class Meta:
         model = Group
         fields = ['name']
 
+# What UserSerializer reads, for list querysets: its own columns and prefetched group names
+LIST_COLUMNS = ('id', 'username', 'email', 'first_name', 'last_name')
+GROUPS_PREFETCH = Prefetch('groups', queryset=Group.objects.only('id', 'name'))
+
 class UserSerializer(serializers.ModelSerializer):
     groups = GroupSerializer(many=True, read_only=True)
     password = serializers.CharField(write_only=True)
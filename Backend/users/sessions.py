@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+
+
+class _BoundedCache:
+    """Wraps a cache so that nothing set through it outlives `max_timeout` seconds."""
+
+    def __init__(self, cache, max_timeout):
+        self._cache = cache
+        self._max_timeout = max_timeout
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def set(self, key, value, timeout):
+        self._cache.set(key, value, min(timeout, self._max_timeout))
+
+    async def aset(self, key, value, timeout):
+        await self._cache.aset(key, value, min(timeout, self._max_timeout))
+
+
+class SessionStore(cached_db.SessionStore):
+    """
+    cached_db sessions whose cache entries live at most USER_CACHE_TTL seconds
+    instead of the whole session age. A logout deletes the database row and
+    this process's copy only; with a per-process cache, other workers re-read
+    the session from the database (and find it gone) within USER_CACHE_TTL,
+    the same bound as for the cached request.user (users.backends).
+    """
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._cache = _BoundedCache(self._cache, settings.USER_CACHE_TTL)
@@ -1,3 +1,212 @@
-from django.test import TestCase
+import time
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.db import connection
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import verify_password
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from logs.models import AccessLog
+from . import login as login_module
+from .login import HashingPool, TokenBucketLimiter
+
+
+class UserListQueryCountTests(TestCase):
+    """
+    Query budgets for the user list endpoints with hundreds of users.
+    Budget = session + request user + the page query + one prefetch of groups.
+    """
+
+    def setUp(self):
+        cache.clear()
+        admin_group, doctor_group, receptionist_group = (
+            Group.objects.get(name=name) for name in ('Admin', 'Doctor', 'Receptionist')
+        )
+        self.admin = User.objects.create_user('admin', password='pass12345', is_staff=True)
+        self.admin.groups.add(admin_group)
+        for i in range(300):
+            user = User.objects.create_user(f'staff{i}', password=None)
+            user.groups.add(doctor_group if i % 2 else receptionist_group)
+        self.client = APIClient()
+
+    def assert_query_budget(self, user, url, budget):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(ctx.captured_queries), budget, [q['sql'] for q in ctx.captured_queries])
+        return response
+
+    def test_user_list(self):
+        response = self.assert_query_budget(self.admin, '/api/users/', 4)
+        self.assertEqual(len(response.json()), 301)
+
+    def test_doctor_directory(self):
+        receptionist = User.objects.get(username='staff0')
+        response = self.assert_query_budget(receptionist, '/api/users/doctors/', 4)
+        self.assertEqual(len(response.json()), 150)
+        self.assertEqual(response.json()[0]['groups'], [{'name': 'Doctor'}])
+
+
+class DoctorDirectoryCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='pass12345', is_staff=True)
+        self.doctor_group = Group.objects.get(name='Doctor')
+        User.objects.create_user('house').groups.add(self.doctor_group)
+        self.client = APIClient()
+        self.client.force_login(self.admin)
+
+    def usernames(self, response):
+        return [doctor['username'] for doctor in response.json()]
+
+    def test_cached_list_is_revalidated_with_etag(self):
+        first = self.client.get('/api/users/doctors/')
+        self.assertEqual(self.usernames(first), ['house'])
+
+        with self.assertNumQueries(0):  # session and request user come from the cache too
+            second = self.client.get('/api/users/doctors/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_new_doctor_invalidates_directory(self):
+        first = self.client.get('/api/users/doctors/')
+        response = self.client.post('/api/users/', {'username': 'wilson', 'password': 'pass12345', 'role': 'Doctor'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        second = self.client.get('/api/users/doctors/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(sorted(self.usernames(second)), ['house', 'wilson'])
+
+    def test_leaving_doctor_group_invalidates_directory(self):
+        self.client.get('/api/users/doctors/')
+        User.objects.get(username='house').groups.clear()
+        self.assertEqual(self.usernames(self.client.get('/api/users/doctors/')), [])
+
+
+class CachedAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user('drwho', password='pass12345')
+        self.doctor.groups.add(Group.objects.get(name='Doctor'))
+        self.client = APIClient()
+        self.client.login(username='drwho', password='pass12345')
+        # First request fills the session and user caches
+        self.client.get('/api/auth/me/')
+
+    def test_authenticated_request_needs_no_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/auth/me/')
+        self.assertEqual(response.json()['groups'], [{'name': 'Doctor'}])
+        self.assertEqual(len(ctx.captured_queries), 0, [q['sql'] for q in ctx.captured_queries])
+
+    def test_group_change_is_seen_on_the_next_request(self):
+        self.doctor.groups.add(Group.objects.get(name='Admin'))
+        groups = {g['name'] for g in self.client.get('/api/auth/me/').json()['groups']}
+        self.assertEqual(groups, {'Doctor', 'Admin'})
+
+        Group.objects.get(name='Doctor').user_set.remove(self.doctor)
+        groups = {g['name'] for g in self.client.get('/api/auth/me/').json()['groups']}
+        self.assertEqual(groups, {'Admin'})
+
+    def test_password_change_ends_cached_sessions(self):
+        user = User.objects.get(pk=self.doctor.pk)
+        user.set_password('new-pass-678')
+        user.save()
+        self.assertEqual(self.client.get('/api/auth/me/').status_code, 403)
+
+    def test_logout_drops_the_cached_user(self):
+        self.client.post('/api/auth/logout/')
+        self.assertEqual(self.client.get('/api/auth/me/').status_code, 403)
+        self.assertIsNone(cache.get(f'auth:user:{self.doctor.pk}:{cache.get("auth:groups:version")}'))
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-a'},
+    'worker-b': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-b'},
+})
+class SessionAcrossWorkersTests(TestCase):
+    """Two LocMemCaches stand in for the per-process caches of two workers."""
+
+    def setUp(self):
+        User.objects.create_user('drwho', password='pass12345')
+        self.client = APIClient()
+        self.client.login(username='drwho', password='pass12345')
+
+    def me(self, cache_alias, after=0):
+        # `after` seconds from now, as far as the caches can tell
+        now = time.time() + after
+        with override_settings(SESSION_CACHE_ALIAS=cache_alias), \
+                mock.patch('django.core.cache.backends.locmem.time', mock.Mock(time=lambda: now)):
+            return self.client.get('/api/auth/me/').status_code
+
+    def test_logout_in_one_worker_ends_the_session_in_the_others(self):
+        self.assertEqual(self.me('worker-b'), 200)  # worker b now caches the session
+        # The browser logs out through worker a (a second client, so this one keeps the cookie)
+        worker_a = APIClient()
+        worker_a.cookies[settings.SESSION_COOKIE_NAME] = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.assertEqual(worker_a.post('/api/auth/logout/').status_code, 200)
+
+        # Worker b may serve its cached copy for at most USER_CACHE_TTL, not for the session's age
+        self.assertEqual(self.me('worker-b', after=settings.USER_CACHE_TTL - 1), 200)
+        self.assertEqual(self.me('worker-b', after=settings.USER_CACHE_TTL + 1), 403)
+
+
+class LoginThrottleTests(TestCase):
+
+    def setUp(self):
+        login_module.ip_limiter.reset()
+        login_module.username_limiter.reset()
+        User.objects.create_user('drwho', password='pass12345')
+        self.client = APIClient()
+
+    def login(self, password='pass12345', **extra):
+        return self.client.post('/api/auth/login/', {'username': 'drwho', 'password': password}, format='json', **extra)
+
+    def test_login_sets_session_and_failures_are_logged(self):
+        self.assertEqual(self.login('wrong').status_code, 400)
+        self.assertTrue(AccessLog.objects.filter(action='USER_LOGIN_FAILED', details='Failed login for drwho').exists())
+        self.client.post('/api/auth/login/', {'username': 'x' * 100000, 'password': 'wrong'}, format='json')
+        self.assertEqual(AccessLog.objects.latest('id').details, 'Failed login for ' + 'x' * 150)
+
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['username'], 'drwho')
+        self.assertEqual(self.client.get('/api/auth/me/').status_code, 200)
+
+    def test_malformed_bodies_are_rejected(self):
+        for body in ([1], 'drwho', {'username': 5, 'password': 'pass12345'}, {'username': 'drwho', 'password': ['x']}):
+            response = self.client.post('/api/auth/login/', body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+        response = self.client.post('/api/auth/login/', b'{', content_type='application/json')
+        self.assertEqual(response.json(), {'error': 'Invalid JSON'})
+
+    def test_attempts_over_the_limit_are_rejected_before_hashing(self):
+        with mock.patch.object(login_module.username_limiter, 'burst', 2), \
+                mock.patch('users.login.verify_password', wraps=verify_password) as hashed:
+            statuses = [self.login('wrong', REMOTE_ADDR=f'10.0.0.{n}').status_code for n in range(4)]
+        self.assertEqual(statuses, [400, 400, 429, 429])
+        self.assertEqual(hashed.call_count, 2)
+
+    def test_full_hashing_pool_sheds_load(self):
+        pool = HashingPool(workers=1, queue_size=0)
+        pool._pending = 1  # one login already hashing
+        with mock.patch.object(login_module, '_pool', pool):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_token_bucket_refills(self):
+        limiter = TokenBucketLimiter(rate=10, burst=1)
+        with mock.patch('users.login.time.monotonic', return_value=100.0):
+            self.assertEqual(limiter.allow('ip')[0], True)
+            allowed, wait = limiter.allow('ip')
+            self.assertEqual((allowed, round(wait, 2)), (False, 0.1))
+        with mock.patch('users.login.time.monotonic', return_value=100.2):
+            self.assertEqual(limiter.allow('ip')[0], True)
@@ -1,64 +1,112 @@
 from rest_framework import viewsets, permissions, status, views
 from rest_framework.response import Response
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import logout
 from django.contrib.auth.models import User
-from .serializers import UserSerializer
+from django.utils.http import parse_etags
+from .serializers import UserSerializer, GROUPS_PREFETCH, LIST_COLUMNS
+from .directory import get_doctor_directory
 
 from rest_framework.decorators import action
 
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.prefetch_related(GROUPS_PREFETCH)
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAdminUser] # Default for CRUD
 
+    def get_queryset(self):
+        users = super().get_queryset()
+        if self.action == 'list':
+            # Only the columns UserSerializer renders (skips password hashes etc.)
+            users = users.only(*LIST_COLUMNS)
+        return users
+
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def doctors(self, request):
         """
         List all users who are in the 'Doctor' group.
         Accessible to any authenticated user (e.g. Receptionist).
+        Served from a cache (see directory.py) with an ETag, so clients can
+        revalidate and get a 304 when the list has not changed.
         """
-        doctors = User.objects.filter(groups__name='Doctor')
-        serializer = self.get_serializer(doctors, many=True)
-        return Response(serializer.data)
+        data, etag = get_doctor_directory()
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'  # browsers revalidate with If-None-Match
+        return response
 
+import json
+import math
+from asgiref.sync import sync_to_async
+from django.contrib.auth import alogin
+from django.http import JsonResponse
 from django.utils.decorators import method_decorator
+from django.views import View
 from django.views.decorators.csrf import csrf_exempt
+from .login import PoolOverloaded, authenticate_offloaded, check_rate
 
 @method_decorator(csrf_exempt, name='dispatch')
-class LoginView(views.APIView):
-    permission_classes = [permissions.AllowAny]
-    authentication_classes = []
+class LoginView(View):
+    """
+    Async login: rate limits are checked before any hashing and the password is
+    verified on a bounded pool (see users.login), so a login storm cannot tie
+    up the workers that serve everything else. Runs natively under ASGI
+    (backend/asgi.py); under WSGI Django runs it in a short-lived event loop.
+    """
 
-    def post(self, request):
-        username = request.data.get('username')
-        password = request.data.get('password')
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b'{}') if request.content_type == 'application/json' else request.POST
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(data, dict):  # QueryDict is a dict too
+            return JsonResponse({'error': 'Expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+        username = data.get('username') or ''
+        password = data.get('password') or ''
+        if not isinstance(username, str) or not isinstance(password, str):
+            return JsonResponse({'error': 'Username and password must be strings'}, status=status.HTTP_400_BAD_REQUEST)
+        if not username or not password:
+            return JsonResponse({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
 
-        user = authenticate(request, username=username, password=password)
+        wait = check_rate(request, username)
+        if wait:
+            response = JsonResponse({'error': 'Too many login attempts, try again later'},
+                                    status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(math.ceil(wait))
+            return response
 
-        if user:
-            login(request, user)
-            
-            # Log successful login
-            from logs.models import AccessLog
-            AccessLog.objects.create(
-                user=user,
-                action="USER_LOGIN",
-                details=f"User {username} logged in successfully"
+        try:
+            user = await authenticate_offloaded(username, password)
+        except PoolOverloaded:
+            response = JsonResponse({'error': 'Server busy, try again shortly'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '1'
+            return response
+
+        from logs.audit import log_access
+        if user is None:
+            # Cheap now that audit writes are buffered and attempts are rate limited
+            # The username is whatever the client sent; no real one is longer than the column
+            shown = username[:User._meta.get_field('username').max_length]
+            await sync_to_async(log_access)(
+                user=None, action="USER_LOGIN_FAILED", details=f"Failed login for {shown}"
             )
-            
-            serializer = UserSerializer(user)
-            return Response(serializer.data)
-        
-        # Note: We don't log failed login attempts to avoid filling logs with brute force attempts
-        # But you could add that if needed
-        return Response({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
+
+        await alogin(request, user, backend='users.backends.CachedModelBackend')
+        await sync_to_async(log_access)(
+            user=user, action="USER_LOGIN", details=f"User {username} logged in successfully"
+        )
+        data = await sync_to_async(lambda: UserSerializer(user).data)()
+        return JsonResponse(data)
 
 class LogoutView(views.APIView):
     def post(self, request):
         # Log logout before actually logging out
         if request.user.is_authenticated:
-            from logs.models import AccessLog
-            AccessLog.objects.create(
+            from logs.audit import log_access
+            log_access(
                 user=request.user,
                 action="USER_LOGOUT",
                 details=f"User {request.user.username} logged out"
@@ -56,4 +56,14 @@ api.interceptors.response.use(
 // For Session Auth to work with CORS
 api.defaults.withCredentials = true;
 
+// Server-sent events from /api/events/: handlers maps event type ('patients', 'audit')
+// to a callback taking the parsed data. Returns a function that closes the stream.
+export function subscribeEvents(handlers) {
+  const source = new EventSource(`${api.defaults.baseURL}/events/`, { withCredentials: true });
+  Object.entries(handlers).forEach(([type, handler]) => {
+    source.addEventListener(type, (event) => handler(JSON.parse(event.data)));
+  });
+  return () => source.close();
+}
+
 export default api;
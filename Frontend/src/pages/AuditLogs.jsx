@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import api from '../api';
+import api, { subscribeEvents } from '../api';
 import { Link } from 'react-router-dom';
 import { 
   ArrowLeft, 
@@ -15,16 +15,26 @@ import {
 
 const AuditLogs = () => {
   const [logs, setLogs] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
     fetchLogs();
+    // New entries are pushed by the server as they are written (oldest first)
+    return subscribeEvents({
+      audit: ({ entries }) => setLogs(prev => {
+        const known = new Set(prev.map(log => log.id));
+        return [...entries.filter(log => !known.has(log.id)).reverse(), ...prev];
+      }),
+    });
   }, []);
 
-  const fetchLogs = async () => {
+  // Logs are cursor-paginated (newest first): each response has `results` and a `next` URL
+  const fetchLogs = async (url = '/logs/') => {
     try {
-      const response = await api.get('/logs/');
-      setLogs(response.data);
+      const response = await api.get(url);
+      setLogs(prev => (url === '/logs/' ? response.data.results : [...prev, ...response.data.results]));
+      setNextPage(response.data.next);
     } catch (error) {
       console.error('Error fetching logs:', error);
     } finally {
@@ -91,8 +101,8 @@ const AuditLogs = () => {
           <div className="card-compact">
             <div className="flex items-center justify-between">
               <div>
-                <p className="text-sm text-slate-600 mb-1">Total Events</p>
-                <p className="text-2xl font-bold text-slate-900">{logs.length}</p>
+                <p className="text-sm text-slate-600 mb-1">Loaded Events</p>
+                <p className="text-2xl font-bold text-slate-900">{logs.length}{nextPage ? '+' : ''}</p>
               </div>
               <div className="w-12 h-12 bg-primary-100 rounded-xl flex items-center justify-center">
                 <Activity className="w-6 h-6 text-primary-600" />
@@ -180,6 +190,13 @@ const AuditLogs = () => {
               </tbody>
             </table>
           </div>
+          {nextPage && (
+            <div className="px-6 py-4 border-t border-slate-200 text-center">
+              <button onClick={() => fetchLogs(nextPage)} className="btn btn-outline">
+                Load more
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </div>
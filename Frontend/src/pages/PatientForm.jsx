@@ -28,6 +28,8 @@ const PatientForm = () => {
     contact: '',
     assigned_doctor: ''
   });
+  // Values as loaded, so an edit only sends the fields that changed
+  const [original, setOriginal] = useState(null);
   const [doctors, setDoctors] = useState([]);
   const [error, setError] = useState('');
   const [loading, setLoading] = useState(false);
@@ -52,13 +54,15 @@ const PatientForm = () => {
     try {
       const response = await api.get(`/patients/${id}/`);
       const data = response.data;
-      setFormData({
+      const loaded = {
         name: data.name,
         diagnosis: data.diagnosis === 'RESTRICTED' ? '' : data.diagnosis, 
         age: data.age,
         contact: data.contact,
         assigned_doctor: data.assigned_doctor || ''
-      });
+      };
+      setFormData(loaded);
+      setOriginal(loaded);
     } catch (error) {
       setError('Failed to fetch patient details.');
     }
@@ -71,7 +75,12 @@ const PatientForm = () => {
     
     try {
       if (isEditMode) {
-        await api.put(`/patients/${id}/`, formData);
+        const changes = Object.fromEntries(
+          Object.entries(formData).filter(([key, value]) => String(value) !== String(original?.[key] ?? ''))
+        );
+        if (Object.keys(changes).length > 0) {
+          await api.patch(`/patients/${id}/`, changes);
+        }
       } else {
         await api.post('/patients/', formData);
       }
@@ -1,5 +1,5 @@
-import React, { useState, useEffect } from 'react';
-import api from '../api';
+import React, { useState, useEffect, useRef } from 'react';
+import api, { subscribeEvents } from '../api';
 import { Link } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
 import { 
@@ -15,20 +15,43 @@ import {
 
 const PatientList = () => {
   const [patients, setPatients] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(true);
   const { user } = useAuth();
 
   const isAdmin = user?.groups?.some(g => g.name === 'Admin');
   const isReceptionist = user?.groups?.some(g => g.name === 'Receptionist');
 
+  // Delta sync token: where the list is up to (see /api/patients/changes/)
+  const syncToken = useRef(null);
+
   useEffect(() => {
-    fetchPatients();
+    loadList();
+    // The server pushes an event whenever patients in this user's list change
+    return subscribeEvents({ patients: applyChanges });
   }, []);
 
-  const fetchPatients = async () => {
+  // Take the token before loading, so nothing changed in between is missed
+  const loadList = async () => {
+    try {
+      const response = await api.get('/patients/changes/');
+      syncToken.current = response.data.token;
+    } catch (error) {
+      console.error('Error starting patient sync:', error);
+    }
+    fetchPatients();
+  };
+
+  // The list is cursor-paginated: each response has `results` and a `next` URL
+  const fetchPatients = async (url = '/patients/') => {
     try {
-      const response = await api.get('/patients/');
-      setPatients(response.data);
+      const response = await api.get(url);
+      setPatients(prev => {
+        if (url === '/patients/') return response.data.results;
+        const known = new Set(prev.map(p => p.id));
+        return [...prev, ...response.data.results.filter(p => !known.has(p.id))];
+      });
+      setNextPage(response.data.next);
     } catch (error) {
       console.error('Error fetching patients:', error);
     } finally {
@@ -36,6 +59,31 @@ const PatientList = () => {
     }
   };
 
+  // Fetch only what changed since the token and merge it into the list
+  const applyChanges = async () => {
+    if (!syncToken.current) return;
+    try {
+      const response = await api.get('/patients/changes/', { params: { since: syncToken.current } });
+      const { token, changed, removed } = response.data;
+      syncToken.current = token;
+      const updates = new Map(changed.map(p => [p.id, p]));
+      const gone = new Set(removed);
+      setPatients(prev => {
+        const known = new Set(prev.map(p => p.id));
+        const kept = prev.filter(p => !gone.has(p.id)).map(p => updates.get(p.id) || p);
+        return [...kept, ...changed.filter(p => !known.has(p.id))];
+      });
+    } catch (error) {
+      if (error.response?.status === 410) {
+        // Token can't be resumed: start over from the token the server sent
+        syncToken.current = error.response.data.token;
+        fetchPatients();
+      } else {
+        console.error('Error syncing patients:', error);
+      }
+    }
+  };
+
   if (loading) {
     return (
       <div className="min-h-screen bg-slate-100 flex items-center justify-center">
@@ -185,6 +233,13 @@ const PatientList = () => {
                 </tbody>
               </table>
             </div>
+            {nextPage && (
+              <div className="px-6 py-4 border-t border-slate-200 text-center">
+                <button onClick={() => fetchPatients(nextPage)} className="btn btn-outline">
+                  Load more
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>